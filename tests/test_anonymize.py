@@ -0,0 +1,50 @@
+import hashlib
+from glob import glob
+from os.path import basename, dirname, join
+
+import pyarrow as pa
+
+from vtlc.util.anonymize import ANONYMIZATION_DIR, Anonymizer, saltedHash
+
+
+def parts(directory):
+    return glob(join(directory, ANONYMIZATION_DIR, '*', 'part-*.parquet'))
+
+
+def test_cache_appends_parts_and_compacts(tmp_path):
+    directory = str(tmp_path)
+
+    first = Anonymizer('salt', directory, workers=1)
+    first.column(pa.array(['A', 'B', None]))
+    first.save()
+    second = Anonymizer('salt', directory, workers=1)
+    second.column(pa.array(['B', 'C']))
+    second.save()
+
+    # the second run only appended the id it had not seen
+    assert len(parts(directory)) == 2
+    assert second.unsaved == {}
+
+    Anonymizer('salt', directory).compact()
+    assert len(parts(directory)) == 1
+
+    cached = Anonymizer('salt', directory)
+    assert cached.hashValues(['A', 'B', 'C']) == [
+        saltedHash(s, 'salt') for s in ['A', 'B', 'C']
+    ]
+    assert cached.unsaved == {}
+
+
+def test_salt_picks_its_own_cache(tmp_path):
+    directory = str(tmp_path)
+
+    for salt in ['old', 'new']:
+        anonymizer = Anonymizer(salt, directory, workers=1)
+        assert anonymizer.hashValues(['A']) == [saltedHash('A', salt)]
+        anonymizer.save()
+
+    caches = {dirname(path) for path in parts(directory)}
+    assert len(caches) == 2
+    for cache in caches:
+        assert hashlib.sha1(b'old').hexdigest()[:16] not in basename(cache)
+        assert hashlib.sha1(b'new').hexdigest()[:16] not in basename(cache)
@@ -0,0 +1,40 @@
+import fcntl
+import threading
+from glob import glob
+from os.path import join
+
+import pyarrow as pa
+
+from vtlc.util.authors import AUTHOR_DIR, AuthorDictionary
+
+
+def test_keys_survive_compaction(tmp_path):
+    directory = str(tmp_path)
+
+    first = AuthorDictionary(directory)
+    first.lookup(pa.array(['A', 'B']))
+    second = AuthorDictionary(directory)
+    second.lookup(pa.array(['C', 'A']))
+    assert len(glob(join(directory, AUTHOR_DIR, 'part-*.parquet'))) == 2
+
+    second.compact()
+    assert len(glob(join(directory, AUTHOR_DIR, 'part-*.parquet'))) == 1
+    assert AuthorDictionary(directory).keys == {'A': 0, 'B': 1, 'C': 2}
+
+
+def test_loading_waits_for_compaction(tmp_path):
+    directory = str(tmp_path)
+    AuthorDictionary(directory).lookup(pa.array(['A']))
+    AuthorDictionary(directory).lookup(pa.array(['B']))
+
+    compacting = AuthorDictionary(directory)
+    loaded = []
+    with compacting._lock(fcntl.LOCK_EX):
+        loader = threading.Thread(
+            target=lambda: loaded.append(AuthorDictionary(directory)))
+        loader.start()
+        loader.join(0.2)
+        assert loader.is_alive()
+    loader.join()
+
+    assert loaded[0].keys == {'A': 0, 'B': 1}
@@ -0,0 +1,105 @@
+import os
+
+for name in [
+        'RAW_DATA_DIR', 'VTLC_DIR', 'VTLC_ELEMENTS_DIR', 'VTLC_COMPLETE_DIR'
+]:
+    os.environ.setdefault(name, '')
+os.environ.setdefault('CURRENCY_API_KEY', '')
+
+from datetime import datetime, timedelta, timezone
+from glob import glob
+from os.path import exists, join
+
+import pyarrow.parquet as pq
+
+from vtlc import aggregate
+from vtlc.util.checkpoint import writeJSON
+from vtlc.util.segments import SEGMENT_DIR
+from vtlc.util.source import DumpSource
+from vtlc.util.synthetic import generateDocs, writeDump
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+CUTOFF = datetime(2022, 2, 10, tzinfo=timezone.utc)
+
+# long enough that the 2022 test months still count as open
+OPEN = timedelta(days=100 * 365)
+
+
+def chatChunk():
+    return next(generateDocs(2000, start=START, seed=1, channels=5,
+                             authors=50))
+
+
+def writeChats(directory, chunk, before=None):
+    docs = [
+        doc for doc in chunk['chats']
+        if before is None or doc['timestamp'] < before
+    ]
+    writeDump(directory, [dict(chunk, chats=docs)])
+    return docs
+
+
+def followChats(dump, grace):
+    chats = DumpSource(dump).collection('chats')
+    aggregate.follow({'chats': chats},
+                     interval=0,
+                     segmentSeconds=0,
+                     grace=grace,
+                     iterations=1)
+
+
+def segmentIds(raw, period):
+    files = sorted(glob(join(raw, SEGMENT_DIR, f'chats_{period}', '*')))
+    return files, [
+        i for f in files for i in pq.read_table(f, columns=['id'])['id']
+        .to_pylist()
+    ]
+
+
+def idsOf(docs, period):
+    # the converter drops chats without a message
+    return sorted(doc['id'] for doc in docs
+                  if doc['timestamp'].strftime('%Y-%m') == period
+                  and doc.get('message') is not None)
+
+
+def test_follow_rolls_resumes_and_compacts(tmp_path, monkeypatch):
+    raw = str(tmp_path / 'raw')
+    dump = str(tmp_path / 'dump')
+    monkeypatch.setattr(aggregate, 'RAW_DATA_DIR', raw)
+
+    # follow from the start of the synthetic data, not the current month
+    writeJSON(join(raw, SEGMENT_DIR, 'chats.json'), {
+        'since': START,
+        'position': None,
+        'periods': {},
+    })
+
+    chunk = chatChunk()
+    early = writeChats(dump, chunk, before=CUTOFF)
+    followChats(dump, OPEN)
+
+    files, ids = segmentIds(raw, '2022-01')
+    assert len(files) == 1
+    assert sorted(ids) == idsOf(early, '2022-01')
+    files, ids = segmentIds(raw, '2022-02')
+    assert len(files) == 1
+    assert sorted(ids) == idsOf(early, '2022-02')
+
+    # a restart only picks up what arrived since the last saved position
+    docs = writeChats(dump, chunk)
+    followChats(dump, OPEN)
+
+    files, ids = segmentIds(raw, '2022-01')
+    assert len(files) == 1
+    files, ids = segmentIds(raw, '2022-02')
+    assert len(files) == 2
+    assert sorted(ids) == idsOf(docs, '2022-02')
+
+    # once closed for the grace period, months fold into monthly files
+    followChats(dump, timedelta(0))
+
+    for period in ['2022-01', '2022-02']:
+        table = pq.read_table(join(raw, f'chats_{period}.parquet'))
+        assert sorted(table['id'].to_pylist()) == idsOf(docs, period)
+        assert not exists(join(raw, SEGMENT_DIR, f'chats_{period}'))
@@ -0,0 +1,149 @@
+import os
+
+for name in [
+        'RAW_DATA_DIR', 'VTLC_DIR', 'VTLC_ELEMENTS_DIR', 'VTLC_COMPLETE_DIR'
+]:
+    os.environ.setdefault(name, '')
+os.environ.setdefault('CURRENCY_API_KEY', '')
+
+import gzip
+import shutil
+from datetime import datetime, timezone
+from os.path import exists, join
+
+import bson
+import pyarrow.parquet as pq
+import pytest
+
+from vtlc import aggregate
+from vtlc.util import source
+from vtlc.util.checkpoint import resumeQuery
+from vtlc.util.source import CODEC_OPTIONS, DumpCollection, DumpSource
+from vtlc.util.synthetic import COLLECTIONS, generateDocs, writeDump
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+MONTHS = [
+    ('2022-01', START, datetime(2022, 2, 1, tzinfo=timezone.utc)),
+    ('2022-02', datetime(2022, 2, 1, tzinfo=timezone.utc),
+     datetime(2022, 3, 1, tzinfo=timezone.utc)),
+]
+
+# small blocks so the index has several to prune
+INDEX_BLOCK = 64
+
+
+@pytest.fixture(scope='module')
+def chunk():
+    return next(
+        generateDocs(2000,
+                     superchats=200,
+                     bans=200,
+                     deletions=200,
+                     start=START,
+                     seed=2,
+                     channels=5,
+                     authors=50))
+
+
+def stored(chunk):
+    """documents as the server hands them back, i.e. with ms precision"""
+    return {
+        kind: [bson.decode(bson.encode(doc), CODEC_OPTIONS) for doc in docs]
+        for kind, docs in chunk.items()
+    }
+
+
+def makeDump(directory, chunk, gzipped):
+    writeDump(directory, [chunk])
+    if gzipped:
+        for kind in COLLECTIONS:
+            path = join(directory, f'{kind}.bson')
+            with open(path, 'rb') as src, gzip.open(path + '.gz',
+                                                    'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+    return directory
+
+
+def converted(kind, docs):
+    return aggregate.EXPORT_KINDS[kind][3](docs).to_pylist()
+
+
+@pytest.mark.parametrize('gzipped', [False, True])
+def test_dump_export_matches_converters(tmp_path, monkeypatch, chunk,
+                                        gzipped):
+    raw = str(tmp_path / 'raw')
+    os.makedirs(raw)
+    monkeypatch.setattr(aggregate, 'RAW_DATA_DIR', raw)
+    monkeypatch.setattr(source, 'INDEX_BLOCK', INDEX_BLOCK)
+    # only the synthetic months, not every month since the genesis
+    monkeypatch.setattr(aggregate, 'monthRanges',
+                        lambda *args: [(start, end)
+                                       for _, start, end in MONTHS])
+    dump = makeDump(str(tmp_path / 'dump'), chunk, gzipped)
+
+    with DumpSource(dump) as src:
+        for kind in ['chats', 'superchats']:
+            aggregate.accumulate(src.collection(kind), kind)
+        for kind in ['banactions', 'deleteactions']:
+            aggregate.accumulateEvents(src.collection(kind), kind)
+    assert exists(join(dump, 'chats.bson.vtlcidx')) != gzipped
+
+    docs = stored(chunk)
+    for kind in ['chats', 'superchats']:
+        for period, start, end in MONTHS:
+            table = pq.read_table(join(raw, f'{kind}_{period}.parquet'))
+            assert table.to_pylist() == converted(
+                kind,
+                [doc for doc in docs[kind] if start <= doc['timestamp'] < end])
+    for kind in ['banactions', 'deleteactions']:
+        prefix = aggregate.EXPORT_KINDS[kind][0]
+        table = pq.read_table(join(raw, f'{prefix}.parquet'))
+        assert table.to_pylist() == converted(kind, docs[kind])
+
+
+def test_index_and_gzip_scan_count_alike(tmp_path, monkeypatch, chunk):
+    monkeypatch.setattr(source, 'INDEX_BLOCK', INDEX_BLOCK)
+    plainDir = makeDump(str(tmp_path / 'plain'), chunk, False)
+    gzipDir = makeDump(str(tmp_path / 'gzip'), chunk, True)
+
+    docs = stored(chunk)['banactions']
+    dated = sorted((doc['timestamp'], doc['_id']) for doc in docs
+                   if doc.get('timestamp') is not None)
+    after = dated[len(dated) // 2]
+    end = MONTHS[-1][2]
+    queries = [
+        ({
+            'timestamp': {
+                '$gte': start,
+                '$lt': end
+            }
+        }, sum(start <= ts < end for ts, _ in dated))
+        for _, start, end in MONTHS
+    ] + [
+        ({
+            'timestamp': None
+        }, len(docs) - len(dated)),
+        (resumeQuery(None, end, {
+            'lastTimestamp': after[0],
+            'lastId': after[1],
+        }), sum(pair > after for pair in dated)),
+    ]
+
+    with DumpCollection(join(plainDir, 'banactions.bson')) as plain:
+        blocks = plain.index()
+        assert len(blocks) > 1
+        assert sum(block[2] for block in blocks) == len(docs)
+        assert exists(join(plainDir, 'banactions.bson.vtlcidx'))
+
+        with DumpCollection(join(gzipDir, 'banactions.bson.gz')) as gz:
+            for query, count in queries:
+                assert plain.count_documents(query) == count
+                assert gz.count_documents(query) == count
+            assert gz.estimated_document_count() == len(docs)
+
+            # repeated counts of a gzip dump must not rescan it
+            monkeypatch.setattr(gz, '_iterGzip', None)
+            for query, count in queries:
+                assert gz.count_documents(query) == count
+            assert gz.estimated_document_count() == len(docs)
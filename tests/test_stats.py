@@ -0,0 +1,39 @@
+import os
+
+os.environ.setdefault('CURRENCY_API_KEY', '')
+
+import pandas as pd
+import pyarrow as pa
+
+from vtlc.util.stats import ChatStats, SuperChatStats
+
+
+def chatBatch():
+    return pa.RecordBatch.from_pydict({
+        'channelId': ['UC1', 'UC1', 'UC2'],
+        'authorChannelId': ['A', 'B', 'A'],
+        'membership': ['non-member', '1 month', 'unknown'],
+    })
+
+
+def test_empty_month_keeps_numeric_dtypes():
+    stats = ChatStats()
+    stats.update(chatBatch())
+    full = stats.result()
+    empty = ChatStats().result()
+
+    assert list(empty.columns) == list(full.columns)
+    merged = pd.concat([full, empty])
+    for column in ['chats', 'uniqueChatters', 'memberChats', 'uniqueMembers']:
+        assert pd.api.types.is_numeric_dtype(merged[column]), column
+    assert merged['chats'].tolist() == [2, 1]
+
+
+def test_empty_superchat_month_is_typed():
+    empty = SuperChatStats().result()
+
+    assert empty.empty
+    for column in ['superChats', 'uniqueSuperChatters', 'totalMessageLength']:
+        assert empty[column].dtype == 'int64', column
+    for column in ['totalSC', 'averageSC', 'averageMessageLength']:
+        assert empty[column].dtype == 'float64', column
@@ -1,37 +1,40 @@
 import argparse
 import gc
-import itertools
+import math
 import os
-from datetime import datetime, timezone
-from os.path import join
-
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from os.path import basename, exists, join, splitext
+
+import bson
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 import pymongo
-from bson.codec_options import CodecOptions
 from dateutil.relativedelta import relativedelta
 from tqdm import tqdm
 
 from vtlc.constants import RAW_DATA_DIR
-from vtlc.util.message import replaceEmojiWithReplacement
+from vtlc.util.checkpoint import (loadCheckpoint, readJSON, resumeQuery,
+                                  saveCheckpoint, writeJSON)
+from vtlc.util.dataset import writePartitionedMonth
+from vtlc.util.message import cleanMessageColumn
+from vtlc.util.parquet import (DEFAULT_PROFILE, ParquetBatchWriter,
+                               writeProfile)
+from vtlc.util.pipeline import pipelined
+from vtlc.util.segments import SEGMENT_DIR, SegmentWriter
+from vtlc.util.source import openSource
 
 
-# by reclosedev
-# https://stackoverflow.com/a/8998040/2276646
-def grouper_it(n, iterable):
-    it = iter(iterable)
-    while True:
-        chunk_it = itertools.islice(it, n)
-        try:
-            first_el = next(chunk_it)
-        except StopIteration:
-            return
-        yield itertools.chain((first_el, ), chunk_it)
+MONGODB_URI = os.environ.get('MONGODB_URI')
 
+CHUNK_SIZE = 10_000
 
-MONGODB_URI = os.environ['MONGODB_URI']
-
-CHUNK_SIZE = 1_000
+# months with more documents than this are split into timestamp sub-ranges
+SHARD_SIZE = 5_000_000
 
 CHAT_SCHEMA = pa.schema([
     pa.field('timestamp', pa.timestamp('ms', tz='UTC')),
@@ -75,6 +78,21 @@ SC_COLUMNS = [
     'channelId',
 ]
 
+BAN_SCHEMA = pa.schema([
+    pa.field('timestamp', pa.timestamp('ms', tz='UTC')),
+    pa.field('authorChannelId', pa.string()),
+    pa.field('videoId', pa.string()),
+    pa.field('channelId', pa.string()),
+])
+
+DELETION_SCHEMA = pa.schema([
+    pa.field('timestamp', pa.timestamp('ms', tz='UTC')),
+    pa.field('id', pa.string()),
+    pa.field('retracted', pa.bool_()),
+    pa.field('videoId', pa.string()),
+    pa.field('channelId', pa.string()),
+])
+
 # epoch time
 genesisEpoch = datetime.fromtimestamp(1610687733293 / 1000, timezone.utc)
 
@@ -90,74 +108,194 @@ missingMembershipColumn2022End = datetime.fromtimestamp(
     1642831627305 / 1000, timezone.utc)
 
 
-def accumulateChat(collection, recent=-1, ignoreHalfway=False):
-    print('# of chats', collection.estimated_document_count())
-
-    if recent >= 0:
-        print(f'Processing chats past {recent} month(s)')
-    if ignoreHalfway:
-        print('While ignoring this month')
-
-    def convert(doc):
-        timestamp = doc['timestamp']
-
-        chatId = doc['id']
-        authorChannelId = doc['authorChannelId']
-        authorName = doc['authorName'] if 'authorName' in doc else None
-
-        try:
-            text = replaceEmojiWithReplacement(doc['message'])
-        except Exception as e:
-            # ignore doc missing a message
-            print(doc['_id'], 'lacks message (ignored)')
-            return None
-
-        videoId = doc['originVideoId']
-        channelId = doc['originChannelId']
-
-        membership = doc['membership'] if 'membership' in doc else 'non-member'
-
-        isMembershipAndSuperchatInfoMissing = (
-            timestamp < missingMembershipAndSuperchatColumnEnd) or (
-                (timestamp >= missingMembershipColumn2022Start) and
-                (timestamp < missingMembershipColumn2022End))
-        if isMembershipAndSuperchatInfoMissing:
-            membership = 'unknown'
-
-        isModerator = doc['isModerator']
-        isVerified = doc['isVerified']
-        isOwner = doc['isOwner']
-
-        return {
-            'timestamp': timestamp,
-            'id': chatId,
-            'authorName': authorName,
-            'authorChannelId': authorChannelId,
-            'body': text,
+# fields fetched from the server; everything else is projected away
+CHAT_PROJECTION = {
+    'timestamp': 1,
+    'id': 1,
+    'authorName': 1,
+    'authorChannelId': 1,
+    'message': 1,
+    'membership': 1,
+    'isModerator': 1,
+    'isVerified': 1,
+    'isOwner': 1,
+    'originVideoId': 1,
+    'originChannelId': 1,
+}
+
+SC_PROJECTION = {
+    'timestamp': 1,
+    'id': 1,
+    'authorName': 1,
+    'authorChannelId': 1,
+    'message': 1,
+    'purchaseAmount': 1,
+    'currency': 1,
+    'color': 1,
+    'significance': 1,
+    'originVideoId': 1,
+    'originChannelId': 1,
+}
+
+
+BAN_PROJECTION = {
+    'timestamp': 1,
+    'channelId': 1,
+    'originVideoId': 1,
+    'originChannelId': 1,
+}
+
+DELETION_PROJECTION = {
+    'timestamp': 1,
+    'targetId': 1,
+    'retracted': 1,
+    'originVideoId': 1,
+    'originChannelId': 1,
+}
+
+
+def columnsToTable(columns, schema):
+    arrays = []
+    for field in schema:
+        column = columns[field.name]
+        if not isinstance(column, pa.Array):
+            column = pa.array(column, type=field.type)
+        arrays.append(column)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def unknownMembershipMask(timestamps):
+    at = lambda t: pa.scalar(t, type=timestamps.type)
+    return pc.or_(
+        pc.less(timestamps, at(missingMembershipAndSuperchatColumnEnd)),
+        pc.and_(pc.greater_equal(timestamps,
+                                 at(missingMembershipColumn2022Start)),
+                pc.less(timestamps, at(missingMembershipColumn2022End))))
+
+
+def rawMessageColumn(docs):
+    # non-string messages count as missing
+    return pa.array([
+        message if isinstance(message, str) else None
+        for message in (doc.get('message') for doc in docs)
+    ], pa.string())
+
+
+def convertChats(docs):
+    timestamps = pa.array([doc['timestamp'] for doc in docs],
+                          CHAT_SCHEMA.field('timestamp').type)
+    body, hasMessage = cleanMessageColumn(rawMessageColumn(docs))
+    membership = pc.if_else(
+        unknownMembershipMask(timestamps), 'unknown',
+        pa.array([doc.get('membership', 'non-member') for doc in docs],
+                 pa.string()))
+
+    table = columnsToTable(
+        {
+            'timestamp': timestamps,
+            'id': [doc['id'] for doc in docs],
+            'authorName': [doc.get('authorName') for doc in docs],
+            'authorChannelId': [doc['authorChannelId'] for doc in docs],
+            'body': body,
             'membership': membership,
-            'isModerator': isModerator,
-            'isVerified': isVerified,
-            'isOwner': isOwner,
-            'videoId': videoId,
-            'channelId': channelId,
-        }
-
-    def to_file(cursor, total, filename):
-        outpath = join(RAW_DATA_DIR, filename)
-
-        pq_writer = pq.ParquetWriter(outpath, CHAT_SCHEMA)
-        tp = tqdm(total=total, mininterval=1, desc=filename)
-
-        for docs in grouper_it(CHUNK_SIZE, cursor):
-            tp.update(CHUNK_SIZE)
-            table = pa.Table.from_pylist(list(filter(None, map(convert,
-                                                               docs))),
-                                         schema=CHAT_SCHEMA)
-            pq_writer.write_table(table)
-
-        pq_writer.close()
-        tp.close()
-
+            'isModerator': [doc['isModerator'] for doc in docs],
+            'isVerified': [doc['isVerified'] for doc in docs],
+            'isOwner': [doc['isOwner'] for doc in docs],
+            'videoId': [doc['originVideoId'] for doc in docs],
+            'channelId': [doc['originChannelId'] for doc in docs],
+        }, CHAT_SCHEMA)
+
+    # ignore docs missing a message
+    if hasMessage.false_count > 0:
+        for i in pc.indices_nonzero(pc.invert(hasMessage)).to_pylist():
+            print(docs[i]['_id'], 'lacks message (ignored)')
+        table = table.filter(hasMessage)
+
+    return table
+
+
+def convertSuperChats(docs):
+    body, _ = cleanMessageColumn(rawMessageColumn(docs), emptyAsNull=True)
+
+    return columnsToTable(
+        {
+            'timestamp': [doc['timestamp'] for doc in docs],
+            'id': [doc['id'] for doc in docs],
+            'authorName': [doc.get('authorName') for doc in docs],
+            'authorChannelId': [doc['authorChannelId'] for doc in docs],
+            'body': body,
+            'amount': [doc['purchaseAmount'] for doc in docs],
+            'currency': [doc['currency'] for doc in docs],
+            'color': [doc['color'] for doc in docs],
+            'significance': [doc['significance'] for doc in docs],
+            'videoId': [doc['originVideoId'] for doc in docs],
+            'channelId': [doc['originChannelId'] for doc in docs],
+        }, SC_SCHEMA)
+
+
+def convertBans(docs):
+    return columnsToTable(
+        {
+            'timestamp': [doc.get('timestamp') for doc in docs],
+            'authorChannelId': [doc['channelId'] for doc in docs],
+            'videoId': [doc['originVideoId'] for doc in docs],
+            'channelId': [doc['originChannelId'] for doc in docs],
+        }, BAN_SCHEMA)
+
+
+def convertDeletions(docs):
+    return columnsToTable(
+        {
+            'timestamp': [doc.get('timestamp') for doc in docs],
+            'id': [doc['targetId'] for doc in docs],
+            'retracted': [doc['retracted'] for doc in docs],
+            'videoId': [doc['originVideoId'] for doc in docs],
+            'channelId': [doc['originChannelId'] for doc in docs],
+        }, DELETION_SCHEMA)
+
+
+# collection name -> (output prefix, schema, projection, batch converter)
+EXPORT_KINDS = {
+    'chats': ('chats', CHAT_SCHEMA, CHAT_PROJECTION, convertChats),
+    'superchats': ('superchats', SC_SCHEMA, SC_PROJECTION, convertSuperChats),
+    'banactions':
+    ('ban_events', BAN_SCHEMA, BAN_PROJECTION, convertBans),
+    'deleteactions': ('deletion_events', DELETION_SCHEMA, DELETION_PROJECTION,
+                      convertDeletions),
+}
+
+
+def iterRawBatches(collection, query, projection):
+    """the server's raw BSON replies, left undecoded"""
+    return collection.find_raw_batches(query,
+                                       projection,
+                                       batch_size=CHUNK_SIZE)
+
+
+def iterBatches(collection, query, projection):
+    """
+    Decode the server's raw BSON replies a whole batch at a time instead of
+    materializing documents one by one through the cursor.
+    """
+    codecOptions = collection.codec_options
+    for data in iterRawBatches(collection, query, projection):
+        yield bson.decode_all(data, codecOptions)
+
+
+def convertRawBatch(data, codecOptions, convert):
+    """
+    Decode and convert one raw reply.
+    Returns (table, docs, last) where `last` is the greatest
+    (timestamp, _id) in the batch.
+    """
+    docs = bson.decode_all(data, codecOptions)
+    last = max(((doc['timestamp'], doc['_id'])
+                for doc in docs if doc.get('timestamp') is not None),
+               default=None)
+    return convert(docs) if docs else None, len(docs), last
+
+
+def monthRanges(recent=-1, ignoreHalfway=False):
     now = datetime.utcnow().replace(tzinfo=timezone.utc)
 
     if recent >= 0:
@@ -171,170 +309,741 @@ def accumulateChat(collection, recent=-1, ignoreHalfway=False):
     while cm < untilDate:
         nm = cm + relativedelta(months=+1)
         nm = datetime(nm.year, nm.month, 1, tzinfo=timezone.utc)
-        filename = f'chats_{cm.strftime("%Y-%m")}.parquet'
-        print('data range:', cm, '<= X <', nm)
-        print('target:', filename)
-
-        query = {'timestamp': {'$gte': cm, '$lt': nm}}
-        cursor = collection.find(query)
-        cursorTotal = collection.count_documents(query)
-        to_file(cursor, cursorTotal, filename)
-
-        gc.collect()
+        yield cm, nm
 
         # update start epoch
         cm = nm
 
 
-def accumulateSuperChat(collection, recent=-1, ignoreHalfway=False):
-    print('# of superchats', collection.estimated_document_count())
+def splitRange(start, end, parts):
+    """split [start, end) into `parts` contiguous millisecond-aligned windows"""
+    startMs = int(start.timestamp() * 1000)
+    endMs = int(end.timestamp() * 1000)
+    bounds = [startMs + (endMs - startMs) * i // parts
+              for i in range(parts)] + [endMs]
+    bounds = [
+        datetime.fromtimestamp(b / 1000, timezone.utc) for b in bounds
+    ]
+    bounds[0], bounds[-1] = start, end
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def to_file(rawBatches,
+            total,
+            outpath,
+            schema,
+            transform,
+            profile=DEFAULT_PROFILE,
+            progress=True):
+    """
+    Stream raw batches through `transform` (see convertRawBatch) into
+    `outpath` and return (rows, last) where `last` is the greatest
+    (timestamp, _id) consumed.
+
+    Fetching, conversion and Parquet writes overlap on separate threads
+    (see pipelined); the file is written to a temp path and renamed into
+    place.
+    """
+    tmppath = outpath + '.tmp'
+    tp = tqdm(total=total,
+              mininterval=1,
+              desc=basename(outpath),
+              disable=not progress)
+
+    rows = 0
+    last = None
+
+    def write(result):
+        nonlocal rows, last
+        table, docs, batchLast = result
+        tp.update(docs)
+        if table is None:
+            return
 
-    if recent >= 0:
-        print(f'Processing chats past {recent} month(s)')
-    if ignoreHalfway:
-        print('While ignoring this month')
+        pq_writer.write_table(table)
+        rows += table.num_rows
+        if batchLast and (last is None or batchLast > last):
+            last = batchLast
 
-    def convert(doc):
-        timestamp = doc['timestamp']
-
-        chatId = doc['id']
-        authorChannelId = doc['authorChannelId']
-        authorName = doc['authorName'] if 'authorName' in doc else None
-
-        text = replaceEmojiWithReplacement(
-            doc['message']) if doc['message'] else None
-
-        videoId = doc['originVideoId']
-        channelId = doc['originChannelId']
-        amount = doc['purchaseAmount']
-        currency = doc['currency']
-        color = doc['color']
-        significance = doc['significance']
-
-        return {
-            'timestamp': timestamp,
-            'id': chatId,
-            'authorName': authorName,
-            'authorChannelId': authorChannelId,
-            'body': text,
-            'amount': amount,
-            'currency': currency,
-            'color': color,
-            'significance': significance,
-            'videoId': videoId,
-            'channelId': channelId,
-        }
-
-    def to_file(cursor, total, filename):
-        outpath = join(RAW_DATA_DIR, filename)
-
-        pq_writer = pq.ParquetWriter(outpath, SC_SCHEMA)
-        tp = tqdm(total=total, mininterval=1, desc=filename)
-
-        for docs in grouper_it(CHUNK_SIZE, cursor):
-            tp.update(CHUNK_SIZE)
-            table = pa.Table.from_pylist(list(map(convert, docs)),
-                                         schema=SC_SCHEMA)
-            pq_writer.write_table(table)
-
-        pq_writer.close()
+    started = time.monotonic()
+    try:
+        pq_writer = ParquetBatchWriter(tmppath, schema, profile)
+        try:
+            pipelined(rawBatches, transform, write)
+        finally:
+            pq_writer.close()
+        os.replace(tmppath, outpath)
+    except BaseException:
+        # whichever step failed, never leave the temp file behind
+        if exists(tmppath):
+            os.remove(tmppath)
+        raise
+    finally:
         tp.close()
 
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
-
-    if recent >= 0:
-        recent = now + relativedelta(months=-recent)
-        cm = datetime(recent.year, recent.month, 1, tzinfo=timezone.utc)
+    if progress:
+        elapsed = time.monotonic() - started
+        print(f'>>> {rows} rows in {elapsed:.1f}s',
+              f'({rows / max(elapsed, 1e-9):.0f} rows/s)')
+
+    return rows, last
+
+
+def exportRange(collection,
+                kind,
+                start,
+                end,
+                outpath,
+                checkpoint=None,
+                profile=DEFAULT_PROFILE,
+                progress=True):
+    _, schema, projection, convert = EXPORT_KINDS[kind]
+    query = resumeQuery(start, end, checkpoint)
+    rawBatches = iterRawBatches(collection, query, projection)
+    cursorTotal = collection.count_documents(query) if progress else None
+    return to_file(rawBatches,
+                   cursorTotal,
+                   outpath,
+                   schema,
+                   partial(convertRawBatch,
+                           codecOptions=collection.codec_options,
+                           convert=convert),
+                   profile=profile,
+                   progress=progress)
+
+
+def stitchParts(parts, outpath, schema, base=None, profile=DEFAULT_PROFILE):
+    """concatenate `base` (if any) and `parts` into `outpath` atomically"""
+    if len(parts) == 1 and base is None:
+        os.replace(parts[0], outpath)
+        return
+
+    tmppath = outpath + '.tmp'
+    pq_writer = ParquetBatchWriter(tmppath, schema, profile)
+    for src in ([base] if base else []) + parts:
+        for batch in pq.ParquetFile(src).iter_batches():
+            pq_writer.write_table(pa.Table.from_batches([batch], schema))
+    pq_writer.close()
+    os.replace(tmppath, outpath)
+
+    for part in parts:
+        os.remove(part)
+
+
+# each pool worker opens its own source (and thus connection)
+_workerSource = None
+
+
+def _initWorker(sourceUri):
+    global _workerSource
+    _workerSource = openSource(sourceUri)
+
+
+def _exportRangeInWorker(kind, start, end, outpath, checkpoint, profile):
+    collection = _workerSource.collection(kind)
+    return exportRange(collection,
+                       kind,
+                       start,
+                       end,
+                       outpath,
+                       checkpoint=checkpoint,
+                       profile=profile,
+                       progress=False)
+
+
+def planMonth(collection, kind, cm, nm, shardSize, resume, parallel):
+    """
+    Decide how to export [cm, nm).
+    Returns None for completed months, otherwise a dict of shards
+    (start, end, partpath) plus the checkpoint to resume from.
+    """
+    prefix = EXPORT_KINDS[kind][0]
+    filename = f'{prefix}_{cm.strftime("%Y-%m")}.parquet'
+    outpath = join(RAW_DATA_DIR, filename)
+    partsDir = join(RAW_DATA_DIR, '.parts')
+
+    checkpoint = loadCheckpoint(RAW_DATA_DIR, filename) if (
+        resume and exists(outpath)) else None
+
+    print('data range:', cm, '<= X <', nm)
+    print('target:', outpath)
+
+    if checkpoint and checkpoint['completed']:
+        print('>>> Skipping completed month:', filename,
+              f'({checkpoint["rows"]} rows)')
+        return None
+
+    if checkpoint:
+        # append documents newer than the checkpoint as a single delta part
+        print('>>> Resuming after:', checkpoint['lastTimestamp'])
+        shards = [(cm, nm)]
+    elif parallel:
+        # split month into shards of roughly `shardSize` documents
+        total = collection.count_documents(
+            {'timestamp': {
+                '$gte': cm,
+                '$lt': nm
+            }})
+        shards = splitRange(cm, nm, max(1, math.ceil(total / shardSize)))
+        print(f'>>> {total} docs in {len(shards)} shard(s)')
     else:
-        cm = genesisEpoch
+        shards = [(cm, nm)]
+
+    return {
+        'filename':
+        filename,
+        'prefix':
+        prefix,
+        'period':
+        cm.strftime('%Y-%m'),
+        'checkpoint':
+        checkpoint,
+        'shards': [(start, end,
+                    join(partsDir, f'{splitext(filename)[0]}.{i:04d}.parquet'))
+                   for i, (start, end) in enumerate(shards)],
+    }
+
+
+def finishMonth(plan, results, schema, completed, profile, layout):
+    filename = plan['filename']
+    checkpoint = plan['checkpoint']
+    outpath = join(RAW_DATA_DIR, filename)
+
+    rows = sum(r for r, _ in results)
+    lasts = [last for _, last in results if last]
+    if checkpoint:
+        rows += checkpoint['rows']
+        if checkpoint['lastTimestamp'] is not None:
+            lasts.append((checkpoint['lastTimestamp'], checkpoint['lastId']))
+
+    parts = [partpath for _, _, partpath in plan['shards']]
+    stitchParts(parts,
+                outpath,
+                schema,
+                base=outpath if checkpoint else None,
+                profile=profile)
+    saveCheckpoint(RAW_DATA_DIR,
+                   filename,
+                   max(lasts) if lasts else None,
+                   rows,
+                   completed=completed)
+
+    if layout == 'hive':
+        writePartitionedMonth(outpath, join(RAW_DATA_DIR, plan['prefix']),
+                              plan['period'])
+
+
+def accumulate(collection,
+               kind,
+               recent=-1,
+               ignoreHalfway=False,
+               workers=1,
+               shardSize=SHARD_SIZE,
+               resume=True,
+               profile=DEFAULT_PROFILE,
+               layout='flat',
+               sourceUri=None):
+    schema = EXPORT_KINDS[kind][1]
 
-    untilDate = now + relativedelta(months=-1 if ignoreHalfway else 0)
+    if recent >= 0:
+        print(f'Processing {kind} past {recent} month(s)')
+    if ignoreHalfway:
+        print('While ignoring this month')
 
-    while cm < untilDate:
-        nm = cm + relativedelta(months=+1)
-        nm = datetime(nm.year, nm.month, 1, tzinfo=timezone.utc)
-        filename = f'superchats_{cm.strftime("%Y-%m")}.parquet'
-        print('data range:', cm, '<= X <', nm)
-        print('target:', join(RAW_DATA_DIR, filename))
+    os.makedirs(join(RAW_DATA_DIR, '.parts'), exist_ok=True)
+
+    # months ending before the run started can no longer grow
+    startedAt = datetime.utcnow().replace(tzinfo=timezone.utc)
+
+    if workers <= 1:
+        for cm, nm in monthRanges(recent, ignoreHalfway):
+            plan = planMonth(collection, kind, cm, nm, shardSize, resume,
+                             False)
+            if plan is None:
+                continue
+
+            results = [
+                exportRange(collection,
+                            kind,
+                            start,
+                            end,
+                            partpath,
+                            checkpoint=plan['checkpoint'],
+                            profile=profile)
+                for start, end, partpath in plan['shards']
+            ]
+            finishMonth(plan, results, schema, nm <= startedAt, profile,
+                        layout)
+
+            gc.collect()
+        return
+
+    print('workers:', workers)
+
+    # workers open their own connection; fail here on a bad source rather
+    # than in every one of them
+    sourceUri = sourceUri or MONGODB_URI
+    if not sourceUri:
+        raise ValueError('parallel export needs sourceUri or MONGODB_URI '
+                         'for its workers to connect to')
+    with openSource(sourceUri) as source:
+        source.collection(kind)
+
+    plans = {}
+    for cm, nm in monthRanges(recent, ignoreHalfway):
+        plan = planMonth(collection, kind, cm, nm, shardSize, resume, True)
+        if plan is not None:
+            plans[plan['filename']] = (plan, nm <= startedAt)
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_initWorker,
+                             initargs=(sourceUri, )) as executor:
+        futures = {}
+        for filename, (plan, _) in plans.items():
+            for start, end, partpath in plan['shards']:
+                future = executor.submit(_exportRangeInWorker, kind, start,
+                                         end, partpath, plan['checkpoint'],
+                                         profile)
+                futures[future] = filename
+
+        results = {filename: {} for filename in plans}
+        tp = tqdm(total=len(futures), mininterval=1, desc=kind)
+        for future in as_completed(futures):
+            filename = futures[future]
+            results[filename][future] = future.result()
+            tp.update(1)
+
+            plan, completed = plans[filename]
+            if len(results[filename]) == len(plan['shards']):
+                # all shards of the month are done; results arrive in
+                # completion order, but finishMonth stitches the parts in
+                # plan['shards'] order and only sums the results
+                finishMonth(plan, list(results[filename].values()), schema,
+                            completed, profile, layout)
+                tp.write(f'done: {join(RAW_DATA_DIR, filename)}')
+        tp.close()
 
-        query = {'timestamp': {'$gte': cm, '$lt': nm}}
-        cursor = collection.find(query)
-        cursorTotal = collection.count_documents(query)
-        to_file(cursor, cursorTotal, filename)
 
-        # update start epoch
-        cm = nm
+def accumulateChat(collection, recent=-1, ignoreHalfway=False, **options):
+    print('# of chats', collection.estimated_document_count())
+    accumulate(collection,
+               'chats',
+               recent=recent,
+               ignoreHalfway=ignoreHalfway,
+               **options)
 
 
-def accumulateBan(col):
+def accumulateSuperChat(collection,
+                        recent=-1,
+                        ignoreHalfway=False,
+                        **options):
+    print('# of superchats', collection.estimated_document_count())
+    accumulate(collection,
+               'superchats',
+               recent=recent,
+               ignoreHalfway=ignoreHalfway,
+               **options)
+
+
+def accumulateEvents(collection,
+                     kind,
+                     partitioned=False,
+                     recent=-1,
+                     ignoreHalfway=False,
+                     **options):
+    prefix, schema, projection, convert = EXPORT_KINDS[kind]
+    profile = options.get('profile', DEFAULT_PROFILE)
+    transform = partial(convertRawBatch,
+                        codecOptions=collection.codec_options,
+                        convert=convert)
+
+    if partitioned:
+        # dated events go through the same monthly export as chats
+        accumulate(collection,
+                   kind,
+                   recent=recent,
+                   ignoreHalfway=ignoreHalfway,
+                   **options)
+
+        # events recorded before timestamps were tracked
+        query = {'timestamp': None}
+        outpath = join(RAW_DATA_DIR, f'{prefix}_undated.parquet')
+        print('target:', outpath)
+        to_file(iterRawBatches(collection, query, projection),
+                collection.count_documents(query),
+                outpath,
+                schema,
+                transform,
+                profile=profile)
+        return
+
+    filename = f'{prefix}.parquet'
+    outpath = join(RAW_DATA_DIR, filename)
+    checkpoint = loadCheckpoint(RAW_DATA_DIR, filename) if (
+        options.get('resume', True) and exists(outpath)) else None
+    print('target:', outpath)
+
+    if checkpoint and checkpoint['lastTimestamp'] is not None:
+        # append events newer than the last export as a delta part;
+        # undated events all predate it
+        print('>>> Resuming after:', checkpoint['lastTimestamp'])
+        query = resumeQuery(None,
+                            datetime.utcnow().replace(tzinfo=timezone.utc),
+                            checkpoint)
+        partpath = join(RAW_DATA_DIR, '.parts', filename)
+        os.makedirs(join(RAW_DATA_DIR, '.parts'), exist_ok=True)
+    else:
+        checkpoint = None
+        query = {}
+        partpath = outpath
+
+    rows, last = to_file(iterRawBatches(collection, query, projection),
+                         collection.count_documents(query),
+                         partpath,
+                         schema,
+                         transform,
+                         profile=profile)
+
+    if checkpoint:
+        if rows:
+            stitchParts([partpath],
+                        outpath,
+                        schema,
+                        base=outpath,
+                        profile=profile)
+        else:
+            os.remove(partpath)
+        rows += checkpoint['rows']
+        lasts = [last] if last else []
+        lasts.append((checkpoint['lastTimestamp'], checkpoint['lastId']))
+        last = max(lasts)
+    saveCheckpoint(RAW_DATA_DIR, filename, last, rows, completed=False)
+
+
+def accumulateBan(col, partitioned=False, **options):
     print('# of ban', col.estimated_document_count())
-    cursor = col.find()
-
-    def convert(doc):
-        authorChannelId = doc['channelId']
-        videoId = doc['originVideoId']
-        channelId = doc['originChannelId']
-        timestamp = doc['timestamp'] if 'timestamp' in doc else None
-
-        return {
-            'timestamp': timestamp,
-            'authorChannelId': authorChannelId,
-            'videoId': videoId,
-            'channelId': channelId,
-        }
-
-    records = list(map(convert, cursor))
-    table = pa.Table.from_pylist(records)
-    pq.write_table(table, join(RAW_DATA_DIR, 'ban_events.parquet'))
+    accumulateEvents(col, 'banactions', partitioned=partitioned, **options)
 
 
-def accumulateDeletion(col):
+def accumulateDeletion(col, partitioned=False, **options):
     print('# of deletion', col.estimated_document_count())
-    cursor = col.find()
-
-    def convert(doc):
-        chatId = doc['targetId']
-        videoId = doc['originVideoId']
-        channelId = doc['originChannelId']
-        retracted = doc['retracted']
-        timestamp = doc['timestamp'] if 'timestamp' in doc else None
-
-        return {
-            'timestamp': timestamp,
-            'id': chatId,
-            'retracted': retracted,
-            'videoId': videoId,
-            'channelId': channelId,
-        }
-
-    records = list(map(convert, cursor))
-    table = pa.Table.from_pylist(records)
-    pq.write_table(table, join(RAW_DATA_DIR, 'deletion_events.parquet'))
+    accumulateEvents(col, 'deleteactions', partitioned=partitioned, **options)
+
+
+class Follower:
+    """
+    Tails one collection into rolling segments.
+    Consumes a change stream when the server supports it and otherwise
+    polls for documents past the last (timestamp, _id) seen.
+    """
+
+    def __init__(self,
+                 collection,
+                 kind,
+                 segmentSeconds=60,
+                 profile=DEFAULT_PROFILE):
+        prefix, schema, projection, convert = EXPORT_KINDS[kind]
+        self.collection = collection
+        self.kind = kind
+        self.prefix = prefix
+        self.schema = schema
+        self.projection = projection
+        self.convert = convert
+        self.profile = profile
+        self.segments = SegmentWriter(RAW_DATA_DIR, prefix, schema,
+                                      segmentSeconds, profile)
+        self.statePath = join(RAW_DATA_DIR, SEGMENT_DIR, f'{prefix}.json')
+
+        state = readJSON(self.statePath)
+        if state is None:
+            # start where the batch export of the current month stopped
+            now = datetime.utcnow().replace(tzinfo=timezone.utc)
+            checkpoint = loadCheckpoint(
+                RAW_DATA_DIR, f'{prefix}_{now.strftime("%Y-%m")}.parquet')
+            state = {
+                'since': datetime(now.year, now.month, 1,
+                                  tzinfo=timezone.utc),
+                'position': None,
+                'periods': {},
+            }
+            if checkpoint and checkpoint['lastTimestamp'] is not None:
+                state['position'] = {
+                    'lastTimestamp': checkpoint['lastTimestamp'],
+                    'lastId': checkpoint['lastId'],
+                }
+        self.state = state
+
+        # open the stream before catching up so nothing slips in between
+        self.stream = None
+        try:
+            self.stream = collection.watch(
+                [{
+                    '$match': {
+                        'operationType': 'insert'
+                    }
+                }],
+                max_await_time_ms=1000)
+        except (AttributeError, pymongo.errors.PyMongoError) as e:
+            print(f'[{kind}] change stream unavailable, polling instead:', e)
+
+        self.caughtFrom = self.lastSeen() or (self.state['since'], None)
+        self.poll()
+        self.caughtUp = self.lastSeen()
+
+    def lastSeen(self):
+        position = self.state['position']
+        if position is None:
+            return None
+        return (position['lastTimestamp'], position['lastId'])
+
+    def caughtUpOn(self, doc):
+        """whether the catch-up poll already picked `doc` up"""
+        if self.caughtUp is None or doc.get('timestamp') is None:
+            return False
+
+        timestamp, lastId = self.caughtFrom
+        if doc['timestamp'] < timestamp or (doc['timestamp'] == timestamp
+                                            and lastId is not None
+                                            and doc['_id'] <= lastId):
+            return False
+        return (doc['timestamp'], doc['_id']) <= self.caughtUp
+
+    def poll(self):
+        query = resumeQuery(self.state['since'],
+                            datetime.max.replace(tzinfo=timezone.utc),
+                            self.state['position'])
+        for docs in iterBatches(self.collection, query, self.projection):
+            self.ingest(docs)
+
+    def drain(self, seconds):
+        deadline = time.monotonic() + seconds
+        docs = []
+        while time.monotonic() < deadline and len(docs) < CHUNK_SIZE:
+            change = self.stream.try_next()
+            if change is None:
+                continue
+            doc = change['fullDocument']
+            if not self.caughtUpOn(doc):
+                docs.append(doc)
+        self.ingest(docs)
+
+    def ingest(self, docs):
+        byPeriod = {}
+        for doc in docs:
+            # undated events cannot be placed in a month
+            if doc.get('timestamp') is None:
+                continue
+            byPeriod.setdefault(doc['timestamp'].strftime('%Y-%m'),
+                                []).append(doc)
+
+        for period, periodDocs in byPeriod.items():
+            table = self.convert(periodDocs)
+            self.segments.append(period, table)
+
+            last = max((doc['timestamp'], doc['_id']) for doc in periodDocs)
+            stat = self.state['periods'].setdefault(period, {
+                'rows': 0,
+                'lastTimestamp': None,
+                'lastId': None,
+            })
+            stat['rows'] += table.num_rows
+            if stat['lastTimestamp'] is None or last > (stat['lastTimestamp'],
+                                                        stat['lastId']):
+                stat['lastTimestamp'], stat['lastId'] = last
+
+            if self.lastSeen() is None or last > self.lastSeen():
+                self.state['position'] = {
+                    'lastTimestamp': last[0],
+                    'lastId': last[1],
+                }
+
+    def tick(self, interval):
+        if self.stream is not None:
+            self.drain(interval)
+        else:
+            self.poll()
+
+        if self.segments.due():
+            self.flush()
+
+    def flush(self):
+        # state is only saved once the segments it describes are on disk
+        self.segments.roll()
+        writeJSON(self.statePath, self.state)
+
+    def compact(self, now, grace, layout='flat'):
+        """fold the segments of every closed month into its monthly file"""
+        for period in sorted(self.state['periods']):
+            nm = datetime.strptime(period, '%Y-%m').replace(
+                tzinfo=timezone.utc) + relativedelta(months=+1)
+            if now < nm + grace:
+                continue
+
+            self.flush()
+
+            filename = f'{self.prefix}_{period}.parquet'
+            outpath = join(RAW_DATA_DIR, filename)
+            checkpoint = loadCheckpoint(RAW_DATA_DIR, filename)
+            if checkpoint is None and exists(outpath):
+                checkpoint = {
+                    'rows': pq.read_metadata(outpath).num_rows,
+                    'lastTimestamp': None,
+                    'lastId': None,
+                }
+
+            print(f'[{self.kind}] compacting segments into', outpath)
+            stat = self.state['periods'][period]
+            plan = {
+                'filename':
+                filename,
+                'prefix':
+                self.prefix,
+                'period':
+                period,
+                'checkpoint':
+                checkpoint,
+                'shards': [(None, None, part)
+                           for part in self.segments.segmentFiles(period)],
+            }
+            finishMonth(plan,
+                        [(stat['rows'],
+                          (stat['lastTimestamp'], stat['lastId']))],
+                        self.schema,
+                        completed=True,
+                        profile=self.profile,
+                        layout=layout)
+
+            self.segments.removePeriod(period)
+            del self.state['periods'][period]
+            writeJSON(self.statePath, self.state)
+
+
+def follow(collections,
+           interval=5,
+           segmentSeconds=60,
+           grace=timedelta(hours=1),
+           profile=DEFAULT_PROFILE,
+           layout='flat',
+           iterations=None):
+    """
+    Tail `collections` ({kind: collection}) into rolling segments until
+    interrupted, compacting each month once it has been closed for `grace`.
+    """
+    followers = [
+        Follower(collection, kind, segmentSeconds, profile)
+        for kind, collection in collections.items()
+    ]
+
+    try:
+        while iterations is None or iterations > 0:
+            started = time.monotonic()
+            for follower in followers:
+                follower.tick(interval / len(followers))
+
+            now = datetime.utcnow().replace(tzinfo=timezone.utc)
+            for follower in followers:
+                follower.compact(now, grace, layout)
+
+            if iterations is not None:
+                iterations -= 1
+            time.sleep(max(0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        print('Stopping')
+    finally:
+        for follower in followers:
+            follower.flush()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='dataset generator')
+    parser.add_argument('-S',
+                        '--source',
+                        type=str,
+                        default=MONGODB_URI,
+                        help='MongoDB URI or mongodump directory')
     parser.add_argument('-R', '--recent', type=int, default=0)
     parser.add_argument('-I', '--ignore-halfway', action='store_true')
+    parser.add_argument('-w', '--workers', type=int, default=1)
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    parser.add_argument('--no-resume', action='store_true')
+    parser.add_argument('-P', '--partition-events', action='store_true')
+    parser.add_argument('--layout',
+                        choices=['flat', 'hive'],
+                        default='flat')
+    parser.add_argument('-F', '--follow', action='store_true')
+    parser.add_argument('--interval', type=float, default=5)
+    parser.add_argument('--segment-seconds', type=float, default=60)
+    parser.add_argument('--grace-minutes', type=float, default=60)
+    parser.add_argument('-c', '--compression', type=str, default=None)
+    parser.add_argument('-l', '--compression-level', type=int, default=None)
+    parser.add_argument('--row-group-rows', type=int, default=None)
+    parser.add_argument('--row-group-bytes', type=int, default=None)
     args = parser.parse_args()
 
-    print('dataset: ' + RAW_DATA_DIR)
-
-    client = pymongo.MongoClient(MONGODB_URI)
-    db = client.vespa
+    if not args.source:
+        parser.error('set MONGODB_URI or pass --source')
 
-    options = CodecOptions(tz_aware=True)
+    print('dataset: ' + RAW_DATA_DIR)
 
-    chats = db.get_collection('chats', codec_options=options)
-    sc = db.get_collection('superchats', codec_options=options)
-    delete_actions = db.get_collection('deleteactions', codec_options=options)
-    ban_actions = db.get_collection('banactions', codec_options=options)
+    source = openSource(args.source)
+
+    chats = source.collection('chats')
+    sc = source.collection('superchats')
+    delete_actions = source.collection('deleteactions')
+    ban_actions = source.collection('banactions')
+
+    profile = writeProfile(compression=args.compression,
+                           compressionLevel=args.compression_level,
+                           rowGroupRows=args.row_group_rows,
+                           rowGroupBytes=args.row_group_bytes)
+
+    if args.follow:
+        follow(
+            {
+                'chats': chats,
+                'superchats': sc,
+                'deleteactions': delete_actions,
+                'banactions': ban_actions,
+            },
+            interval=args.interval,
+            segmentSeconds=args.segment_seconds,
+            grace=timedelta(minutes=args.grace_minutes),
+            profile=profile,
+            layout=args.layout)
+        source.close()
+        sys.exit(0)
+
+    exportOptions = {
+        'workers':
+        args.workers,
+        'sourceUri':
+        args.source,
+        'shardSize':
+        args.shard_size,
+        'resume':
+        not args.no_resume,
+        'layout':
+        args.layout,
+        'profile':
+        profile,
+    }
 
     accumulateChat(chats,
                    recent=args.recent,
-                   ignoreHalfway=args.ignore_halfway)
+                   ignoreHalfway=args.ignore_halfway,
+                   **exportOptions)
     accumulateSuperChat(sc,
                         recent=args.recent,
-                        ignoreHalfway=args.ignore_halfway)
-    accumulateDeletion(delete_actions)
-    accumulateBan(ban_actions)
+                        ignoreHalfway=args.ignore_halfway,
+                        **exportOptions)
+    accumulateDeletion(delete_actions,
+                       partitioned=args.partition_events,
+                       recent=args.recent,
+                       ignoreHalfway=args.ignore_halfway,
+                       **exportOptions)
+    accumulateBan(ban_actions,
+                  partitioned=args.partition_events,
+                  recent=args.recent,
+                  ignoreHalfway=args.ignore_halfway,
+                  **exportOptions)
+    source.close()
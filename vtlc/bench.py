@@ -0,0 +1,410 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from glob import iglob
+from multiprocessing import get_context
+from os.path import join
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dateutil.relativedelta import relativedelta
+
+from vtlc.util.parquet import DEFAULT_BATCH_BUDGET
+from vtlc.util.source import openSource
+from vtlc.util.synthetic import generateDocs, writeDump
+
+# vtlc.constants reads the data directories from the environment when
+# imported, so pipeline modules are only imported inside the spawned
+# process of each case, once its directories are set
+
+# case name -> function(measurement, options) returning the rows handled
+CASES = {}
+
+
+def case(name: str):
+
+    def register(fn):
+        CASES[name] = fn
+        return fn
+
+    return register
+
+
+def _resetPeak():
+    """start a new resident-memory high-water mark (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peakBytes() -> int:
+    """high-water resident memory of this process and its ended children"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    with contextlib.suppress(OSError):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) * 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return max(peak, children)
+
+
+class Measurement:
+    """wall time and peak memory of the code run under `measure()`"""
+
+    def __init__(self):
+        self.seconds = None
+        self.peak = None
+
+    @contextlib.contextmanager
+    def measure(self):
+        gc.collect()
+        _resetPeak()
+        started = time.perf_counter()
+        yield
+        self.seconds = time.perf_counter() - started
+        self.peak = _peakBytes()
+
+
+def _complete(pattern: str) -> list:
+    from vtlc.constants import VTLC_COMPLETE_DIR
+    return sorted(iglob(join(VTLC_COMPLETE_DIR, pattern)))
+
+
+def _rows(paths) -> int:
+    return sum(pq.read_metadata(path).num_rows for path in paths)
+
+
+def _convert(m: Measurement, options: dict, kind: str) -> int:
+    from vtlc.aggregate import EXPORT_KINDS, convertRawBatch, iterRawBatches
+
+    _, _, projection, convert = EXPORT_KINDS[kind]
+    with openSource(options['source']) as source:
+        collection = source.collection(kind)
+        batches = list(iterRawBatches(collection, {}, projection))
+    rows = 0
+    with m.measure():
+        for data in batches:
+            table, _, _ = convertRawBatch(data, collection.codec_options,
+                                          convert)
+            rows += table.num_rows if table is not None else 0
+    return rows
+
+
+case('convertChats')(partial(_convert, kind='chats'))
+case('convertSuperChats')(partial(_convert, kind='superchats'))
+
+
+@case('to_file')
+def _toFile(m: Measurement, options: dict) -> int:
+    from vtlc.aggregate import (CHAT_PROJECTION, CHAT_SCHEMA, convertChats,
+                                convertRawBatch, iterRawBatches, to_file)
+    from vtlc.constants import RAW_DATA_DIR
+
+    with openSource(options['source']) as source:
+        collection = source.collection('chats')
+        with m.measure():
+            rows, _ = to_file(iterRawBatches(collection, {}, CHAT_PROJECTION),
+                              None,
+                              join(RAW_DATA_DIR, 'chats.parquet'),
+                              CHAT_SCHEMA,
+                              partial(convertRawBatch,
+                                      codecOptions=collection.codec_options,
+                                      convert=convertChats),
+                              progress=False)
+    return rows
+
+
+def _reduce(m: Measurement, options: dict, generate: str,
+            pattern: str) -> int:
+    import vtlc.postprocess as postprocess
+
+    # as in a release build, see POSTPROCESS_FLAGS in the Makefile
+    with m.measure():
+        getattr(postprocess, generate)(budget=options['budget'],
+                                       workers=options['workers'],
+                                       rollup=True,
+                                       cluster=True)
+    return _rows(_complete(pattern))
+
+
+for name, pattern in [
+    ('generate_reduced_chats', 'chats_*.parquet'),
+    ('generate_reduced_superchats', 'superchats_*.parquet'),
+    ('generate_reduced_ban', 'ban_events*.parquet'),
+    ('generate_reduced_deletion', 'deletion_events*.parquet'),
+]:
+    case(name)(partial(_reduce, generate=name, pattern=pattern))
+
+
+def _stats(m: Measurement, options: dict, stat: str, pattern: str) -> int:
+    import vtlc.postprocess as postprocess
+
+    paths = _complete(pattern)
+    with m.measure():
+        for path in paths:
+            getattr(postprocess, stat)(path, options['budget'])
+    return _rows(paths)
+
+
+case('chat_stat_month')(partial(_stats,
+                                stat='chat_stat_month',
+                                pattern='chats_*.parquet'))
+case('superchat_stat_month')(partial(_stats,
+                                     stat='superchat_stat_month',
+                                     pattern='superchats_*.parquet'))
+
+
+def _anonymize(m: Measurement, options: dict, cached: bool) -> int:
+    from vtlc.util.anonymize import Anonymizer
+
+    authors = pa.chunked_array([
+        pq.read_table(path, columns=['authorChannelId']).column(0)
+        for path in _complete('chats_*.parquet')
+    ])
+    anonymizer = Anonymizer(os.environ['ANONYMIZATION_SALT'],
+                            workers=options['workers'])
+    if cached:
+        anonymizer.column(authors)
+    with m.measure():
+        anonymizer.column(authors)
+    return len(authors)
+
+
+case('anonymize')(partial(_anonymize, cached=False))
+case('anonymize_cached')(partial(_anonymize, cached=True))
+
+
+@contextlib.contextmanager
+def _quiet(verbose: bool):
+    """silence the pipeline's progress output unless `verbose`"""
+    if verbose:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            yield
+
+
+def _runCase(name: str, options: dict, verbose: bool) -> dict:
+    m = Measurement()
+    with _quiet(verbose):
+        rows = CASES[name](m, options)
+    return {
+        'benchmark': name,
+        'rows': rows,
+        'seconds': m.seconds,
+        'rowsPerSecond': rows / max(m.seconds, 1e-9),
+        'peakMB': m.peak / 1024 / 1024,
+    }
+
+
+def _prepare(options: dict, months, verbose: bool):
+    """export the dump into monthly complete files, as postprocess reads"""
+    from vtlc.aggregate import (EXPORT_KINDS, convertRawBatch, exportRange,
+                                iterRawBatches, to_file)
+    from vtlc.constants import VTLC_COMPLETE_DIR
+
+    with openSource(options['source']) as source, _quiet(verbose):
+        for kind in ('chats', 'superchats'):
+            for start, end in months:
+                exportRange(source.collection(kind),
+                            kind,
+                            start,
+                            end,
+                            join(VTLC_COMPLETE_DIR,
+                                 f'{kind}_{start.strftime("%Y-%m")}.parquet'),
+                            progress=False)
+        for kind in ('banactions', 'deleteactions'):
+            prefix, schema, projection, convert = EXPORT_KINDS[kind]
+            collection = source.collection(kind)
+            to_file(iterRawBatches(collection, {}, projection),
+                    None,
+                    join(VTLC_COMPLETE_DIR, f'{prefix}.parquet'),
+                    schema,
+                    partial(convertRawBatch,
+                            codecOptions=collection.codec_options,
+                            convert=convert),
+                    progress=False)
+
+
+def _spawned(fn, *args):
+    """run `fn(*args)` in a fresh interpreter, with the current environment"""
+    with ProcessPoolExecutor(max_workers=1,
+                             mp_context=get_context('spawn')) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def _directories(workdir: str, name: str):
+    """fresh raw, public and elements directories for case `name`"""
+    root = join(workdir, 'cases', name)
+    shutil.rmtree(root, ignore_errors=True)
+    for env, sub in [('RAW_DATA_DIR', 'raw'), ('VTLC_DIR', 'public'),
+                     ('VTLC_ELEMENTS_DIR', 'elements')]:
+        os.environ[env] = join(root, sub)
+        os.makedirs(os.environ[env])
+
+
+def monthsBetween(start: datetime, end: datetime):
+    months = []
+    cm = datetime(start.year, start.month, 1, tzinfo=timezone.utc)
+    while cm < end:
+        nm = cm + relativedelta(months=+1)
+        months.append((cm, nm))
+        cm = nm
+    return months
+
+
+def runBenchmarks(workdir: str,
+                  names,
+                  options: dict,
+                  months,
+                  repeat: int = 1,
+                  verbose: bool = False) -> pd.DataFrame:
+    """
+    Run each case `repeat` times in a spawned process against the dump at
+    `options['source']`, keeping its fastest run.
+    """
+    os.environ.setdefault('ANONYMIZATION_SALT', 'benchmark')
+    # rates come from the bundled snapshot
+    os.environ.setdefault('CURRENCY_API_KEY', '')
+    os.environ['VTLC_COMPLETE_DIR'] = join(workdir, 'complete')
+
+    _directories(workdir, 'prepare')
+    if not os.path.isdir(os.environ['VTLC_COMPLETE_DIR']):
+        os.makedirs(os.environ['VTLC_COMPLETE_DIR'])
+        print('>>> Exporting the dump to', os.environ['VTLC_COMPLETE_DIR'])
+        _spawned(_prepare, options, months, verbose)
+
+    results = []
+    for name in names:
+        runs = []
+        for _ in range(repeat):
+            _directories(workdir, name)
+            runs.append(_spawned(_runCase, name, options, verbose))
+        best = min(runs, key=lambda run: run['seconds'])
+        print(f'>>> {name}: {best["rowsPerSecond"]:.0f} rows/s,',
+              f'{best["peakMB"]:.0f} MB peak')
+        results.append(best)
+    return pd.DataFrame(results)
+
+
+def compareResults(results: pd.DataFrame, baseline: dict,
+                   tolerance: float) -> pd.DataFrame:
+    """
+    Relative change of throughput and peak memory against `baseline`
+    ({benchmark: result}); `regressed` marks changes beyond `tolerance`.
+    """
+    results = results.copy()
+    base = pd.DataFrame(baseline.values())
+    if base.empty:
+        results['regressed'] = False
+        return results
+    base = base.set_index('benchmark').reindex(results['benchmark'])
+    results['speed'] = (results['rowsPerSecond'].to_numpy() /
+                        base['rowsPerSecond'].to_numpy() - 1)
+    results['memory'] = (results['peakMB'].to_numpy() /
+                         base['peakMB'].to_numpy() - 1)
+    results['regressed'] = (results['speed'] < -tolerance) | (results['memory']
+                                                              > tolerance)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='time the exporter and postprocess on synthetic data')
+    parser.add_argument('benchmarks',
+                        nargs='*',
+                        help='cases to run (default: all of '
+                        f'{", ".join(CASES)})')
+    parser.add_argument('-S',
+                        '--source',
+                        type=str,
+                        default=None,
+                        help='mongodump directory to use instead of '
+                        'generating one')
+    parser.add_argument('-n', '--chats', type=int, default=1_000_000)
+    parser.add_argument('--start', type=str, default='2022-01-01')
+    parser.add_argument('--end', type=str, default='2022-03-01')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-w', '--workers', type=int, default=1)
+    parser.add_argument('--batch-mb',
+                        type=int,
+                        default=DEFAULT_BATCH_BUDGET // 1024 // 1024)
+    parser.add_argument('-r', '--repeat', type=int, default=1)
+    parser.add_argument('--workdir',
+                        type=str,
+                        default=None,
+                        help='keep the dump and exports here for reuse')
+    parser.add_argument('--save',
+                        type=str,
+                        default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('--baseline',
+                        type=str,
+                        default=None,
+                        help='JSON results to compare against')
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=0.2,
+                        help='relative slowdown or memory growth that '
+                        'counts as a regression')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in CASES]
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(unknown)}')
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='vtlc-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    start = datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc)
+    end = datetime.fromisoformat(args.end).replace(tzinfo=timezone.utc)
+
+    source = args.source or join(workdir, 'dump')
+    if args.source is None and not os.path.isdir(source):
+        print('>>> Generating', args.chats, 'chats in', source)
+        for kind, count in writeDump(
+                source,
+                generateDocs(args.chats, start=start, end=end,
+                             seed=args.seed)).items():
+            print(f'>>> {kind}: {count} documents')
+
+    try:
+        results = runBenchmarks(workdir,
+                                args.benchmarks or list(CASES), {
+                                    'source': source,
+                                    'workers': args.workers,
+                                    'budget': args.batch_mb * 1024 * 1024,
+                                },
+                                monthsBetween(start, end),
+                                repeat=args.repeat,
+                                verbose=args.verbose)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results.to_dict(orient='records'), f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {run['benchmark']: run for run in json.load(f)}
+        results = compareResults(results, baseline, args.tolerance)
+
+    print(results.to_string(index=False, float_format='{:.3f}'.format))
+    if args.baseline and results['regressed'].any():
+        sys.exit(1)
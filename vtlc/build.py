@@ -0,0 +1,156 @@
+import argparse
+import subprocess
+import sys
+from glob import iglob
+from os.path import basename, exists, isdir, join
+
+from vtlc.constants import (RAW_DATA_DIR, VTLC_COMPLETE_DIR, VTLC_DIR,
+                            VTLC_ELEMENTS_DIR)
+from vtlc.postprocess import (author_params, event_files, manifest,
+                              period_of, reduced_params)
+from vtlc.util.chatindex import hasChatIndex
+from vtlc.util.hll import hasSketches
+from vtlc.util.rollup import hasRollup
+from vtlc.util.stats import loadCachedStats
+
+# stages of a complete file, after normalize, by file prefix; index only
+# runs with --chat-index
+DOWNSTREAM = {
+    'chats': ['index', 'reduce', 'stats'],
+    'superchats': ['reduce', 'stats'],
+    'ban': ['reduce'],
+    'deletion': ['reduce'],
+}
+
+
+def raw_files(matcher: str):
+    return (event_files(RAW_DATA_DIR, 'ban_events') +
+            event_files(RAW_DATA_DIR, 'deletion_events') +
+            sorted(iglob(join(RAW_DATA_DIR, f'superchats_{matcher}.parquet')))
+            + sorted(iglob(join(RAW_DATA_DIR, f'chats_{matcher}.parquet'))))
+
+
+def partition_missing(directory: str, src: str, layout: str) -> bool:
+    prefix = basename(src).split('_')[0]
+    if layout != 'hive' or prefix not in ('chats', 'superchats'):
+        return False
+    return not isdir(join(directory, prefix, f'period={period_of(src)}'))
+
+
+def normalize_reason(src: str, tgt: str, params: dict, layout: str):
+    checksum = manifest(RAW_DATA_DIR).checksum(src, 'aggregate')
+    reason = manifest(VTLC_COMPLETE_DIR).staleness(
+        tgt, {basename(src): checksum}, params)
+    if reason is None and partition_missing(VTLC_COMPLETE_DIR, tgt, layout):
+        reason = 'partition missing'
+    return reason
+
+
+def downstream_reason(stage: str,
+                      src: str,
+                      inputs: dict,
+                      params: dict,
+                      layout: str,
+                      rollup: bool = False):
+    if stage == 'index':
+        return None if hasChatIndex(RAW_DATA_DIR, src) else 'stale'
+    if stage == 'stats':
+        if loadCachedStats(RAW_DATA_DIR, src) is None or not hasSketches(
+                RAW_DATA_DIR, src):
+            return 'stale'
+        return None
+
+    reason = manifest(VTLC_DIR).staleness(join(VTLC_DIR, basename(src)),
+                                          inputs, params)
+    if reason is None and rollup and not hasRollup(RAW_DATA_DIR, src):
+        reason = 'rollup missing'
+    if reason is None and partition_missing(VTLC_DIR, src, layout):
+        reason = 'partition missing'
+    return reason
+
+
+def plan(matcher: str = '*',
+         layout: str = 'flat',
+         authorKeys: bool = False,
+         chatIndex: bool = False,
+         rollup: bool = False,
+         cluster: bool = False):
+    """
+    (stage, file, reason) of every output `vtlc.postprocess` would rebuild.
+    Outputs of a complete file that is about to be rewritten count as
+    stale, except the reduced file of one that is only relinked, as a link
+    keeps its content.
+    """
+    steps = []
+    for src in raw_files(matcher):
+        prefix = basename(src).split('_')[0]
+        tgt = join(VTLC_COMPLETE_DIR, basename(src))
+        # deletion events never get author keys
+        params = author_params(authorKeys and prefix != 'deletion')
+
+        reason = normalize_reason(src, tgt, params, layout)
+        if reason is not None:
+            steps.append(('normalize', tgt, reason))
+        # the content of the complete file only changes when rebuilt
+        current = reason in (None, 'partition missing')
+        if current:
+            inputs = {
+                basename(tgt):
+                manifest(VTLC_COMPLETE_DIR).checksum(tgt, 'normalize')
+            }
+        elif not params:
+            # a link has the content of its source
+            inputs = {basename(tgt): manifest(RAW_DATA_DIR).checksum(src)}
+        else:
+            inputs = None
+
+        for stage in DOWNSTREAM[prefix]:
+            if stage == 'index' and not chatIndex:
+                continue
+            if current or (stage == 'reduce' and inputs is not None):
+                downstream = downstream_reason(stage, tgt, inputs,
+                                               reduced_params(
+                                                   authorKeys, cluster),
+                                               layout, rollup)
+            else:
+                downstream = 'input rebuilt'
+            if downstream is not None:
+                steps.append((stage, tgt, downstream))
+
+    for name in ('chat_stats.csv', 'superchat_stats.csv'):
+        if not exists(join(VTLC_ELEMENTS_DIR, name)):
+            steps.append(('stats', join(VTLC_ELEMENTS_DIR, name), 'missing'))
+    return steps
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='run vtlc.postprocess when any of its outputs is stale; '
+        'other options are passed on to it')
+    parser.add_argument('-n',
+                        '--dry-run',
+                        action='store_true',
+                        help='only list the stale outputs')
+    parser.add_argument('-m', '--matcher', type=str, default='*')
+    parser.add_argument('--layout', choices=['flat', 'hive'], default='flat')
+    parser.add_argument('--author-keys', action='store_true')
+    parser.add_argument('--chat-index', action='store_true')
+    parser.add_argument('--rollup', action='store_true')
+    parser.add_argument('--cluster', action='store_true')
+    args, _ = parser.parse_known_args()
+
+    steps = plan(args.matcher, args.layout, args.author_keys, args.chat_index,
+                 args.rollup, args.cluster)
+    for stage, path, reason in steps:
+        print(f'{stage:<10} {path} ({reason})')
+    if not steps:
+        print('>>> Up to date')
+    if args.dry_run or not steps:
+        sys.exit(0)
+
+    # keep the checksums taken while planning
+    manifest(RAW_DATA_DIR).save()
+    forwarded = [a for a in sys.argv[1:] if a not in ('-n', '--dry-run')]
+    sys.exit(
+        subprocess.call([sys.executable, '-m', 'vtlc.postprocess'] +
+                        forwarded))
@@ -1,7 +1,7 @@
 import os
 import sys
 from glob import iglob
-from os.path import join
+from os.path import isdir, join
 
 import altair as alt
 import numpy as np
@@ -12,6 +12,8 @@ import plotly.io as pio
 from altair import Axis, Chart, Text, TitleParams, X, Y, datum
 
 from vtlc.constants import VTLC_COMPLETE_DIR, VTLC_DIR, VTLC_ELEMENTS_DIR
+from vtlc.util.dataset import readDataset
+from vtlc.util.overlap import buildAudiences, jaccardMatrix
 
 # Plotly
 
@@ -118,11 +120,58 @@ def load_channels(**kwargs):
     return pd.read_csv(vtlc_elements_path('channels.csv'), **kwargs)
 
 
-def load_complete_chat(month, **kwargs):
+def load_complete_chat(month, channels=None, **kwargs):
+    """
+    Load a month of complete chats.
+    Reads only the channel buckets of `channels` if the partitioned layout
+    is available.
+    """
+    if channels is not None and isdir(vtlc_complete_path('chats')):
+        return readDataset(vtlc_complete_path('chats'),
+                           channelIds=channels,
+                           periods=[month],
+                           columns=kwargs.get('columns')).to_pandas()
     return pd.read_parquet(vtlc_complete_path(f'chats_{month}.parquet'),
                            **kwargs)
 
 
+def load_chats(channels=None, periods=None, columns=None, complete=False):
+    """Load chats of `channels` over `periods` from the partitioned layout"""
+    root = vtlc_complete_path('chats') if complete else vtlc_path('chats')
+    return readDataset(root,
+                       channelIds=channels,
+                       periods=periods,
+                       columns=columns).to_pandas()
+
+
+def load_audiences(channels=None, periods=None):
+    """distinct chatters per channel and month, from the reduced chats"""
+    paths = sorted(iglob(vtlc_path('chats_*.parquet')))
+    if periods is not None:
+        paths = [
+            f for f in paths if any(
+                f.endswith(f'_{period}.parquet') for period in periods)
+        ]
+    return buildAudiences(paths, channelIds=channels)
+
+
+def load_overlaps(affiliation='Hololive', by='englishName', periods=None):
+    """
+    Audience overlap between the channels of `affiliation` (None for all),
+    merged by the `by` column of channels.csv.
+    Returns the intersection sizes and the Jaccard index as N×N frames.
+    """
+    channels = load_channels()
+    if affiliation is not None:
+        channels = channels[channels['affiliation'] == affiliation]
+    channels = channels.dropna(subset=[by])
+    groups = channels.groupby(by)['channelId'].apply(list).to_dict()
+
+    audiences = load_audiences(channels['channelId'], periods)
+    intersections = audiences.overlap(groups)
+    return intersections, jaccardMatrix(intersections)
+
+
 def load_complete_sc(glob_pattern='superchats_*.parquet'):
     df = pd.concat(
         [pd.read_parquet(f) for f in iglob(vtlc_complete_path(glob_pattern))],
@@ -1,19 +1,83 @@
 import argparse
 import gc
-import hashlib
 import os
+import re
 import shutil
 from glob import iglob
-from os.path import basename, join, splitext
+from os.path import basename, exists, isdir, join, splitext
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 from vtlc.constants import (RAW_DATA_DIR, VTLC_COMPLETE_DIR, VTLC_DIR,
                             VTLC_ELEMENTS_DIR)
-from vtlc.util.currency import applyJPY
+from vtlc.util.anonymize import Anonymizer
+from vtlc.util.authors import AuthorDictionary
+from vtlc.util.chatindex import ENTRY, buildChatIndex, hasChatIndex
+from vtlc.util.dataset import writePartitionedMonth
+from vtlc.util.hll import hasSketches, writeSketches
+from vtlc.util.manifest import Manifest, linkFile
+from vtlc.util.parquet import (DEFAULT_BATCH_BUDGET, PUBLIC_PROFILE,
+                               ParquetBatchWriter, clusterParquet,
+                               decodedSize, iterBudgetedBatches, numRows,
+                               writeProfile)
+from vtlc.util.rollup import Rollup, hasRollup, writeRollup
+from vtlc.util.scheduler import runJobs
+from vtlc.util.stats import (COMPACT_ROWS, ChatStats, SuperChatStats,
+                             loadCachedStats, saveCachedStats)
 
 ANONYMIZATION_SALT = os.environ['ANONYMIZATION_SALT']
 
+# decoded copies of a batch alive at once while reducing: source batch,
+# pandas copy for stats, reduced batch and the writer's pending rows
+STREAM_COPIES = 4
+
+PAIR_BYTES = 150
+
+# published files are sorted this way for predicate pushdown
+CLUSTER_KEYS = ['channelId', 'videoId', 'timestamp']
+
+REDUCED_CHAT_SCHEMA = pa.schema([
+    pa.field('timestamp', pa.timestamp('ms', tz='UTC')),
+    pa.field('authorChannelId', pa.string()),
+    pa.field('videoId', pa.string()),
+    pa.field('channelId', pa.string()),
+    pa.field('isMember', pa.bool_()),
+    pa.field('bodyLength', pa.int32()),
+])
+
+REDUCED_BAN_SCHEMA = pa.schema([
+    pa.field('timestamp', pa.timestamp('ms', tz='UTC')),
+    pa.field('authorChannelId', pa.string()),
+    pa.field('videoId', pa.string()),
+    pa.field('channelId', pa.string()),
+])
+
+REDUCED_DELETION_SCHEMA = pa.schema([
+    pa.field('timestamp', pa.timestamp('ms', tz='UTC')),
+    pa.field('id', pa.string()),
+    pa.field('retracted', pa.bool_()),
+    pa.field('videoId', pa.string()),
+    pa.field('channelId', pa.string()),
+])
+
+REDUCED_SC_SCHEMA = pa.schema([
+    pa.field('timestamp', pa.timestamp('ms', tz='UTC')),
+    pa.field('amount', pa.float32()),
+    pa.field('currency', pa.string()),
+    pa.field('significance', pa.int8()),
+    pa.field('authorChannelId', pa.string()),
+    pa.field('videoId', pa.string()),
+    pa.field('channelId', pa.string()),
+    pa.field('bodylength', pa.int64()),
+])
+
+_anonymizer = None
+_authors = None
+_manifests = {}
+
 # utils
 
 
@@ -23,8 +87,413 @@ def binMember(x):
     return False if x == 'non-member' else True
 
 
-def anonymize(s):
-    return hashlib.sha1((s + ANONYMIZATION_SALT).encode()).hexdigest()
+def anonymizer() -> Anonymizer:
+    """shared Anonymizer whose hash cache lives in RAW_DATA_DIR"""
+    global _anonymizer
+    if _anonymizer is None:
+        _anonymizer = Anonymizer(ANONYMIZATION_SALT, RAW_DATA_DIR)
+    return _anonymizer
+
+
+def authors() -> AuthorDictionary:
+    """shared author dictionary kept in RAW_DATA_DIR"""
+    global _authors
+    if _authors is None:
+        _authors = AuthorDictionary(RAW_DATA_DIR)
+    return _authors
+
+
+def manifest(directory: str) -> Manifest:
+    """the manifest of `directory`, loaded once per process"""
+    if directory not in _manifests:
+        _manifests[directory] = Manifest(directory, RAW_DATA_DIR)
+    return _manifests[directory]
+
+
+def with_author_keys(batch) -> pa.Table:
+    """`batch` as a table with an int32 authorKey column"""
+    table = pa.Table.from_batches([batch]) if isinstance(
+        batch, pa.RecordBatch) else batch
+    if 'authorKey' in table.column_names:
+        return table
+    return table.append_column(
+        pa.field('authorKey', pa.int32()),
+        authors().lookup(table.column('authorChannelId')))
+
+
+def estimate_streaming(f: str, columns, budget: int, withStats=False) -> int:
+    """bytes a reduce_month job over `f` is expected to hold at peak"""
+    estimate = min(decodedSize(f, columns), budget) * STREAM_COPIES
+    if withStats:
+        # distinct (channelId, author) pairs kept by the stats accumulator
+        estimate += min(numRows(f), COMPACT_ROWS) * PAIR_BYTES * 2
+    return estimate
+
+
+def finish_month_stats(src: str, stats) -> pd.DataFrame:
+    """persist the month's sketches and return its stats frame"""
+    period_string = period_of(src)
+    writeSketches(RAW_DATA_DIR, src, period_string, stats.sketches)
+
+    stat = stats.result()
+    stat['period'] = period_string
+    return stat
+
+
+def collect_month_stats(src: str, stats, budget: int) -> pd.DataFrame:
+    columns = readable_columns(src, stats.columns + ['authorKey'])
+    for batch in iterBudgetedBatches(src, columns, budget):
+        stats.update(with_author_keys(batch))
+    stat = finish_month_stats(src, stats)
+
+    del stats
+    gc.collect()
+    return stat
+
+
+def _init_month_worker():
+    # months already run side by side; keep hashing in-process
+    global _anonymizer
+    _anonymizer = Anonymizer(ANONYMIZATION_SALT, RAW_DATA_DIR, workers=1)
+
+
+def run_months(paths, fn, args, estimate, workers: int, memory: int):
+    """run `fn(path, *args)` for every path, returning {path: result}"""
+    jobs = [(path, estimate(path), fn, (path, ) + tuple(args))
+            for path in paths]
+    return runJobs(jobs, workers, memory, initializer=_init_month_worker)
+
+
+def cached_months(paths, fn, args, estimate, workers: int, memory: int,
+                  isCurrent=None):
+    """
+    run_months for month stats, skipping months whose cached stats still
+    match the source file (and, given `isCurrent`, whose outputs are current)
+    """
+    record_complete(paths)
+    results = {}
+    stale = []
+    for path in paths:
+        stat = loadCachedStats(RAW_DATA_DIR, path)
+        if stat is not None and hasSketches(RAW_DATA_DIR, path) and (
+                isCurrent is None or isCurrent(path)):
+            results[path] = stat
+        else:
+            stale.append(path)
+    print(f'>>> Stats cached for {len(results)} of {len(paths)} file(s)')
+
+    fresh = run_months(stale, fn, args, estimate, workers, memory)
+    for path, stat in fresh.items():
+        saveCachedStats(RAW_DATA_DIR, path, stat)
+    results.update(fresh)
+    return results
+
+
+def author_params(authorKeys: bool) -> dict:
+    return {'authorKeys': True} if authorKeys else {}
+
+
+def reduced_params(authorKeys: bool, cluster: bool) -> dict:
+    params = author_params(authorKeys)
+    if cluster:
+        params['cluster'] = CLUSTER_KEYS
+    return params
+
+
+def complete_inputs(src: str) -> dict:
+    """checksum of a complete file, as the input of what is built from it"""
+    return {
+        basename(src): manifest(VTLC_COMPLETE_DIR).checksum(src, 'normalize')
+    }
+
+
+def record_complete(paths):
+    """
+    checksum complete files missing from their manifest, so the stats and
+    index fingerprints taken from now on are keyed by content
+    """
+    for src in paths:
+        manifest(VTLC_COMPLETE_DIR).checksum(src, 'normalize')
+    manifest(VTLC_COMPLETE_DIR).save()
+
+
+def record_reduced(paths, authorKeys: bool, cluster: bool = False):
+    """note in the manifest which complete files the reduced ones came from"""
+    public = manifest(VTLC_DIR)
+    params = reduced_params(authorKeys, cluster)
+    for src in paths:
+        tgt = join(VTLC_DIR, basename(src))
+        inputs = complete_inputs(src)
+        if exists(tgt) and not public.isCurrent(tgt, inputs, params):
+            public.record(tgt, 'reduce', inputs, params)
+    public.save()
+    manifest(VTLC_COMPLETE_DIR).save()
+
+
+def reduced_is_current(src: str,
+                       root: str,
+                       layout: str,
+                       authorKeys: bool = False,
+                       rollup: bool = False,
+                       cluster: bool = False) -> bool:
+    tgt = join(VTLC_DIR, basename(src))
+    if not manifest(VTLC_DIR).isCurrent(tgt, complete_inputs(src),
+                                        reduced_params(authorKeys, cluster)):
+        return False
+    if rollup and not hasRollup(RAW_DATA_DIR, src):
+        return False
+    return layout != 'hive' or isdir(join(root, f'period={period_of(src)}'))
+
+
+def stale_reduced(paths,
+                  root: str,
+                  layout: str,
+                  authorKeys: bool,
+                  rollup: bool = False,
+                  cluster: bool = False):
+    return [
+        f for f in paths
+        if not reduced_is_current(f, root, layout, authorKeys, rollup, cluster)
+    ]
+
+
+def upsert_csv(df: pd.DataFrame, path: str):
+    """
+    Merge `df` into the CSV at `path` by (channelId, period). Periods in `df`
+    replace their old rows outright, so channels that vanished from a
+    recomputed month do not linger.
+    """
+    if exists(path):
+        existing = pd.read_csv(path, dtype={'period': str})
+        existing = existing[~existing['period'].isin(df['period'].unique())]
+        df = pd.concat([existing, df], ignore_index=True)
+        df = df.sort_values('period', kind='stable')
+    df.to_csv(path, index=False)
+
+
+def period_of(f: str) -> str:
+    return splitext(basename(f))[0].split('_')[1]
+
+
+def mirror_partitioned(f: str, root: str, layout: str):
+    if layout == 'hive':
+        print('>>> Partitioning:', f)
+        writePartitionedMonth(f, root, period_of(f))
+
+
+def readable_columns(src: str, columns):
+    """`columns` that `src` actually has, in the given order"""
+    names = pq.read_schema(src).names
+    return [name for name in columns if name in names]
+
+
+def copy_with_author_keys(src: str,
+                          tgt: str,
+                          budget: int = DEFAULT_BATCH_BUDGET):
+    schema = pq.read_schema(src).remove_metadata()
+    if 'authorKey' not in schema.names:
+        schema = schema.append(pa.field('authorKey', pa.int32()))
+
+    writer = ParquetBatchWriter(tgt + '.tmp', schema,
+                                writeProfile(rowGroupBytes=budget))
+    try:
+        for batch in iterBudgetedBatches(src, budget=budget):
+            writer.write_table(with_author_keys(batch).cast(schema))
+        writer.close()
+    except BaseException:
+        writer.close()
+        os.remove(tgt + '.tmp')
+        raise
+    os.replace(tgt + '.tmp', tgt)
+
+
+def link_if_changed(src: str, tgt: str, authorKeys: bool = False) -> bool:
+    """
+    Hardlink (or reflink) `src` to `tgt` unless the manifest shows `tgt`
+    was already made from the same content, so unchanged months cost
+    nothing. With `authorKeys` the copy is rewritten with an authorKey
+    column.
+    """
+    checksum = manifest(RAW_DATA_DIR).checksum(src, 'aggregate')
+    inputs = {basename(src): checksum}
+    params = author_params(authorKeys)
+    complete = manifest(VTLC_COMPLETE_DIR)
+    if complete.isCurrent(tgt, inputs, params):
+        return False
+
+    if not authorKeys and exists(tgt) and os.path.samefile(src, tgt):
+        # already linked, only touched since
+        previous = complete.entries.get(basename(tgt), {}).get('inputs')
+        complete.record(tgt, 'normalize', inputs, params, checksum=checksum)
+        return previous != inputs
+
+    if authorKeys:
+        copy_with_author_keys(src, tgt)
+        os.utime(tgt, ns=(os.stat(src).st_atime_ns, os.stat(src).st_mtime_ns))
+        complete.record(tgt, 'normalize', inputs, params)
+    else:
+        print('>>> Linking:', src, f'({linkFile(src, tgt)})')
+        complete.record(tgt, 'normalize', inputs, params, checksum=checksum)
+    return True
+
+
+def normalize_files(paths, layout: str = None, authorKeys: bool = False):
+    for src in paths:
+        tgt = join(VTLC_COMPLETE_DIR, basename(src))
+        changed = link_if_changed(src, tgt, authorKeys)
+        if layout is not None:
+            root = join(VTLC_COMPLETE_DIR, basename(src).split('_')[0])
+            if changed or not isdir(join(root, f'period={period_of(tgt)}')):
+                mirror_partitioned(tgt, root, layout)
+    manifest(RAW_DATA_DIR).save()
+    manifest(VTLC_COMPLETE_DIR).save()
+
+
+def event_files(directory: str, prefix: str):
+    """
+    monthly `{prefix}_%Y-%m.parquet` partitions plus
+    `{prefix}_undated.parquet`, or the single `{prefix}.parquet`
+    """
+    flat = join(directory, f'{prefix}.parquet')
+    undated = join(directory, f'{prefix}_undated.parquet')
+    monthly = re.compile(re.escape(prefix) + r'_\d{4}-\d{2}\.parquet')
+    partitions = sorted(
+        f for f in iglob(join(directory, f'{prefix}_*.parquet'))
+        if monthly.fullmatch(basename(f)))
+    if exists(undated):
+        partitions.append(undated)
+
+    if not partitions:
+        return [flat]
+    if exists(flat):
+        # either layout holds every event; reading both counts them twice
+        raise ValueError(f'both {flat} and its monthly partitions exist; '
+                         'remove one of them')
+    return partitions
+
+
+def bodyLengthColumn(body, type: pa.DataType) -> pa.Array:
+    return pc.fill_null(pc.utf8_length(body), 0).cast(type)
+
+
+def reduce_chat_batch(batch: pa.RecordBatch) -> pa.Table:
+    membership = batch.column('membership')
+
+    # binMember, vectorized
+    isUnknown = pc.fill_null(pc.equal(membership, 'unknown'), False)
+    isMember = pc.if_else(
+        isUnknown, pa.scalar(None, pa.bool_()),
+        pc.fill_null(pc.not_equal(membership, 'non-member'), True))
+
+    return pa.Table.from_arrays([
+        batch.column('timestamp'),
+        anonymizer().column(batch.column('authorChannelId')),
+        batch.column('videoId'),
+        batch.column('channelId'),
+        isMember,
+        bodyLengthColumn(batch.column('body'), pa.int32()),
+    ],
+                                schema=REDUCED_CHAT_SCHEMA)
+
+
+def reduce_superchat_batch(batch: pa.RecordBatch) -> pa.Table:
+    return pa.Table.from_arrays([
+        batch.column('timestamp'),
+        batch.column('amount'),
+        batch.column('currency'),
+        batch.column('significance'),
+        anonymizer().column(batch.column('authorChannelId')),
+        batch.column('videoId'),
+        batch.column('channelId'),
+        bodyLengthColumn(batch.column('body'), pa.int64()),
+    ],
+                                schema=REDUCED_SC_SCHEMA)
+
+
+def reduce_ban_batch(batch: pa.RecordBatch) -> pa.Table:
+    # legacy event files store microsecond timestamps
+    return pa.Table.from_arrays([
+        batch.column('timestamp'),
+        anonymizer().column(batch.column('authorChannelId')),
+        batch.column('videoId'),
+        batch.column('channelId'),
+    ],
+                                names=REDUCED_BAN_SCHEMA.names).cast(
+                                    REDUCED_BAN_SCHEMA)
+
+
+def reduce_deletion_batch(batch: pa.RecordBatch) -> pa.Table:
+    return pa.Table.from_arrays(
+        [batch.column(name) for name in REDUCED_DELETION_SCHEMA.names],
+        names=REDUCED_DELETION_SCHEMA.names).cast(REDUCED_DELETION_SCHEMA)
+
+
+def reduce_month(src: str,
+                 tgt: str,
+                 columns,
+                 reduce,
+                 schema: pa.Schema,
+                 stats=None,
+                 budget: int = DEFAULT_BATCH_BUDGET,
+                 authorKeys: bool = False,
+                 rollup=None,
+                 cluster: bool = False):
+    """
+    Write the reduced copy of `src` batch by batch, feeding the same
+    batches to `stats` and `rollup` so the month is only read once.
+
+    Each batch holds about `budget` decoded bytes and the writer flushes a
+    row group once as much is pending, so peak memory follows the budget
+    rather than the size of the month.
+
+    Stats count distinct authors on their int32 authorKey, and with
+    `authorKeys` the reduced file carries that column too.
+
+    With `cluster` the reduced file is then clustered by CLUSTER_KEYS with
+    small row groups, so reads filtered on a channel skip most of it.
+    """
+    columns = list(columns)
+    for extra in (stats, rollup):
+        if extra is not None:
+            columns += [name for name in extra.columns if name not in columns]
+    keyed = (stats is not None or authorKeys) and 'authorChannelId' in columns
+    columns = readable_columns(src, columns + ['authorKey'])
+
+    authorKeys = authorKeys and keyed
+    if authorKeys:
+        schema = schema.append(pa.field('authorKey', pa.int32()))
+
+    written = tgt + ('.unsorted' if cluster else '.tmp')
+    writer = ParquetBatchWriter(written, schema,
+                                writeProfile(rowGroupBytes=budget))
+    try:
+        for batch in iterBudgetedBatches(src, columns, budget):
+            if keyed:
+                batch = with_author_keys(batch)
+            if stats is not None:
+                stats.update(batch)
+            if rollup is not None:
+                rollup.update(batch)
+            reduced = reduce(batch)
+            if authorKeys:
+                reduced = reduced.append_column(schema.field('authorKey'),
+                                                batch.column('authorKey'))
+            writer.write_table(reduced)
+        writer.close()
+        if cluster:
+            clusterParquet(written, tgt + '.tmp', CLUSTER_KEYS, budget,
+                           PUBLIC_PROFILE)
+    except BaseException:
+        writer.close()
+        for path in (tgt + '.unsorted', tgt + '.tmp'):
+            if exists(path):
+                os.remove(path)
+        raise
+    if cluster:
+        os.remove(written)
+    os.replace(tgt + '.tmp', tgt)
+
+    anonymizer().save()
 
 
 # func
@@ -48,10 +517,10 @@ def load_channels(**kwargs):
 
 
 def load_moderation_events():
-    delet_path = join(RAW_DATA_DIR, 'deletion_events.parquet')
+    delet_paths = event_files(RAW_DATA_DIR, 'deletion_events')
 
-    print('>>> Calculating:', delet_path)
-    delet = pd.read_parquet(delet_path)
+    print('>>> Calculating:', *delet_paths)
+    delet = pd.concat([pd.read_parquet(f) for f in delet_paths])
     delet.set_index('timestamp', inplace=True)
     delet['period'] = delet.index.strftime('%Y-%m')
     delet = delet.query('retracted == 0')
@@ -59,9 +528,9 @@ def load_moderation_events():
         ['channelId', 'period'],
         observed=True)['id'].nunique().rename('deletedChats').reset_index()
 
-    ban_path = join(RAW_DATA_DIR, 'ban_events.parquet')
-    print('>>> Calculating:', ban_path)
-    ban = pd.read_parquet(ban_path)
+    ban_paths = event_files(RAW_DATA_DIR, 'ban_events')
+    print('>>> Calculating:', *ban_paths)
+    ban = pd.concat([pd.read_parquet(f) for f in ban_paths])
     ban.set_index('timestamp', inplace=True)
     ban['period'] = ban.index.strftime('%Y-%m')
     ban = ban.groupby([
@@ -76,125 +545,28 @@ def load_moderation_events():
     return [ban, delet]
 
 
-# for generate_superchat_stats
-def load_superchat(f):
-    print('>>> Calculating:', f)
-    # dtype_dict = {
-    #     'amount': 'float64',
-    #     'currency': 'category',
-    #     'authorChannelId': 'category',
-    #     'channelId': 'category',
-    # }
-    sc = pd.read_parquet(
-        f,
-        columns=[
-            'amount',
-            'currency',
-            'authorChannelId',
-            'channelId',
-            'color',
-            'body',
-        ],
-        #  dtype=dtype_dict
-    )
-
-    sc['amountJPY'] = sc.apply(applyJPY, axis=1)
-    sc['bodyLength'] = sc['body'].str.len()
-
-    # credit: https://stackoverflow.com/a/23692920/2276646
-    mode = lambda x: x.mode()[0] if len(x) > 0 else None
-
-    stat = sc.groupby('channelId', observed=True, sort=False).agg({
-        'authorChannelId': [
-            'size',
-            'nunique',
-        ],
-        'amountJPY': [
-            'sum',
-            'mean',
-        ],
-        'currency':
-        mode,
-        'color':
-        mode,
-        'bodyLength': ['sum', 'mean'],
-    })
-    stat.columns = ['_'.join(col) for col in stat.columns.values]
-    stat.reset_index(inplace=True)
-
-    stat = stat.rename(
-        columns={
-            'authorChannelId_size': 'superChats',
-            'authorChannelId_nunique': 'uniqueSuperChatters',
-            'amountJPY_sum': 'totalSC',
-            'amountJPY_mean': 'averageSC',
-            'bodyLength_sum': 'totalMessageLength',
-            'bodyLength_mean': 'averageMessageLength',
-            'currency_<lambda>': 'mostFrequentCurrency',
-            'color_<lambda>': 'mostFrequentColor',
-        })
-
-    return stat
-
-
-# for generate_chat_stats
-def load_chat(f):
-    print('>>> Calculating:', f)
-    # load chats
-    chat = pd.read_parquet(
-        f,
-        columns=[
-            'authorChannelId',
-            'channelId',
-            'membership',
-        ],
-    )
-
-    # calculate total, unique
-    stat = chat.groupby('channelId', observed=True).agg(
-        {'authorChannelId': ['size', 'nunique']})
-    stat.columns = ['_'.join(col) for col in stat.columns.values]
-    stat.reset_index(inplace=True)
-    stat = stat.rename(
-        columns={
-            'authorChannelId_size': 'chats',
-            'authorChannelId_nunique': 'uniqueChatters'
-        })
-
-    # calculate for members chats
-    mchats = chat[(chat['membership'] != 'non-member')
-                  & (chat['membership'] != 'unknown')]
-    mstat = mchats.groupby('channelId', observed=True).agg(
-        {'authorChannelId': ['size', 'nunique']})
-    mstat.columns = ['_'.join(col) for col in mstat.columns.values]
-    mstat.reset_index(inplace=True)
-    mstat = mstat.rename(
-        columns={
-            'authorChannelId_size': 'memberChats',
-            'authorChannelId_nunique': 'uniqueMembers'
-        })
-    stat = pd.merge(stat, mstat, on='channelId', how='left')
-
-    return stat
+def chat_stat_month(f, budget: int):
+    print('>>> Period:', period_of(f))
+    return collect_month_stats(f, ChatStats(), budget)
 
 
-def generate_chat_stats(matcher: str = '*', append_only: bool = False):
+def generate_chat_stats(matcher: str = '*',
+                        append_only: bool = False,
+                        budget: int = DEFAULT_BATCH_BUDGET,
+                        workers: int = 1,
+                        memory: int = None):
     print('[generate_chat_stats]')
     channel_stats = pd.DataFrame()
 
-    for f in sorted(iglob(join(VTLC_COMPLETE_DIR,
-                               f'chats_{matcher}.parquet'))):
-        period_string = splitext(basename(f))[0].split('_')[1]
-        print('>>> Period:', period_string)
-
-        chat_path = join(VTLC_COMPLETE_DIR,
-                         'chats_' + period_string + '.parquet')
+    paths = sorted(iglob(join(VTLC_COMPLETE_DIR, f'chats_{matcher}.parquet')))
+    results = cached_months(
+        paths, chat_stat_month, (budget, ),
+        lambda f: estimate_streaming(
+            f, ChatStats.columns, budget, withStats=True), workers, memory)
 
-        # calc chat
-        stat = load_chat(chat_path)
-
-        # add period column
-        stat['period'] = period_string
+    for f in paths:
+        period_string = period_of(f)
+        stat = results[f]
 
         print('>>> Info:', period_string)
         stat.info(memory_usage='deep')
@@ -202,8 +574,10 @@ def generate_chat_stats(matcher: str = '*', append_only: bool = False):
         # merge into result df
         channel_stats = pd.concat([channel_stats, stat])
 
-        gc.collect()
+    write_chat_stats(channel_stats, append_only)
+
 
+def write_chat_stats(channel_stats: pd.DataFrame, append_only: bool = False):
     # merge moderation columns
     [ban, delet] = load_moderation_events()
     channel_stats = pd.merge(left=channel_stats,
@@ -235,30 +609,37 @@ def generate_chat_stats(matcher: str = '*', append_only: bool = False):
     # save df as csv
     print('>>> Writing chat statistics')
     channel_stats.info()
-    channel_stats.to_csv(join(RAW_DATA_DIR, 'chat_stats.csv'),
-                         index=False,
-                         header=not append_only,
-                         mode='a' if append_only else 'w')
+    if append_only:
+        upsert_csv(channel_stats, join(RAW_DATA_DIR, 'chat_stats.csv'))
+    else:
+        channel_stats.to_csv(join(RAW_DATA_DIR, 'chat_stats.csv'),
+                             index=False)
 
 
-def generate_superchat_stats(matcher: str = '*', append_only: bool = False):
-    print('[generate_superchat_stats]')
-    stats = pd.DataFrame()
+def superchat_stat_month(f, budget: int):
+    print('>>> Period:', period_of(f))
+    return collect_month_stats(f, SuperChatStats(), budget)
 
-    for f in sorted(
-            iglob(join(VTLC_COMPLETE_DIR, f'superchats_{matcher}.parquet'))):
-        period_string = splitext(basename(f))[0].split('_')[1]
-        print('>>> Period:', period_string)
 
-        sc_path = join(VTLC_COMPLETE_DIR,
-                       'superchats_' + period_string + '.parquet')
+def generate_superchat_stats(matcher: str = '*',
+                             append_only: bool = False,
+                             budget: int = DEFAULT_BATCH_BUDGET,
+                             workers: int = 1,
+                             memory: int = None):
+    print('[generate_superchat_stats]')
+    stats = pd.DataFrame()
 
-        # calc sc
-        stat = load_superchat(sc_path)
-        stat.info()
+    paths = sorted(
+        iglob(join(VTLC_COMPLETE_DIR, f'superchats_{matcher}.parquet')))
+    results = cached_months(
+        paths, superchat_stat_month, (budget, ),
+        lambda f: estimate_streaming(
+            f, SuperChatStats.columns, budget, withStats=True), workers,
+        memory)
 
-        # add period column
-        stat['period'] = period_string
+    for f in paths:
+        period_string = period_of(f)
+        stat = results[f]
 
         print('>>> Info:', period_string)
         stat.info(memory_usage='deep')
@@ -266,8 +647,10 @@ def generate_superchat_stats(matcher: str = '*', append_only: bool = False):
         # merge into result df
         stats = pd.concat([stats, stat])
 
-        gc.collect()
+    write_superchat_stats(stats, append_only)
+
 
+def write_superchat_stats(stats: pd.DataFrame, append_only: bool = False):
     # fillna
     numeric_columns = stats.select_dtypes(include=['number']).columns
     stats[numeric_columns] = stats[numeric_columns].fillna(0).astype('int')
@@ -289,55 +672,56 @@ def generate_superchat_stats(matcher: str = '*', append_only: bool = False):
     # save df as csv
     print('>>> Writing super chat statistics')
     stats.info()
-    stats.to_csv(join(RAW_DATA_DIR, 'superchat_stats.csv'),
-                 index=False,
-                 header=not append_only,
-                 mode='a' if append_only else 'w')
+    if append_only:
+        upsert_csv(stats, join(RAW_DATA_DIR, 'superchat_stats.csv'))
+    else:
+        stats.to_csv(join(RAW_DATA_DIR, 'superchat_stats.csv'), index=False)
 
 
-def normalize_chats(matcher: str = '*'):
+def normalize_chats(matcher: str = '*',
+                    layout: str = 'flat',
+                    authorKeys: bool = False):
     print('[normalize_chats]')
-    for src in sorted(iglob(join(RAW_DATA_DIR, f'chats_{matcher}.parquet'))):
-        tgt = join(VTLC_COMPLETE_DIR, splitext(basename(src))[0] + '.parquet')
-        shutil.copy(src, tgt)
-
-        # print('>>> Loading:', src)
+    normalize_files(
+        sorted(iglob(join(RAW_DATA_DIR, f'chats_{matcher}.parquet'))), layout,
+        authorKeys)
+    # print('>>> Loading:', src)
 
-        # df = pd.read_parquet(src)
+    # df = pd.read_parquet(src)
 
-        # print('>>> Normalizing')
+    # print('>>> Normalizing')
 
-        # print('>>> Saving:', target)
-        # df.to_parquet(target, index=False)
+    # print('>>> Saving:', target)
+    # df.to_parquet(target, index=False)
 
-        # del df
-        # gc.collect()
+    # del df
+    # gc.collect()
 
 
-def normalize_superchats(matcher: str = '*'):
+def normalize_superchats(matcher: str = '*',
+                         layout: str = 'flat',
+                         authorKeys: bool = False):
     print('[normalize_superchats]')
-    for src in sorted(
-            iglob(join(RAW_DATA_DIR, f'superchats_{matcher}.parquet'))):
-        tgt = join(VTLC_COMPLETE_DIR, splitext(basename(src))[0] + '.parquet')
-        shutil.copy(src, tgt)
-        # print('>>> Loading:', src)
+    normalize_files(
+        sorted(iglob(join(RAW_DATA_DIR, f'superchats_{matcher}.parquet'))),
+        layout, authorKeys)
+    # print('>>> Loading:', src)
 
-        # df = pd.read_parquet(src)
+    # df = pd.read_parquet(src)
 
-        # print('>>> Normalizing')
+    # print('>>> Normalizing')
 
-        # print('>>> Saving:', tgt)
-        # df.to_parquet(tgt, index=False)
+    # print('>>> Saving:', tgt)
+    # df.to_parquet(tgt, index=False)
 
-        # del df
-        # gc.collect()
+    # del df
+    # gc.collect()
 
 
-def normalize_ban():
+def normalize_ban(authorKeys: bool = False):
     print('[normalize_ban]')
-    source = join(RAW_DATA_DIR, 'ban_events.parquet')
-    target = join(VTLC_COMPLETE_DIR, 'ban_events.parquet')
-    shutil.copy(source, target)
+    normalize_files(event_files(RAW_DATA_DIR, 'ban_events'),
+                    authorKeys=authorKeys)
     # print('>>> Loading:', source)
     # df = pd.read_parquet(source)
     # print('>>> Saving:', target)
@@ -348,9 +732,7 @@ def normalize_ban():
 
 def normalize_deletion():
     print('[normalize_deletion]')
-    source = join(RAW_DATA_DIR, 'deletion_events.parquet')
-    target = join(VTLC_COMPLETE_DIR, 'deletion_events.parquet')
-    shutil.copy(source, target)
+    normalize_files(event_files(RAW_DATA_DIR, 'deletion_events'))
     # print('>>> Loading:', source)
     # df = pd.read_parquet(source)
     # print('>>> Saving:', target)
@@ -359,145 +741,330 @@ def normalize_deletion():
     # gc.collect()
 
 
-def generate_reduced_chats(matcher: str = '*'):
+REDUCED_CHAT_COLUMNS = [
+    'timestamp',
+    # 'authorName',
+    'body',
+    'membership',
+    # 'isModerator',
+    # 'isVerified',
+    # 'isOwner',
+    # 'id',
+    'authorChannelId',
+    'videoId',
+    'channelId',
+]
+
+REDUCED_SC_COLUMNS = [
+    'timestamp',
+    # 'authorName',
+    'amount',
+    'currency',
+    #  'color',
+    'significance',
+    'body',
+    # 'id',
+    'authorChannelId',
+    'videoId',
+    'channelId',
+]
+
+
+def reduce_chats_month(src: str,
+                       layout: str,
+                       budget: int,
+                       withStats: bool,
+                       authorKeys: bool = False,
+                       rollup: bool = False,
+                       cluster: bool = False):
+    tgt = join(VTLC_DIR, basename(src))
+    print('>>> Reducing:', src)
+
+    stats = ChatStats() if withStats else None
+    cube = Rollup('chats') if rollup else None
+    reduce_month(src, tgt, REDUCED_CHAT_COLUMNS, reduce_chat_batch,
+                 REDUCED_CHAT_SCHEMA, stats, budget, authorKeys, cube, cluster)
+    if cube is not None:
+        writeRollup(RAW_DATA_DIR, src, cube)
+    mirror_partitioned(tgt, join(VTLC_DIR, 'chats'), layout)
+
+    if stats is None:
+        return None
+    stat = finish_month_stats(src, stats)
+
+    del stats
+    gc.collect()
+    return stat
+
+
+def reduce_superchats_month(src: str,
+                            layout: str,
+                            budget: int,
+                            withStats: bool,
+                            authorKeys: bool = False,
+                            rollup: bool = False,
+                            cluster: bool = False):
+    tgt = join(VTLC_DIR, basename(src))
+    print('>>> Reducing:', src)
+
+    stats = SuperChatStats() if withStats else None
+    cube = Rollup('superchats') if rollup else None
+    reduce_month(src, tgt, REDUCED_SC_COLUMNS, reduce_superchat_batch,
+                 REDUCED_SC_SCHEMA, stats, budget, authorKeys, cube, cluster)
+    if cube is not None:
+        writeRollup(RAW_DATA_DIR, src, cube)
+    mirror_partitioned(tgt, join(VTLC_DIR, 'superchats'), layout)
+
+    if stats is None:
+        return None
+    stat = finish_month_stats(src, stats)
+
+    del stats
+    gc.collect()
+    return stat
+
+
+def reduce_events_file(src: str,
+                       kind: str,
+                       reduce,
+                       schema: pa.Schema,
+                       budget: int,
+                       authorKeys: bool = False,
+                       rollup: bool = False,
+                       cluster: bool = False):
+    tgt = join(VTLC_DIR, basename(src))
+    print('>>> Reducing:', src)
+    cube = Rollup(kind) if rollup else None
+    reduce_month(src,
+                 tgt,
+                 schema.names,
+                 reduce,
+                 schema,
+                 budget=budget,
+                 authorKeys=authorKeys,
+                 rollup=cube,
+                 cluster=cluster)
+    if cube is not None:
+        writeRollup(RAW_DATA_DIR, src, cube)
+
+
+def generate_reduced_chats(matcher: str = '*',
+                           layout: str = 'flat',
+                           budget: int = DEFAULT_BATCH_BUDGET,
+                           workers: int = 1,
+                           memory: int = None,
+                           authorKeys: bool = False,
+                           rollup: bool = False,
+                           cluster: bool = False):
     print('[generate_reduced_chats]')
-    for src in sorted(
-            iglob(join(VTLC_COMPLETE_DIR, f'chats_{matcher}.parquet'))):
-        tgt = join(VTLC_DIR, splitext(basename(src))[0] + '.parquet')
-        print('>>> Loading:', src)
-
-        df = pd.read_parquet(
-            src,
-            columns=[
-                'timestamp',
-                # 'authorName',
-                'body',
-                'membership',
-                # 'isModerator',
-                # 'isVerified',
-                # 'isOwner',
-                # 'id',
-                'authorChannelId',
-                'videoId',
-                'channelId',
-            ])
-
-        print('>>> Reducing data')
-
-        # Anonymization
-        df['authorChannelId'] = df['authorChannelId'].apply(anonymize)
-
-        # Convert membership
-        df['isMember'] = df['membership'].apply(binMember)
-        df.drop(columns=['membership'], inplace=True)
-
-        # Drop body
-        df['bodyLength'] = df['body'].str.len().fillna(0).astype('int32')
-        df.drop(columns=['body'], inplace=True)
-
-        print('>>> Saving:', tgt)
-        df.to_parquet(tgt, index=False)
-
-        del df
-        gc.collect()
-
-
-def generate_reduced_superchats(matcher: str = '*'):
+    paths = sorted(iglob(join(VTLC_COMPLETE_DIR, f'chats_{matcher}.parquet')))
+    run_months(
+        stale_reduced(paths, join(VTLC_DIR, 'chats'), layout, authorKeys,
+                      rollup, cluster), reduce_chats_month,
+        (layout, budget, False, authorKeys, rollup, cluster),
+        lambda f: estimate_streaming(f, REDUCED_CHAT_COLUMNS, budget),
+        workers, memory)
+    record_reduced(paths, authorKeys, cluster)
+
+
+def generate_reduced_superchats(matcher: str = '*',
+                                layout: str = 'flat',
+                                budget: int = DEFAULT_BATCH_BUDGET,
+                                workers: int = 1,
+                                memory: int = None,
+                                authorKeys: bool = False,
+                                rollup: bool = False,
+                                cluster: bool = False):
     print('[generate_reduced_superchats]')
-    for source in sorted(
-            iglob(join(VTLC_COMPLETE_DIR, f'superchats_{matcher}.parquet'))):
-        target = join(VTLC_DIR, splitext(basename(source))[0] + '.parquet')
-        print('>>> Loading:', source)
-
-        df = pd.read_parquet(
-            source,
-            columns=[
-                'timestamp',
-                # 'authorName',
-                'amount',
-                'currency',
-                #  'color',
-                'significance',
-                'body',
-                # 'id',
-                'authorChannelId',
-                'videoId',
-                'channelId',
-            ])
-
-        print('>>> Reducing data')
-
-        # Anonymization
-        df['authorChannelId'] = df['authorChannelId'].apply(anonymize)
-
-        # Drop boxy
-        df['bodylength'] = df['body'].str.len().fillna(0).astype('int')
-        df.drop(columns=['body'], inplace=True)
-
-        print('>>> Saving:', target)
-        df.to_parquet(target, index=False)
-
-        del df
-        gc.collect()
-
-
-def generate_reduced_ban():
-    print('[generate_reduced_ban]')
+    paths = sorted(
+        iglob(join(VTLC_COMPLETE_DIR, f'superchats_{matcher}.parquet')))
+    run_months(
+        stale_reduced(paths, join(VTLC_DIR, 'superchats'), layout,
+                      authorKeys, rollup, cluster), reduce_superchats_month,
+        (layout, budget, False, authorKeys, rollup, cluster),
+        lambda f: estimate_streaming(f, REDUCED_SC_COLUMNS, budget),
+        workers, memory)
+    record_reduced(paths, authorKeys, cluster)
+
+
+def process_chats(matcher: str = '*',
+                  layout: str = 'flat',
+                  append_only: bool = False,
+                  budget: int = DEFAULT_BATCH_BUDGET,
+                  workers: int = 1,
+                  memory: int = None,
+                  authorKeys: bool = False,
+                  rollup: bool = False,
+                  cluster: bool = False):
+    """generate_reduced_chats and generate_chat_stats in one read per month"""
+    print('[process_chats]')
+    channel_stats = pd.DataFrame()
 
-    source = join(VTLC_COMPLETE_DIR, 'ban_events.parquet')
-    target = join(VTLC_DIR, 'ban_events.parquet')
+    columns = set(REDUCED_CHAT_COLUMNS) | set(ChatStats.columns)
+    paths = sorted(iglob(join(VTLC_COMPLETE_DIR, f'chats_{matcher}.parquet')))
+    results = cached_months(
+        paths,
+        reduce_chats_month,
+        (layout, budget, True, authorKeys, rollup, cluster),
+        lambda f: estimate_streaming(f, columns, budget, withStats=True),
+        workers,
+        memory,
+        isCurrent=lambda f: reduced_is_current(f, join(
+            VTLC_DIR, 'chats'), layout, authorKeys, rollup, cluster))
+    record_reduced(paths, authorKeys, cluster)
+
+    for src in paths:
+        period_string = period_of(src)
+        stat = results[src]
 
-    print('>>> Loading:', source)
+        print('>>> Info:', period_string)
+        stat.info(memory_usage='deep')
 
-    df = pd.read_parquet(source,
-                         columns=[
-                             'timestamp',
-                             'authorChannelId',
-                             'videoId',
-                             'channelId',
-                         ])
+        channel_stats = pd.concat([channel_stats, stat])
 
-    print('>>> Reducing data')
+    write_chat_stats(channel_stats, append_only)
 
-    # Anonymization
-    df['authorChannelId'] = df['authorChannelId'].apply(anonymize)
 
-    print('>>> Saving:', target)
-    df.to_parquet(target, index=False)
+def process_superchats(matcher: str = '*',
+                       layout: str = 'flat',
+                       append_only: bool = False,
+                       budget: int = DEFAULT_BATCH_BUDGET,
+                       workers: int = 1,
+                       memory: int = None,
+                       authorKeys: bool = False,
+                       rollup: bool = False,
+                       cluster: bool = False):
+    """generate_reduced_superchats and generate_superchat_stats in one read"""
+    print('[process_superchats]')
+    stats = pd.DataFrame()
 
-    del df
-    gc.collect()
+    columns = set(REDUCED_SC_COLUMNS) | set(SuperChatStats.columns)
+    paths = sorted(
+        iglob(join(VTLC_COMPLETE_DIR, f'superchats_{matcher}.parquet')))
+    results = cached_months(
+        paths,
+        reduce_superchats_month,
+        (layout, budget, True, authorKeys, rollup, cluster),
+        lambda f: estimate_streaming(f, columns, budget, withStats=True),
+        workers,
+        memory,
+        isCurrent=lambda f: reduced_is_current(
+            f, join(VTLC_DIR, 'superchats'), layout, authorKeys, rollup,
+            cluster))
+    record_reduced(paths, authorKeys, cluster)
+
+    for source in paths:
+        period_string = period_of(source)
+        stat = results[source]
+
+        print('>>> Info:', period_string)
+        stat.info(memory_usage='deep')
+
+        stats = pd.concat([stats, stat])
+
+    write_superchat_stats(stats, append_only)
 
 
-def generate_reduced_deletion():
+def generate_reduced_ban(budget: int = DEFAULT_BATCH_BUDGET,
+                         workers: int = 1,
+                         memory: int = None,
+                         authorKeys: bool = False,
+                         rollup: bool = False,
+                         cluster: bool = False):
+    print('[generate_reduced_ban]')
+    paths = event_files(VTLC_COMPLETE_DIR, 'ban_events')
+    run_months(
+        stale_reduced(paths, None, 'flat', authorKeys, rollup, cluster),
+        reduce_events_file, ('bans', reduce_ban_batch, REDUCED_BAN_SCHEMA,
+                             budget, authorKeys, rollup, cluster),
+        lambda f: estimate_streaming(f, REDUCED_BAN_SCHEMA.names, budget),
+        workers, memory)
+    record_reduced(paths, authorKeys, cluster)
+
+
+def generate_reduced_deletion(budget: int = DEFAULT_BATCH_BUDGET,
+                              workers: int = 1,
+                              memory: int = None,
+                              authorKeys: bool = False,
+                              rollup: bool = False,
+                              cluster: bool = False):
     print('[generate_reduced_deletion]')
+    paths = event_files(VTLC_COMPLETE_DIR, 'deletion_events')
+    run_months(
+        stale_reduced(paths, None, 'flat', authorKeys, rollup, cluster),
+        reduce_events_file, ('deletions', reduce_deletion_batch,
+                             REDUCED_DELETION_SCHEMA, budget, authorKeys,
+                             rollup, cluster),
+        lambda f: estimate_streaming(f, REDUCED_DELETION_SCHEMA.names, budget),
+        workers, memory)
+    record_reduced(paths, authorKeys, cluster)
 
-    source = join(VTLC_COMPLETE_DIR, 'deletion_events.parquet')
-    target = join(VTLC_DIR, 'deletion_events.parquet')
 
-    print('>>> Loading:', source)
+def estimate_index(f: str) -> int:
+    """sorted entries plus the ids of one row group"""
+    rowGroups = max(pq.ParquetFile(f).metadata.num_row_groups, 1)
+    return 2 * numRows(f) * ENTRY.itemsize + decodedSize(f,
+                                                         ['id']) // rowGroups
 
-    df = pd.read_parquet(source,
-                         columns=[
-                             'timestamp',
-                             'id',
-                             'retracted',
-                             'videoId',
-                             'channelId',
-                         ])
 
-    print('>>> Saving:', target)
-    df.to_parquet(target, index=False)
+def index_chats_month(src: str) -> int:
+    print('>>> Indexing:', src)
+    return buildChatIndex(RAW_DATA_DIR, src)
 
-    del df
-    gc.collect()
+
+def generate_chat_index(matcher: str = '*',
+                        workers: int = 1,
+                        memory: int = None):
+    """chat-id index of the complete chats, to resolve deletion events"""
+    print('[generate_chat_index]')
+    paths = sorted(iglob(join(VTLC_COMPLETE_DIR, f'chats_{matcher}.parquet')))
+    record_complete(paths)
+    run_months([f for f in paths if not hasChatIndex(RAW_DATA_DIR, f)],
+               index_chats_month, (), estimate_index, workers, memory)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='dataset generator')
     parser.add_argument('-m', '--matcher', type=str, default='*')
     parser.add_argument('-a', '--append-only', action='store_true')
+    parser.add_argument('--layout', choices=['flat', 'hive'], default='flat')
+    parser.add_argument('--batch-mb',
+                        type=int,
+                        default=DEFAULT_BATCH_BUDGET // 1024 // 1024,
+                        help='decoded megabytes per streamed batch')
+    parser.add_argument('-w', '--workers', type=int, default=1)
+    parser.add_argument('--memory-gb',
+                        type=float,
+                        default=None,
+                        help='RAM the month jobs may use together '
+                        '(default: 80%% of physical memory)')
+    parser.add_argument('--author-keys',
+                        action='store_true',
+                        help='add an int32 authorKey column to complete and '
+                        'reduced files')
+    parser.add_argument('--chat-index',
+                        action='store_true',
+                        help='index the chat ids of the complete chats')
+    parser.add_argument('--rollup',
+                        action='store_true',
+                        help='build the rollup cube while reducing')
+    parser.add_argument('--cluster',
+                        action='store_true',
+                        help='sort reduced files by channel, video and time')
     args = parser.parse_args()
+    budget = args.batch_mb * 1024 * 1024
+    pool = {
+        'workers':
+        args.workers,
+        'memory':
+        int(args.memory_gb * 1024**3) if args.memory_gb else None,
+        'authorKeys':
+        args.author_keys,
+        'rollup':
+        args.rollup,
+        'cluster':
+        args.cluster,
+    }
 
     print('raw: ' + RAW_DATA_DIR)
     print('complete: ' + VTLC_COMPLETE_DIR)
@@ -505,23 +1072,46 @@ if __name__ == '__main__':
     print('elements: ' + VTLC_ELEMENTS_DIR)
     print('matcher:', args.matcher)
     print('appendOnly:', args.append_only)
+    print('layout:', args.layout)
+    print('batchMB:', args.batch_mb)
+    print('workers:', args.workers)
+    print('authorKeys:', args.author_keys)
+    print('chatIndex:', args.chat_index)
+    print('rollup:', args.rollup)
+    print('cluster:', args.cluster)
 
     # Private datasets
-    normalize_ban()
+    normalize_ban(authorKeys=args.author_keys)
     normalize_deletion()
-    normalize_superchats(matcher=args.matcher)
-    normalize_chats(matcher=args.matcher)
+    normalize_superchats(matcher=args.matcher,
+                         layout=args.layout,
+                         authorKeys=args.author_keys)
+    normalize_chats(matcher=args.matcher,
+                    layout=args.layout,
+                    authorKeys=args.author_keys)
+    if args.chat_index:
+        generate_chat_index(matcher=args.matcher,
+                            workers=pool['workers'],
+                            memory=pool['memory'])
 
     # Public datasets
-    generate_reduced_ban()
-    generate_reduced_deletion()
-    generate_reduced_superchats(matcher=args.matcher)
-    generate_reduced_chats(matcher=args.matcher)
-
-    # Stats
-    generate_superchat_stats(matcher=args.matcher,
-                             append_only=args.append_only)
+    generate_reduced_ban(budget=budget, **pool)
+    generate_reduced_deletion(budget=budget, **pool)
+
+    # Public datasets and stats, reading each month once
+    process_superchats(matcher=args.matcher,
+                       layout=args.layout,
+                       append_only=args.append_only,
+                       budget=budget,
+                       **pool)
     shutil.copy(join(RAW_DATA_DIR, 'superchat_stats.csv'), VTLC_ELEMENTS_DIR)
 
-    generate_chat_stats(matcher=args.matcher, append_only=args.append_only)
+    process_chats(matcher=args.matcher,
+                  layout=args.layout,
+                  append_only=args.append_only,
+                  budget=budget,
+                  **pool)
     shutil.copy(join(RAW_DATA_DIR, 'chat_stats.csv'), VTLC_ELEMENTS_DIR)
+
+    authors().compact()
+    anonymizer().compact()
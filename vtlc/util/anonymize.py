@@ -0,0 +1,190 @@
+import fcntl
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from glob import iglob
+from os.path import join
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from vtlc.util.checkpoint import readJSON, writeJSON
+
+ANONYMIZATION_DIR = '.anonymization'
+
+# below this many unseen ids forking workers costs more than it saves
+PARALLEL_THRESHOLD = 200_000
+CHUNK_SIZE = 50_000
+
+CACHE_SCHEMA = pa.schema([
+    pa.field('authorChannelId', pa.string()),
+    pa.field('hash', pa.string()),
+])
+
+
+def saltedHash(s: str, salt: str) -> str:
+    return hashlib.sha1((s + salt).encode()).hexdigest()
+
+
+def _hashChunk(args):
+    values, salt = args
+    return [saltedHash(s, salt) for s in values]
+
+
+class Anonymizer:
+    """
+    Salted SHA-1 of author ids, computed once per distinct id.
+
+    Hashes are memoized in `directory/.anonymization/<cache id>/` as
+    append-only parts, one per save, that `compact()` folds together. The
+    cache id is random; its `meta.json` holds a salted hash of a random
+    nonce, so the right cache is found for a salt without the name giving
+    the salt away, and rotating the salt never reuses stale hashes.
+    """
+
+    def __init__(self, salt: str, directory: str = None, workers: int = None):
+        self.salt = salt
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = {}
+        # hashes computed since the last save
+        self.unsaved = {}
+
+        self.directory = None
+        self.root = None
+        self.loaded = True
+        if directory is not None:
+            self.directory = join(directory, ANONYMIZATION_DIR)
+            self.loaded = False
+
+    def _find(self):
+        """the cache directory written with this salt, if any"""
+        for path in sorted(iglob(join(self.directory, '*', 'meta.json'))):
+            meta = readJSON(path)
+            if saltedHash(meta['nonce'], self.salt) == meta['check']:
+                return os.path.dirname(path)
+        return None
+
+    def _create(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # another worker may have started the cache meanwhile
+            root = self._find()
+            if root is None:
+                cacheId = uuid.uuid4().hex
+                nonce = uuid.uuid4().hex
+                root = join(self.directory, cacheId)
+                writeJSON(join(root, 'meta.json'), {
+                    'id': cacheId,
+                    'nonce': nonce,
+                    'check': saltedHash(nonce, self.salt),
+                })
+        return root
+
+    def _parts(self):
+        return sorted(iglob(join(self.root, 'part-*.parquet')))
+
+    def _lock(self, kind):
+        lock = open(join(self.root, '.lock'), 'w')
+        fcntl.flock(lock, kind)
+        return lock
+
+    def _readParts(self) -> dict:
+        hashes = {}
+        for path in self._parts():
+            table = pq.read_table(path)
+            hashes.update(
+                zip(table.column('authorChannelId').to_pylist(),
+                    table.column('hash').to_pylist()))
+        return hashes
+
+    def _writePart(self, hashes: dict):
+        path = join(self.root,
+                    f'part-{time.time_ns():019d}-{os.getpid()}.parquet')
+        table = pa.table(
+            [
+                pa.array(list(hashes.keys()), pa.string()),
+                pa.array(list(hashes.values()), pa.string()),
+            ],
+            schema=CACHE_SCHEMA,
+        )
+        pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return path
+
+    def _load(self):
+        """fold the cache on disk into memory, on first use"""
+        self.loaded = True
+        self.root = self._find()
+        if self.root is None:
+            return
+        # compaction removes parts under the exclusive lock
+        with self._lock(fcntl.LOCK_SH):
+            saved = self._readParts()
+        saved.update(self.cache)
+        self.cache = saved
+
+    def hashValues(self, values) -> list:
+        """hash distinct `values`, consulting and filling the cache"""
+        if not self.loaded:
+            self._load()
+        cache = self.cache
+        missing = [s for s in values if s not in cache]
+
+        if missing:
+            if len(missing) >= PARALLEL_THRESHOLD and self.workers > 1:
+                chunks = [(missing[i:i + CHUNK_SIZE], self.salt)
+                          for i in range(0, len(missing), CHUNK_SIZE)]
+                with ProcessPoolExecutor(self.workers) as executor:
+                    hashed = [
+                        h for part in executor.map(_hashChunk, chunks)
+                        for h in part
+                    ]
+            else:
+                hashed = _hashChunk((missing, self.salt))
+            cache.update(zip(missing, hashed))
+            self.unsaved.update(zip(missing, hashed))
+
+        return [cache[s] for s in values]
+
+    def column(self, values) -> pa.Array:
+        """anonymize an Arrow string column, preserving nulls"""
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        encoded = pc.dictionary_encode(values)
+        hashed = pa.array(self.hashValues(encoded.dictionary.to_pylist()),
+                          pa.string())
+        return hashed.take(encoded.indices)
+
+    def save(self):
+        """append the hashes computed since the last save as a new part"""
+        if self.directory is None or not self.unsaved:
+            return
+        if self.root is None:
+            self.root = self._create()
+
+        # parts are written whole and never rewritten, so parallel
+        # workers only have to keep clear of a running compaction
+        with self._lock(fcntl.LOCK_SH):
+            self._writePart(self.unsaved)
+        self.unsaved = {}
+
+    def compact(self):
+        """fold every part into a single one"""
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        if self.root is None:
+            self.root = self._find()
+            if self.root is None:
+                return
+
+        with self._lock(fcntl.LOCK_EX):
+            parts = self._parts()
+            if len(parts) <= 1:
+                return
+            self._writePart(self._readParts())
+            for path in parts:
+                os.remove(path)
@@ -0,0 +1,113 @@
+import fcntl
+import os
+from glob import iglob
+from os.path import basename, join
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+AUTHOR_DIR = 'authors'
+
+AUTHOR_SCHEMA = pa.schema([
+    pa.field('authorChannelId', pa.string()),
+    pa.field('authorKey', pa.int32()),
+])
+
+
+def _firstKey(path: str) -> int:
+    return int(basename(path)[len('part-'):-len('.parquet')])
+
+
+class AuthorDictionary:
+    """
+    Global, append-only mapping of authorChannelId to dense int32 keys.
+
+    Stored as `directory/authors/part-<first key>.parquet`, each part
+    holding a contiguous range of keys. New keys are assigned under an
+    exclusive file lock after catching up with parts written by other
+    processes, so parallel workers always agree on a key. Loading takes the
+    lock shared, so it never reads parts that compaction is replacing.
+    """
+
+    def __init__(self, directory: str):
+        self.root = join(directory, AUTHOR_DIR)
+        self.keys = {}
+        if os.path.isdir(self.root):
+            with self._lock(fcntl.LOCK_SH):
+                self._catchUp()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _lock(self, kind):
+        lock = open(join(self.root, '.lock'), 'w')
+        fcntl.flock(lock, kind)
+        return lock
+
+    def _parts(self):
+        return sorted(iglob(join(self.root, 'part-*.parquet')))
+
+    def _catchUp(self):
+        # callers hold the lock
+        for path in self._parts():
+            first = _firstKey(path)
+            if first + pq.read_metadata(path).num_rows <= len(self.keys):
+                continue
+            table = pq.read_table(path)
+            self.keys.update(
+                zip(table.column('authorChannelId').to_pylist(),
+                    table.column('authorKey').to_pylist()))
+
+    def _writePart(self, first: int, authorChannelIds):
+        path = join(self.root, f'part-{first:010d}.parquet')
+        table = pa.Table.from_arrays([
+            pa.array(authorChannelIds, pa.string()),
+            pa.array(range(first, first + len(authorChannelIds)), pa.int32()),
+        ],
+                                     schema=AUTHOR_SCHEMA)
+        pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def _assign(self, missing):
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock(fcntl.LOCK_EX):
+            self._catchUp()
+
+            missing = [s for s in missing if s not in self.keys]
+            if not missing:
+                return
+            first = len(self.keys)
+            self._writePart(first, missing)
+            self.keys.update(zip(missing, range(first,
+                                                first + len(missing))))
+
+    def lookup(self, authorChannelIds) -> pa.Array:
+        """int32 key of every id, assigning new keys as needed"""
+        if isinstance(authorChannelIds, pa.ChunkedArray):
+            authorChannelIds = authorChannelIds.combine_chunks()
+        encoded = pc.dictionary_encode(authorChannelIds)
+        distinct = encoded.dictionary.to_pylist()
+
+        missing = [s for s in distinct if s not in self.keys]
+        if missing:
+            self._assign(missing)
+
+        keys = pa.array([self.keys[s] for s in distinct], pa.int32())
+        return keys.take(encoded.indices)
+
+    def compact(self):
+        """fold every part into a single one"""
+        if not os.path.isdir(self.root):
+            return
+        with self._lock(fcntl.LOCK_EX):
+            self._catchUp()
+
+            parts = self._parts()
+            if len(parts) <= 1:
+                return
+            ordered = sorted(self.keys, key=self.keys.__getitem__)
+            self._writePart(0, ordered)
+            for path in parts:
+                if _firstKey(path) != 0:
+                    os.remove(path)
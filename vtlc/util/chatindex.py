@@ -0,0 +1,165 @@
+import os
+from glob import iglob
+from os.path import basename, exists, join, splitext
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from vtlc.util.checkpoint import readJSON, writeJSON
+from vtlc.util.hll import hashValues
+from vtlc.util.manifest import recordedChecksum
+
+CHAT_INDEX_DIR = '.chatindex'
+
+# bump whenever the index layout changes, to force a rebuild
+CHAT_INDEX_VERSION = 1
+
+# one fixed-width entry per chat, sorted by key
+ENTRY = np.dtype([
+    ('key', '<u8'),
+    ('rowGroup', '<u4'),
+    ('row', '<u4'),
+])
+
+
+def chatIndexPaths(directory: str, src: str):
+    base = join(directory, CHAT_INDEX_DIR, splitext(basename(src))[0])
+    return base + '.npy', base + '.json'
+
+
+def _fingerprint(directory: str, src: str) -> dict:
+    fingerprint = {
+        'size': os.path.getsize(src),
+        'version': CHAT_INDEX_VERSION,
+    }
+    checksum = recordedChecksum(src, directory)
+    if checksum is not None:
+        fingerprint['checksum'] = checksum
+    else:
+        fingerprint['mtime'] = os.stat(src).st_mtime_ns
+    return fingerprint
+
+
+def hasChatIndex(directory: str, src: str) -> bool:
+    index, meta = chatIndexPaths(directory, src)
+    saved = readJSON(meta)
+    return saved is not None and exists(index) and saved[
+        'fingerprint'] == _fingerprint(directory, src)
+
+
+def buildChatIndex(directory: str, src: str) -> int:
+    """
+    Index the chat ids of `src` as 64-bit hashes sorted alongside their
+    (row group, row), reading one row group of ids at a time.
+    """
+    pf = pq.ParquetFile(src)
+    entries = np.empty(pf.metadata.num_rows, dtype=ENTRY)
+    offset = 0
+    for rowGroup in range(pf.num_row_groups):
+        ids = pf.read_row_group(rowGroup, columns=['id']).column('id')
+        n = len(ids)
+        part = entries[offset:offset + n]
+        part['key'] = hashValues(ids.to_numpy(zero_copy_only=False))
+        part['rowGroup'] = rowGroup
+        part['row'] = np.arange(n, dtype=np.uint32)
+        offset += n
+    entries.sort(order='key', kind='stable')
+
+    index, meta = chatIndexPaths(directory, src)
+    os.makedirs(os.path.dirname(index), exist_ok=True)
+    with open(index + '.tmp', 'wb') as f:
+        np.save(f, entries)
+    os.replace(index + '.tmp', index)
+    # the fingerprint goes last and marks the index as complete
+    writeJSON(meta, {'fingerprint': _fingerprint(directory, src)})
+    return len(entries)
+
+
+def _candidates(index: str, keys: np.ndarray) -> np.ndarray:
+    """entries whose key is one of the sorted `keys`"""
+    entries = np.load(index, mmap_mode='r')
+    lo = np.searchsorted(entries['key'], keys, side='left')
+    hi = np.searchsorted(entries['key'], keys, side='right')
+    counts = hi - lo
+    if not counts.any():
+        return np.empty(0, dtype=ENTRY)
+    # a key may repeat when ids collide; take every entry of its run
+    starts = np.repeat(lo, counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                counts)
+    return np.asarray(entries[starts + steps])
+
+
+def lookupChats(directory: str, ids, paths, columns=None) -> pa.Table:
+    """
+    Chat rows of `ids` found in the indexed monthly files `paths`, reading
+    only the row groups that hold them. `columns` always include id.
+    """
+    wanted = pa.array(list(dict.fromkeys(ids)), pa.string())
+    if columns is not None and 'id' not in columns:
+        columns = list(columns) + ['id']
+
+    tables = []
+    for src in paths:
+        if len(wanted) == 0:
+            break
+        index, _ = chatIndexPaths(directory, src)
+        if not hasChatIndex(directory, src):
+            raise FileNotFoundError(f'no current chat index for {src}')
+
+        keys = np.unique(hashValues(wanted.to_numpy(zero_copy_only=False)))
+        entries = _candidates(index, keys)
+        if len(entries) == 0:
+            continue
+
+        pf = pq.ParquetFile(src)
+        entries.sort(order=['rowGroup', 'row'])
+        groups, starts = np.unique(entries['rowGroup'], return_index=True)
+        for rowGroup, rows in zip(groups, np.split(entries['row'],
+                                                   starts[1:])):
+            table = pf.read_row_group(int(rowGroup), columns=columns)
+            table = table.take(pa.array(rows))
+            # drop hash collisions with ids that were not asked for
+            table = table.filter(
+                pc.is_in(table.column('id'), value_set=wanted))
+            tables.append(table)
+            # chat ids are unique, so found ids need no further months
+            wanted = pc.filter(
+                wanted,
+                pc.invert(
+                    pc.is_in(wanted,
+                             value_set=table.column('id').combine_chunks())))
+
+    if not tables:
+        if not paths:
+            return pa.table({'id': pa.array([], pa.string())})
+        schema = pq.read_schema(paths[0])
+        return schema.empty_table().select(columns or schema.names)
+    return pa.concat_tables(tables)
+
+
+def deletedChats(directory: str,
+                 completeDir: str,
+                 periods=None,
+                 columns=None) -> pa.Table:
+    """
+    Complete chats of `completeDir` removed by deletion events, with the
+    `retracted` flag of their event, looked up through the indexes in
+    `directory` instead of joining every month.
+    """
+    deletions = pa.concat_tables([
+        pq.read_table(f, columns=['id', 'retracted'])
+        for f in sorted(iglob(join(completeDir, 'deletion_events*.parquet')))
+    ])
+    paths = sorted(iglob(join(completeDir, 'chats_*.parquet')))
+    if periods is not None:
+        paths = [
+            f for f in paths if any(
+                f.endswith(f'_{period}.parquet') for period in periods)
+        ]
+    chats = lookupChats(directory,
+                        pc.drop_null(deletions.column('id')).to_pylist(),
+                        paths, columns)
+    return chats.join(deletions, 'id', join_type='left outer')
@@ -0,0 +1,73 @@
+import os
+from os.path import join
+
+from bson import json_util
+
+CHECKPOINT_DIR = '.checkpoints'
+
+JSON_OPTIONS = json_util.JSONOptions(tz_aware=True)
+
+
+def checkpointPath(directory: str, filename: str) -> str:
+    return join(directory, CHECKPOINT_DIR, filename + '.json')
+
+
+def readJSON(path: str):
+    try:
+        with open(path, 'r') as f:
+            return json_util.loads(f.read(), json_options=JSON_OPTIONS)
+    except FileNotFoundError:
+        return None
+
+
+def writeJSON(path: str, obj):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # write-then-rename so a crash never leaves a torn file behind
+    with open(path + '.tmp', 'w') as f:
+        f.write(json_util.dumps(obj, json_options=JSON_OPTIONS))
+    os.replace(path + '.tmp', path)
+
+
+def loadCheckpoint(directory: str, filename: str):
+    return readJSON(checkpointPath(directory, filename))
+
+
+def saveCheckpoint(directory: str, filename: str, last, rows: int,
+                   completed: bool):
+    """
+    Record how far `filename` has been exported.
+    `last` is the greatest (timestamp, _id) pair written so far, or None.
+    """
+    lastTimestamp, lastId = last if last else (None, None)
+    writeJSON(
+        checkpointPath(directory, filename), {
+            'lastTimestamp': lastTimestamp,
+            'lastId': lastId,
+            'rows': rows,
+            'completed': completed,
+        })
+
+
+def resumeQuery(start, end, checkpoint):
+    """timestamp window query that skips documents already exported"""
+    if not checkpoint or checkpoint['lastTimestamp'] is None:
+        return {'timestamp': {'$gte': start, '$lt': end}}
+
+    lastTimestamp = checkpoint['lastTimestamp']
+    return {
+        '$or': [
+            {
+                'timestamp': {
+                    '$gt': lastTimestamp,
+                    '$lt': end
+                }
+            },
+            {
+                'timestamp': lastTimestamp,
+                '_id': {
+                    '$gt': checkpoint['lastId']
+                }
+            },
+        ]
+    }
@@ -2,6 +2,10 @@ import os
 from os import path
 import time
 from functools import lru_cache
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import requests
 
 # convert currency symbol to three-letter string
@@ -71,4 +75,64 @@ def applyJPY(col):
     if math.isinf(res):
         print(col)
         raise col
-    return res
\ No newline at end of file
+    return res
+
+
+def _factorize(values):
+    """codes (-1 for missing) and distinct values of a numpy/pandas or
+    Arrow column"""
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    if isinstance(values, pa.Array):
+        encoded = pc.dictionary_encode(values)
+        codes = pc.fill_null(encoded.indices, -1).to_numpy(
+            zero_copy_only=False)
+        return codes, encoded.dictionary.to_pylist()
+    return pd.factorize(np.asarray(values, dtype=object))
+
+
+def _rowRates(codes, uniques) -> np.ndarray:
+    rates = np.array([getRateToJPY(tls) for tls in uniques] + [np.nan],
+                     dtype='float64')
+    # code -1 (missing) picks the trailing NaN
+    return rates[codes]
+
+
+def ratesToJPY(currencies) -> np.ndarray:
+    """
+    Per-row JPY rate, looking up each distinct currency only once.
+    Missing currencies get NaN.
+    """
+    return _rowRates(*_factorize(currencies))
+
+
+def convertColumnToJPY(amounts,
+                       currencies,
+                       strict: bool = True) -> np.ndarray:
+    """
+    Vectorized convertToJPY over whole columns, either numpy/pandas or
+    Arrow (whose strings are never converted to Python objects per row).
+
+    Rows that do not convert to a finite amount are reported together,
+    grouped by currency; with `strict` a single ValueError is raised,
+    otherwise they are left as NaN/inf.
+    """
+    codes, uniques = _factorize(currencies)
+    if isinstance(amounts, pa.ChunkedArray):
+        amounts = amounts.combine_chunks()
+    if isinstance(amounts, pa.Array):
+        amounts = amounts.to_numpy(zero_copy_only=False)
+    amounts = np.asarray(amounts, dtype='float64')
+    jpy = np.round(amounts * _rowRates(codes, uniques))
+
+    invalid = ~np.isfinite(jpy)
+    if invalid.any():
+        labels = np.array(list(uniques) + [None], dtype=object)
+        report = pd.Series(labels[codes[invalid]]).value_counts(dropna=False)
+        print(f'{invalid.sum()} amount(s) could not be converted to JPY:')
+        print(report.to_string())
+        if strict:
+            raise ValueError(
+                f'{invalid.sum()} amount(s) could not be converted to JPY')
+
+    return jpy
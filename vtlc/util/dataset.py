@@ -0,0 +1,99 @@
+import shutil
+import zlib
+from os.path import isdir, join
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+CHANNEL_BUCKETS = 64
+
+PARTITIONING = ds.partitioning(pa.schema([
+    pa.field('period', pa.string()),
+    pa.field('channel_bucket', pa.int32()),
+]),
+                               flavor='hive')
+
+
+def channelBucket(channelId: str, buckets: int = CHANNEL_BUCKETS) -> int:
+    return zlib.crc32(channelId.encode()) % buckets
+
+
+def channelBucketColumn(channelIds: pa.Array,
+                        buckets: int = CHANNEL_BUCKETS) -> pa.Array:
+    """bucket every row by hashing each distinct channelId only once"""
+    encoded = pc.dictionary_encode(channelIds)
+    hashed = pa.array([
+        channelBucket(channelId, buckets)
+        for channelId in encoded.dictionary.to_pylist()
+    ], pa.int32())
+    return hashed.take(encoded.indices)
+
+
+def partitionBatches(src: str, period: str, buckets: int):
+    pf = pq.ParquetFile(src)
+    for batch in pf.iter_batches():
+        yield pa.RecordBatch.from_arrays(
+            batch.columns + [
+                pa.array([period] * batch.num_rows, pa.string()),
+                channelBucketColumn(batch.column('channelId'), buckets),
+            ],
+            names=batch.schema.names + ['period', 'channel_bucket'])
+
+
+def writePartitionedMonth(src: str,
+                          root: str,
+                          period: str,
+                          buckets: int = CHANNEL_BUCKETS):
+    """
+    Mirror a flat monthly file into
+    `root/period=YYYY-MM/channel_bucket=NN/part-*.parquet`.
+    """
+    schema = pq.read_schema(src)
+    schema = schema.append(pa.field('period', pa.string())).append(
+        pa.field('channel_bucket', pa.int32()))
+
+    # replace the whole period so buckets that vanished do not linger
+    periodDir = join(root, f'period={period}')
+    if isdir(periodDir):
+        shutil.rmtree(periodDir)
+
+    ds.write_dataset(partitionBatches(src, period, buckets),
+                     root,
+                     schema=schema,
+                     format='parquet',
+                     partitioning=PARTITIONING,
+                     basename_template='part-{i}.parquet',
+                     existing_data_behavior='overwrite_or_ignore')
+
+
+def openDataset(root: str) -> ds.Dataset:
+    return ds.dataset(root, format='parquet', partitioning=PARTITIONING)
+
+
+def readDataset(root: str,
+                channelIds=None,
+                periods=None,
+                columns=None,
+                buckets: int = CHANNEL_BUCKETS) -> pa.Table:
+    """
+    Read a partitioned dataset, touching only the periods and channel
+    buckets that can contain the requested rows.
+    """
+    expr = None
+
+    def conjoin(e):
+        return e if expr is None else expr & e
+
+    if periods is not None:
+        expr = conjoin(ds.field('period').isin(list(periods)))
+    if channelIds is not None:
+        channelIds = list(channelIds)
+        expr = conjoin(
+            ds.field('channel_bucket').isin(
+                sorted({channelBucket(c, buckets)
+                        for c in channelIds})))
+        expr = conjoin(ds.field('channelId').isin(channelIds))
+
+    return openDataset(root).to_table(columns=columns, filter=expr)
@@ -0,0 +1,167 @@
+import os
+import re
+from glob import iglob
+from os.path import basename, exists, join, splitext
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# 2^12 registers: about 1.6% standard error, 4 KiB per sketch
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+
+SKETCH_DIR = 'sketches'
+
+# which monthly files hold the sketches of each distinct count
+METRIC_PREFIX = {
+    'uniqueChatters': 'chats',
+    'uniqueMembers': 'chats',
+    'uniqueSuperChatters': 'superchats',
+}
+
+SKETCH_SCHEMA = pa.schema([
+    pa.field('channelId', pa.string()),
+    pa.field('period', pa.string()),
+    pa.field('metric', pa.string()),
+    pa.field('registers', pa.binary()),
+])
+
+_PERIOD = re.compile(r'_(\d{4}-\d{2})\.parquet$')
+
+
+def hashValues(values) -> np.ndarray:
+    """stable 64-bit hashes (SipHash with pandas' fixed key)"""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def _bitLength(x: np.ndarray) -> np.ndarray:
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= np.uint64(1 << shift)
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+def sketchGroups(groups: np.ndarray, hashes: np.ndarray,
+                 ngroups: int) -> np.ndarray:
+    """registers of one sketch per group code, as (ngroups, REGISTERS)"""
+    index = (hashes >> np.uint64(64 - PRECISION)).astype(np.intp)
+    rest = hashes & np.uint64((1 << (64 - PRECISION)) - 1)
+    rank = (64 - PRECISION + 1 - _bitLength(rest)).astype(np.uint8)
+
+    registers = np.zeros((ngroups, REGISTERS), dtype=np.uint8)
+    np.maximum.at(registers, (groups, index), rank)
+    return registers
+
+
+def estimate(registers: np.ndarray) -> float:
+    """HyperLogLog estimate, with linear counting for small cardinalities"""
+    m = REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = np.count_nonzero(registers == 0)
+    if raw <= 2.5 * m and zeros:
+        return m * np.log(m / zeros)
+    return raw
+
+
+class SketchSet:
+    """one HyperLogLog sketch per key, merged across batches"""
+
+    def __init__(self):
+        self.registers = {}
+
+    def update(self, keys, values):
+        """fold in (key, value) pairs given as pandas or Arrow columns"""
+        if isinstance(keys, (pa.Array, pa.ChunkedArray)):
+            present = pc.and_(pc.is_valid(keys), pc.is_valid(values))
+            keys = pc.filter(keys, present)
+            if isinstance(keys, pa.ChunkedArray):
+                keys = keys.combine_chunks()
+            encoded = pc.dictionary_encode(keys)
+            codes = encoded.indices.to_numpy(zero_copy_only=False)
+            uniques = encoded.dictionary.to_pylist()
+            values = pc.filter(values, present).to_pylist()
+        else:
+            present = keys.notna() & values.notna()
+            codes, uniques = pd.factorize(keys[present])
+            values = values[present]
+        if len(uniques) == 0:
+            return
+        batch = sketchGroups(codes, hashValues(values), len(uniques))
+        for key, registers in zip(uniques, batch):
+            current = self.registers.get(key)
+            self.registers[key] = registers if current is None else np.maximum(
+                current, registers)
+
+
+def sketchPath(directory: str, src: str) -> str:
+    return join(directory, SKETCH_DIR, splitext(basename(src))[0] + '.parquet')
+
+
+def writeSketches(directory: str, src: str, period: str, sketches: dict):
+    """persist {metric: SketchSet} for the month of `src`"""
+    rows = [(channelId, metric, registers.tobytes())
+            for metric, sketchSet in sketches.items()
+            for channelId, registers in sketchSet.registers.items()]
+    rows.sort()
+
+    table = pa.Table.from_arrays([
+        pa.array([row[0] for row in rows], pa.string()),
+        pa.array([period] * len(rows), pa.string()),
+        pa.array([row[1] for row in rows], pa.string()),
+        pa.array([row[2] for row in rows], pa.binary()),
+    ],
+                                 schema=SKETCH_SCHEMA)
+
+    path = sketchPath(directory, src)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+
+
+def hasSketches(directory: str, src: str) -> bool:
+    return exists(sketchPath(directory, src))
+
+
+def loadSketches(directory: str, metric: str, channelIds=None, periods=None):
+    """registers of the matching sketches as a (n, REGISTERS) array"""
+    prefix = METRIC_PREFIX[metric]
+    periods = None if periods is None else set(periods)
+    filters = [('metric', '=', metric)]
+    if channelIds is not None:
+        filters.append(('channelId', 'in', list(channelIds)))
+
+    blobs = []
+    for path in sorted(
+            iglob(join(directory, SKETCH_DIR, f'{prefix}_*.parquet'))):
+        match = _PERIOD.search(path)
+        if match is None or (periods is not None
+                             and match.group(1) not in periods):
+            continue
+        table = pq.read_table(path, columns=['registers'], filters=filters)
+        blobs.extend(table.column('registers').to_pylist())
+
+    if not blobs:
+        return np.zeros((0, REGISTERS), dtype=np.uint8)
+    return np.frombuffer(b''.join(blobs), dtype=np.uint8).reshape(
+        len(blobs), REGISTERS)
+
+
+def uniqueCount(directory: str,
+                metric: str,
+                channelIds=None,
+                periods=None) -> float:
+    """
+    Approximate distinct authors over any set of channels and months by
+    merging their sketches; None means all of them.
+    """
+    registers = loadSketches(directory, metric, channelIds, periods)
+    if len(registers) == 0:
+        return 0.0
+    return estimate(np.maximum.reduce(registers, axis=0))
@@ -0,0 +1,172 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+from os.path import basename, dirname, exists, join
+
+import pyarrow.parquet as pq
+
+from vtlc.util.checkpoint import readJSON, writeJSON
+
+MANIFEST_DIR = '.manifests'
+
+CHECKSUM_CHUNK = 4 * 1024 * 1024
+
+# ioctl(FICLONE): share the source's extents on btrfs/xfs
+FICLONE = 0x40049409
+
+
+def manifestPath(root: str, directory: str) -> str:
+    """
+    where the manifest of `directory` is kept under `root`, away from
+    directories that get published
+    """
+    directory = os.path.realpath(directory)
+    digest = hashlib.sha1(directory.encode()).hexdigest()[:8]
+    return join(root, MANIFEST_DIR, f'{basename(directory)}-{digest}.json')
+
+
+def fileChecksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parquetSummary(path: str) -> dict:
+    """row count and timestamp range from the footer, without reading data"""
+    metadata = pq.read_metadata(path)
+    summary = {'rows': metadata.num_rows}
+
+    names = metadata.schema.names
+    if 'timestamp' not in names:
+        return summary
+    column = names.index('timestamp')
+    lows, highs = [], []
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(column).statistics
+        if stats is None or not stats.has_min_max:
+            return summary
+        lows.append(stats.min)
+        highs.append(stats.max)
+    if lows:
+        summary['minTimestamp'] = min(lows)
+        summary['maxTimestamp'] = max(highs)
+    return summary
+
+
+def linkFile(src: str, tgt: str) -> str:
+    """
+    Make `tgt` a hardlink to `src`, else a reflink, else a copy keeping
+    its mtime. Returns which one was made.
+    """
+    # renaming a link over its own file is a no-op that leaves the link
+    if exists(tgt) and os.path.samefile(src, tgt):
+        return 'hardlink'
+    tmp = tgt + '.tmp'
+    if exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+        method = 'hardlink'
+    except OSError:
+        method = 'reflink'
+        try:
+            with open(src, 'rb') as s, open(tmp, 'wb') as t:
+                fcntl.ioctl(t.fileno(), FICLONE, s.fileno())
+            shutil.copystat(src, tmp)
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                               errno.EINVAL, errno.ENOSYS):
+                raise
+            method = 'copy'
+            shutil.copy2(src, tmp)
+    os.replace(tmp, tgt)
+    return method
+
+
+class Manifest:
+    """
+    What every file of `directory` was built from: checksum, row count,
+    timestamp range, producing stage, its parameters and the checksums of
+    its inputs. Checksums are only recomputed when size or mtime change.
+    The manifest itself is kept under `root`.
+    """
+
+    def __init__(self, directory: str, root: str):
+        self.directory = directory
+        self.path = manifestPath(root, directory)
+        saved = readJSON(self.path) or {}
+        self.entries = saved.get('files', {})
+
+    def _unchanged(self, path: str):
+        entry = self.entries.get(basename(path))
+        if entry is None or not exists(path):
+            return None
+        stat = os.stat(path)
+        if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+            return None
+        return entry
+
+    def checksum(self, path: str, stage: str = None) -> str:
+        entry = self._unchanged(path)
+        if entry is not None:
+            return entry['checksum']
+        return self.record(path, stage)['checksum']
+
+    def staleness(self, path: str, inputs: dict, params=None):
+        """
+        why `path` must be rebuilt from `inputs` ({name: checksum}) with
+        `params`, or None when it already was
+        """
+        if not exists(path):
+            return 'missing'
+        if basename(path) not in self.entries:
+            return 'untracked'
+        entry = self._unchanged(path)
+        if entry is None:
+            return 'modified'
+        if entry['inputs'] != inputs:
+            return 'inputs changed'
+        if entry['params'] != (params or {}):
+            return 'parameters changed'
+        return None
+
+    def isCurrent(self, path: str, inputs: dict, params=None) -> bool:
+        return self.staleness(path, inputs, params) is None
+
+    def record(self,
+               path: str,
+               stage: str = None,
+               inputs=None,
+               params=None,
+               checksum: str = None):
+        """describe `path`; pass `checksum` when its content is known"""
+        stat = os.stat(path)
+        entry = {
+            'checksum': checksum or fileChecksum(path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'stage': stage,
+            'inputs': inputs or {},
+            'params': params or {},
+        }
+        if path.endswith('.parquet'):
+            entry.update(parquetSummary(path))
+        self.entries[basename(path)] = entry
+        return entry
+
+    def save(self):
+        writeJSON(self.path, {'files': self.entries})
+
+
+def recordedChecksum(path: str, root: str):
+    """
+    checksum the manifest of the directory of `path`, kept under `root`,
+    holds for it, as long as the file was not modified since; fingerprints
+    built on it survive a touch
+    """
+    entry = Manifest(dirname(path), root)._unchanged(path)
+    return None if entry is None else entry['checksum']
@@ -1,5 +1,11 @@
 import re
 
+import pyarrow as pa
+import pyarrow.compute as pc
+
+EMOJI_PATTERN = "\ufff9.+?\ufffb"
+EMOJI_REGEX = re.compile(EMOJI_PATTERN)
+
 
 def convertRawMessageToString(rawMessage):
 
@@ -26,9 +32,28 @@ def convertRawMessageToString(rawMessage):
 
 
 def replaceEmojiWithReplacement(message: str):
-    p = re.compile("\ufff9.+?\ufffb")
     """
     Replacement character U+FFFD
     https://en.wikipedia.org/wiki/Specials_(Unicode_block)#Replacement_character
     """
-    return p.sub("\ufffd", message)
+    return EMOJI_REGEX.sub("\ufffd", message)
+
+
+def replaceEmojiWithReplacementColumn(messages: pa.Array) -> pa.Array:
+    """vectorized replaceEmojiWithReplacement over an Arrow string column"""
+    return pc.replace_substring_regex(messages,
+                                      pattern=EMOJI_PATTERN,
+                                      replacement="\ufffd")
+
+
+def cleanMessageColumn(messages: pa.Array, emptyAsNull: bool = False):
+    """
+    Clean a whole column of raw messages at once.
+    Returns the cleaned column and a mask of the rows that carry a message.
+    """
+    hasMessage = pc.is_valid(messages)
+    body = replaceEmojiWithReplacementColumn(messages)
+    if emptyAsNull:
+        body = pc.if_else(pc.not_equal(messages, ""), body,
+                          pa.scalar(None, pa.string()))
+    return body, hasMessage
@@ -0,0 +1,169 @@
+import re
+from os.path import basename
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from vtlc.util.hll import hashValues
+from vtlc.util.parquet import DEFAULT_BATCH_BUDGET, iterBudgetedBatches
+
+_PERIOD = re.compile(r'_(\d{4}-\d{2})\.parquet$')
+
+
+def authorIds(batch) -> np.ndarray:
+    """
+    uint64 id of every row's author, a 64-bit hash of authorChannelId.
+    authorKey is not used even where present: files without one would
+    give the same chatter a second id.
+    """
+    return hashValues(batch.column('authorChannelId').to_numpy(
+        zero_copy_only=False))
+
+
+class Audiences:
+    """
+    Distinct chatters of each (channelId, period), kept as sorted uint64
+    arrays so unions and intersections stay cheap.
+    """
+
+    def __init__(self):
+        self.parts = {}
+        self.sets = {}
+
+    def update(self, period: str, batch):
+        present = pc.and_(pc.is_valid(batch.column('channelId')),
+                          pc.is_valid(batch.column('authorChannelId')))
+        batch = batch.filter(present)
+        if batch.num_rows == 0:
+            return
+
+        codes, channelIds = pd.factorize(
+            batch.column('channelId').to_numpy(zero_copy_only=False))
+        authors = authorIds(batch)
+
+        order = np.lexsort((authors, codes))
+        codes, authors = codes[order], authors[order]
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (authors[1:] != authors[:-1])
+        codes, authors = codes[keep], authors[keep]
+
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        for chunk in np.split(np.arange(len(codes)), bounds):
+            key = (channelIds[codes[chunk[0]]], period)
+            self.parts.setdefault(key, []).append(authors[chunk])
+
+    def _collapse(self):
+        for key, parts in self.parts.items():
+            if key in self.sets:
+                parts = parts + [self.sets[key]]
+            self.sets[key] = np.unique(np.concatenate(parts))
+        self.parts = {}
+
+    def channels(self) -> list:
+        self._collapse()
+        return sorted({channelId for channelId, _ in self.sets})
+
+    def periods(self) -> list:
+        self._collapse()
+        return sorted({period for _, period in self.sets})
+
+    def members(self, channelIds, periods=None) -> np.ndarray:
+        """union of the audiences of `channelIds` over `periods`"""
+        self._collapse()
+        channelIds = set(channelIds)
+        periods = None if periods is None else set(periods)
+        sets = [
+            authors for (channelId, period), authors in self.sets.items()
+            if channelId in channelIds and (periods is None
+                                            or period in periods)
+        ]
+        if not sets:
+            return np.zeros(0, dtype=np.uint64)
+        return np.unique(np.concatenate(sets))
+
+    def overlap(self,
+                groups=None,
+                periods=None,
+                budget: int = DEFAULT_BATCH_BUDGET) -> pd.DataFrame:
+        """
+        Chatters shared by every pair of `groups`, a {label: [channelId]}
+        mapping defaulting to one group per channel.
+        """
+        if groups is None:
+            groups = {channelId: [channelId] for channelId in self.channels()}
+        return overlapMatrix(
+            {
+                label: self.members(channelIds, periods)
+                for label, channelIds in groups.items()
+            }, budget)
+
+
+def overlapMatrix(sets: dict, budget: int = DEFAULT_BATCH_BUDGET
+                  ) -> pd.DataFrame:
+    """
+    N×N intersection sizes of the sorted id arrays in `sets`, with each
+    set's size on the diagonal.
+
+    Ids are renumbered densely and the id × set incidence matrix is
+    multiplied with itself block by block, each block holding about
+    `budget` bytes.
+    """
+    labels = list(sets)
+    n = len(labels)
+    counts = np.zeros((n, n), dtype=np.int64)
+    sizes = [len(sets[label]) for label in labels]
+    if sum(sizes) == 0:
+        return pd.DataFrame(counts, index=labels, columns=labels)
+
+    columns = np.repeat(np.arange(n), sizes)
+    ids, rows = np.unique(np.concatenate([sets[label] for label in labels]),
+                          return_inverse=True)
+    order = np.argsort(rows, kind='stable')
+    rows, columns = rows[order], columns[order]
+
+    step = max(1, budget // (n * 4))
+    for start in range(0, len(ids), step):
+        lo, hi = np.searchsorted(rows, [start, start + step])
+        block = np.zeros((min(step, len(ids) - start), n), dtype=np.float32)
+        block[rows[lo:hi] - start, columns[lo:hi]] = 1
+        counts += (block.T @ block).astype(np.int64)
+
+    return pd.DataFrame(counts, index=labels, columns=labels)
+
+
+def jaccardMatrix(intersections: pd.DataFrame) -> pd.DataFrame:
+    """|A ∩ B| / |A ∪ B| from an overlapMatrix"""
+    counts = intersections.to_numpy(dtype=np.float64)
+    sizes = np.diag(counts)
+    unions = sizes[:, None] + sizes[None, :] - counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jaccard = np.where(unions > 0, counts / unions, 0.0)
+    return pd.DataFrame(jaccard,
+                        index=intersections.index,
+                        columns=intersections.columns)
+
+
+def buildAudiences(paths,
+                   channelIds=None,
+                   budget: int = DEFAULT_BATCH_BUDGET) -> Audiences:
+    """
+    Stream monthly chat files (`chats_YYYY-MM.parquet`) into Audiences,
+    reading only channelId and authorChannelId.
+    """
+    audiences = Audiences()
+    wanted = None if channelIds is None else pa.array(list(channelIds),
+                                                      pa.string())
+    for path in paths:
+        match = _PERIOD.search(basename(path))
+        if match is None:
+            continue
+        for batch in iterBudgetedBatches(path,
+                                         ['channelId', 'authorChannelId'],
+                                         budget):
+            if wanted is not None:
+                batch = batch.filter(
+                    pc.is_in(batch.column('channelId'), value_set=wanted))
+            audiences.update(match.group(1), batch)
+    return audiences
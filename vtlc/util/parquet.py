@@ -0,0 +1,301 @@
+import argparse
+import os
+import tempfile
+import time
+from os.path import basename, getsize, join
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# low-cardinality columns worth dictionary-encoding
+DICTIONARY_COLUMNS = [
+    'channelId',
+    'videoId',
+    'membership',
+    'currency',
+    'color',
+]
+
+DEFAULT_PROFILE = {
+    'compression': 'snappy',
+    'compressionLevel': None,
+    'rowGroupRows': 1_000_000,
+    'rowGroupBytes': 128 * 1024 * 1024,
+    'dictionaryColumns': DICTIONARY_COLUMNS,
+    'writeStatistics': True,
+}
+
+# what the exporter used to produce: one row group per 1,000 rows
+LEGACY_PROFILE = {
+    'compression': 'snappy',
+    'compressionLevel': None,
+    'rowGroupRows': 1_000,
+    'rowGroupBytes': None,
+    'dictionaryColumns': None,
+    'writeStatistics': True,
+}
+
+# published files: small row groups with statistics, so filtered reads
+# of a few channels skip most of the file
+PUBLIC_PROFILE = dict(DEFAULT_PROFILE,
+                      rowGroupRows=128 * 1024,
+                      rowGroupBytes=16 * 1024 * 1024)
+
+
+# decoded bytes a streaming reader should hold per batch
+DEFAULT_BATCH_BUDGET = 64 * 1024 * 1024
+
+# read column chunks page by page instead of whole
+READ_BUFFER_SIZE = 1024 * 1024
+
+PROBE_ROWS = 1024
+
+
+def decodedSize(path: str, columns=None) -> int:
+    """uncompressed bytes of `columns` in `path`, read from the footer"""
+    metadata = pq.ParquetFile(path).metadata
+    size = 0
+    for i in range(metadata.num_row_groups):
+        rowGroup = metadata.row_group(i)
+        for j in range(rowGroup.num_columns):
+            column = rowGroup.column(j)
+            if columns is None or column.path_in_schema in columns:
+                size += column.total_uncompressed_size
+    return size
+
+
+def numRows(path: str) -> int:
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def writeProfile(compression=None,
+                 compressionLevel=None,
+                 rowGroupRows=None,
+                 rowGroupBytes=None):
+    """DEFAULT_PROFILE with the given overrides applied"""
+    profile = dict(DEFAULT_PROFILE)
+    overrides = {
+        'compression': compression,
+        'compressionLevel': compressionLevel,
+        'rowGroupRows': rowGroupRows,
+        'rowGroupBytes': rowGroupBytes,
+    }
+    profile.update({k: v for k, v in overrides.items() if v is not None})
+    return profile
+
+
+class ParquetBatchWriter:
+    """
+    ParquetWriter that buffers incoming tables into row groups of
+    `rowGroupRows` rows, or fewer once `rowGroupBytes` bytes are pending.
+    """
+
+    def __init__(self, where, schema: pa.Schema, profile=None):
+        profile = profile or DEFAULT_PROFILE
+        dictionaryColumns = profile['dictionaryColumns']
+
+        self.schema = schema
+        self.rowGroupRows = profile['rowGroupRows']
+        self.rowGroupBytes = profile['rowGroupBytes']
+        self.writer = pq.ParquetWriter(
+            where,
+            schema,
+            compression=profile['compression'],
+            compression_level=profile['compressionLevel'],
+            use_dictionary=True if dictionaryColumns is None else
+            [name for name in dictionaryColumns if name in schema.names],
+            write_statistics=profile['writeStatistics'])
+
+        self.pending = []
+        self.pendingRows = 0
+        self.pendingBytes = 0
+
+    def write_table(self, table: pa.Table):
+        self.pending.append(table)
+        self.pendingRows += table.num_rows
+        self.pendingBytes += table.nbytes
+
+        if self.rowGroupRows and self.pendingRows >= self.rowGroupRows:
+            # emit full row groups and keep the remainder buffered
+            table = pa.concat_tables(self.pending)
+            while table.num_rows >= self.rowGroupRows:
+                self.writer.write_table(table.slice(0, self.rowGroupRows),
+                                        row_group_size=self.rowGroupRows)
+                table = table.slice(self.rowGroupRows)
+
+            self.pendingBytes = self.pendingBytes * table.num_rows // max(
+                self.pendingRows, 1)
+            self.pendingRows = table.num_rows
+            self.pending = [table] if table.num_rows else []
+
+        if self.rowGroupBytes and self.pendingBytes >= self.rowGroupBytes:
+            self.flush()
+
+    def flush(self):
+        if self.pendingRows > 0:
+            table = pa.concat_tables(self.pending)
+            self.writer.write_table(table, row_group_size=table.num_rows)
+
+        self.pending = []
+        self.pendingRows = 0
+        self.pendingBytes = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def iterBudgetedBatches(src,
+                        columns=None,
+                        budget: int = DEFAULT_BATCH_BUDGET):
+    """
+    iter_batches over `src` with batches sized to hold about `budget` bytes
+    once decoded, estimated from a small probe batch
+    """
+    pf = pq.ParquetFile(src, buffer_size=READ_BUFFER_SIZE, pre_buffer=False)
+    if pf.metadata.num_rows == 0:
+        return
+
+    probe = next(pf.iter_batches(batch_size=PROBE_ROWS, columns=columns))
+    rowBytes = max(probe.nbytes / max(probe.num_rows, 1), 1)
+    batchSize = max(int(budget // rowBytes), 1)
+    del probe
+
+    yield from pf.iter_batches(batch_size=batchSize, columns=columns)
+
+
+def _keyRuns(src, key: str, budget: int) -> dict:
+    """
+    Map every value of `key` to a run, runs covering consecutive values in
+    sort order (nulls last) and holding about `budget` decoded bytes each
+    """
+    metadata = pq.read_metadata(src)
+    rowBytes = max(decodedSize(src) / max(metadata.num_rows, 1), 1)
+
+    counts = {}
+    for batch in iterBudgetedBatches(src, [key], budget):
+        valueCounts = pc.value_counts(batch.column(key))
+        for value, count in zip(valueCounts.field('values').to_pylist(),
+                                valueCounts.field('counts').to_pylist()):
+            counts[value] = counts.get(value, 0) + count
+
+    runs = {}
+    run, size = 0, 0
+    values = sorted(v for v in counts if v is not None)
+    for value in values + ([None] if None in counts else []):
+        if size and size + counts[value] * rowBytes > budget:
+            run, size = run + 1, 0
+        runs[value] = run
+        size += counts[value] * rowBytes
+    return runs
+
+
+def clusterParquet(src,
+                   tgt,
+                   keys,
+                   budget: int = DEFAULT_BATCH_BUDGET,
+                   profile=None):
+    """
+    Rewrite `src` into `tgt` sorted by `keys` while holding about `budget`
+    decoded bytes at a time.
+
+    Rows are first spread over run files of consecutive `keys[0]` values,
+    each about `budget` bytes, then every run is sorted in memory and
+    appended in order.
+    """
+    schema = pq.read_schema(src)
+    order = [(key, 'ascending') for key in keys]
+    writer = ParquetBatchWriter(tgt, schema, profile)
+
+    runs = _keyRuns(src, keys[0], budget)
+    if len(set(runs.values())) <= 1:
+        writer.write_table(pq.read_table(src).sort_by(order))
+        writer.close()
+        return
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(tgt) or '.') as tmp:
+        writers = {}
+        for batch in iterBudgetedBatches(src, budget=budget):
+            encoded = pc.dictionary_encode(batch.column(keys[0]))
+            lookup = np.array(
+                [runs[value] for value in encoded.dictionary.to_pylist()] +
+                [runs.get(None, 0)])
+            # index -1 (null) picks the trailing run of nulls
+            runIds = lookup[pc.fill_null(encoded.indices, -1).to_numpy(
+                zero_copy_only=False)]
+
+            perm = np.argsort(runIds, kind='stable')
+            table = pa.Table.from_batches([batch]).take(pa.array(perm))
+            present, starts = np.unique(runIds[perm], return_index=True)
+            ends = list(starts[1:]) + [len(perm)]
+            for run, start, end in zip(present, starts, ends):
+                if run not in writers:
+                    writers[run] = pq.ParquetWriter(
+                        join(tmp, f'run-{run:06d}.parquet'), schema)
+                writers[run].write_table(table.slice(start, end - start))
+
+        for run in sorted(writers):
+            writers[run].close()
+            path = join(tmp, f'run-{run:06d}.parquet')
+            writer.write_table(pq.read_table(path).sort_by(order))
+            os.remove(path)
+
+    writer.close()
+
+
+def rewrite(src, tgt, profile):
+    pf = pq.ParquetFile(src)
+    writer = ParquetBatchWriter(tgt, pf.schema_arrow, profile)
+    for batch in pf.iter_batches():
+        writer.write_table(pa.Table.from_batches([batch], pf.schema_arrow))
+    writer.close()
+
+
+def compareProfiles(src, profiles):
+    """rewrite `src` with each profile and report file size and read time"""
+    report = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, profile in profiles.items():
+            tgt = join(tmpdir, f'{name}_{basename(src)}')
+            rewrite(src, tgt, profile)
+
+            start = time.perf_counter()
+            pd.read_parquet(tgt)
+            elapsed = time.perf_counter() - start
+
+            report.append({
+                'profile': name,
+                'sizeMB': getsize(tgt) / 1024 / 1024,
+                'rowGroups': pq.ParquetFile(tgt).num_row_groups,
+                'readSeconds': elapsed,
+            })
+            os.remove(tgt)
+
+    return pd.DataFrame(report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='compare parquet write profiles')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('-c', '--compression', type=str, default=None)
+    parser.add_argument('-l', '--compression-level', type=int, default=None)
+    parser.add_argument('--row-group-rows', type=int, default=None)
+    parser.add_argument('--row-group-bytes', type=int, default=None)
+    args = parser.parse_args()
+
+    profile = writeProfile(compression=args.compression,
+                           compressionLevel=args.compression_level,
+                           rowGroupRows=args.row_group_rows,
+                           rowGroupBytes=args.row_group_bytes)
+
+    for f in args.files:
+        print('>>> Comparing:', f)
+        print(
+            compareProfiles(f, {
+                'legacy': LEGACY_PROFILE,
+                'profile': profile
+            }).to_string(index=False))
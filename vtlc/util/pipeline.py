@@ -0,0 +1,91 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+def _put(q, item, stop):
+    """blocking put that gives up once `stop` is set"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def pipelined(source, transform, sink, depth=4):
+    """
+    Run `source` -> `transform` -> `sink` as overlapping stages.
+
+    A fetcher thread drains `source` and a converter thread applies
+    `transform`, both through queues bounded by `depth`; the calling thread
+    hands results to `sink` in source order. This only overlaps I/O with
+    conversion: `transform` holds the GIL, so more converter threads would
+    not convert any faster. An error in any stage stops every stage and is
+    re-raised here.
+    """
+    stop = threading.Event()
+    errors = []
+    inbox = queue.Queue(depth)
+    outbox = queue.Queue(depth)
+
+    def fail(e):
+        errors.append(e)
+        stop.set()
+
+    def fetch():
+        try:
+            for item in source:
+                if not _put(inbox, item, stop):
+                    return
+        except BaseException as e:
+            fail(e)
+        finally:
+            _put(inbox, _DONE, stop)
+
+    def convert():
+        try:
+            while True:
+                item = _get(inbox, stop)
+                if item is _DONE:
+                    break
+                if not _put(outbox, transform(item), stop):
+                    return
+        except BaseException as e:
+            fail(e)
+        finally:
+            _put(outbox, _DONE, stop)
+
+    threads = [
+        threading.Thread(target=fetch, daemon=True),
+        threading.Thread(target=convert, daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = _get(outbox, stop)
+            if item is _DONE:
+                break
+            sink(item)
+    except BaseException as e:
+        fail(e)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
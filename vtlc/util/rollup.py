@@ -0,0 +1,221 @@
+import os
+from glob import iglob
+from os.path import basename, exists, join
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from vtlc.util.currency import convertColumnToJPY
+from vtlc.util.stats import COMPACT_ROWS, isMemberChat
+
+ROLLUP_DIR = 'rollup'
+
+# bucket width of each stored resolution, in milliseconds
+RESOLUTIONS = {
+    'minute': 60 * 1000,
+    'hour': 60 * 60 * 1000,
+    'day': 24 * 60 * 60 * 1000,
+}
+
+KEYS = ['channelId', 'videoId', 'bucket']
+
+BUCKET_TYPE = pa.timestamp('ms', tz='UTC')
+
+MEASURES = [
+    'chats', 'memberChats', 'superChats', 'superChatJPY', 'bans', 'deletions'
+]
+
+
+def _ones(batch) -> pa.Array:
+    return pa.array(np.ones(batch.num_rows, dtype=np.int32))
+
+
+def _chatMeasures(batch):
+    return {
+        'chats': _ones(batch),
+        'memberChats': isMemberChat(batch.column('membership')).cast(
+            pa.int32()),
+    }
+
+
+def _superChatMeasures(batch):
+    return {
+        'superChats':
+        _ones(batch),
+        'superChatJPY':
+        pa.array(
+            convertColumnToJPY(batch.column('amount'),
+                               batch.column('currency'))).cast(pa.int64()),
+    }
+
+
+def _banMeasures(batch):
+    return {'bans': _ones(batch)}
+
+
+def _deletionMeasures(batch):
+    # retracted messages were removed by their author, not a moderator
+    return {
+        'deletions':
+        pc.fill_null(pc.invert(batch.column('retracted')),
+                     False).cast(pa.int32())
+    }
+
+
+# kind -> (source columns, measures of a batch)
+KINDS = {
+    'chats': (['membership'], _chatMeasures),
+    'superchats': (['amount', 'currency'], _superChatMeasures),
+    'bans': ([], _banMeasures),
+    'deletions': (['retracted'], _deletionMeasures),
+}
+
+
+def _floor(bucket, width: int) -> pa.Array:
+    if isinstance(bucket, pa.ChunkedArray):
+        bucket = bucket.combine_chunks()
+    ms = bucket.cast(pa.int64()).to_numpy(zero_copy_only=False)
+    return pa.array(ms - ms % width).cast(BUCKET_TYPE)
+
+
+def _sumBy(table: pa.Table, measures) -> pa.Table:
+    sums = table.group_by(KEYS).aggregate([(name, 'sum')
+                                           for name in measures])
+    return pa.Table.from_arrays(
+        [sums.column(key) for key in KEYS] +
+        [sums.column(f'{name}_sum') for name in measures],
+        names=KEYS + list(measures))
+
+
+class Rollup:
+    """
+    Per (channelId, videoId, minute) sums of one kind of event, fed batch
+    by batch and rolled up to hours and days when written.
+    """
+
+    def __init__(self, kind: str):
+        extra, self.measure = KINDS[kind]
+        self.kind = kind
+        self.columns = ['timestamp', 'channelId', 'videoId'] + extra
+        self.measures = None
+        self.parts = []
+        self.rows = 0
+
+    def update(self, batch):
+        present = pc.and_(pc.is_valid(batch.column('timestamp')),
+                          pc.is_valid(batch.column('channelId')))
+        batch = batch.filter(present)
+        if batch.num_rows == 0:
+            return
+
+        measures = self.measure(batch)
+        self.measures = list(measures)
+        table = pa.table({
+            'channelId':
+            batch.column('channelId'),
+            'videoId':
+            batch.column('videoId'),
+            'bucket':
+            _floor(batch.column('timestamp').cast(BUCKET_TYPE, safe=False),
+                   RESOLUTIONS['minute']),
+            **measures,
+        })
+        part = _sumBy(table, self.measures)
+        self.parts.append(part)
+        self.rows += part.num_rows
+        if self.rows > COMPACT_ROWS and len(self.parts) > 1:
+            self.parts = [_sumBy(pa.concat_tables(self.parts), self.measures)]
+            self.rows = self.parts[0].num_rows
+
+    def tables(self) -> dict:
+        """{resolution: sorted table}"""
+        if not self.parts:
+            return {}
+        table = _sumBy(pa.concat_tables(self.parts), self.measures)
+        tables = {}
+        for resolution, width in RESOLUTIONS.items():
+            # each resolution is a multiple of the previous one
+            if width != RESOLUTIONS['minute']:
+                table = _sumBy(
+                    table.set_column(KEYS.index('bucket'), 'bucket',
+                                     _floor(table.column('bucket'), width)),
+                    self.measures)
+            tables[resolution] = table.sort_by([(key, 'ascending')
+                                                for key in KEYS])
+        return tables
+
+
+def rollupPath(directory: str, resolution: str, src: str) -> str:
+    return join(directory, ROLLUP_DIR, resolution, basename(src))
+
+
+def hasRollup(directory: str, src: str) -> bool:
+    """
+    every resolution of `src` was written; the rollup is rebuilt along with
+    the reduced file, so whether it is current is up to the manifest
+    """
+    return all(exists(rollupPath(directory, r, src)) for r in RESOLUTIONS)
+
+
+def writeRollup(directory: str, src: str, rollup: Rollup):
+    tables = rollup.tables()
+    for resolution in RESOLUTIONS:
+        path = rollupPath(directory, resolution, src)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = tables.get(resolution)
+        if table is None:
+            table = pa.table({
+                'channelId': pa.array([], pa.string()),
+                'videoId': pa.array([], pa.string()),
+                'bucket': pa.array([], BUCKET_TYPE),
+            })
+        pq.write_table(table,
+                       path + '.tmp',
+                       compression='zstd',
+                       use_dictionary=['channelId', 'videoId'])
+        os.replace(path + '.tmp', path)
+
+
+def _utc(t) -> pd.Timestamp:
+    t = pd.Timestamp(t)
+    return t.tz_localize('UTC') if t.tzinfo is None else t.tz_convert('UTC')
+
+
+def queryRollup(directory: str,
+                resolution: str = 'hour',
+                channelIds=None,
+                videoIds=None,
+                start=None,
+                end=None,
+                by=('channelId', 'bucket')) -> pd.DataFrame:
+    """
+    Every measure summed by `by` over buckets in [start, end), read from
+    the rollup cube instead of the chats. Measures a kind of event does not
+    carry come out as 0.
+    """
+    filters = []
+    if channelIds is not None:
+        filters.append(('channelId', 'in', list(channelIds)))
+    if videoIds is not None:
+        filters.append(('videoId', 'in', list(videoIds)))
+    if start is not None:
+        filters.append(('bucket', '>=', _utc(start)))
+    if end is not None:
+        filters.append(('bucket', '<', _utc(end)))
+
+    frames = []
+    for path in sorted(iglob(join(directory, ROLLUP_DIR, resolution,
+                                  '*.parquet'))):
+        table = pq.read_table(path, filters=filters or None)
+        if table.num_rows:
+            frames.append(table.to_pandas())
+    if not frames:
+        return pd.DataFrame(columns=list(by) + MEASURES)
+
+    df = pd.concat(frames, ignore_index=True).reindex(columns=KEYS + MEASURES)
+    df[MEASURES] = df[MEASURES].fillna(0).astype('int64')
+    return df.groupby(list(by), observed=True,
+                      dropna=False)[MEASURES].sum().reset_index()
@@ -0,0 +1,64 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# resident size of an idle worker with pandas and pyarrow imported
+WORKER_OVERHEAD = 256 * 1024 * 1024
+
+# share of physical memory jobs may claim when no budget is given
+MEMORY_FRACTION = 0.8
+
+
+def physicalMemory() -> int:
+    return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def runJobs(jobs,
+            workers: int = 1,
+            memory: int = None,
+            initializer=None,
+            initargs=()):
+    """
+    Run `jobs`, a list of (key, estimate, fn, args), and return
+    {key: fn(*args)}.
+
+    With more than one worker, jobs go to a process pool largest first.
+    The next job admitted is the largest pending one whose estimated bytes
+    still fit in `memory` next to the running jobs. A job that fits nowhere
+    runs once the pool is otherwise idle.
+    """
+    if workers <= 1:
+        return {key: fn(*args) for key, _, fn, args in jobs}
+
+    if memory is None:
+        memory = int(physicalMemory() * MEMORY_FRACTION)
+
+    pending = sorted(jobs, key=lambda job: job[1], reverse=True)
+    running = {}
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=initializer,
+                             initargs=initargs) as executor:
+        while pending or running:
+            used = sum(estimate for _, estimate in running.values())
+            while pending and len(running) < workers:
+                fits = [
+                    job for job in pending
+                    if used + job[1] + WORKER_OVERHEAD <= memory
+                ]
+                if not fits and running:
+                    break
+                job = fits[0] if fits else pending[0]
+                pending.remove(job)
+
+                key, estimate, fn, args = job
+                estimate += WORKER_OVERHEAD
+                running[executor.submit(fn, *args)] = (key, estimate)
+                used += estimate
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, _ = running.pop(future)
+                results[key] = future.result()
+
+    return results
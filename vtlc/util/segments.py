@@ -0,0 +1,70 @@
+import os
+import time
+from glob import iglob
+from os.path import exists, join
+
+import pyarrow as pa
+
+from vtlc.util.parquet import ParquetBatchWriter
+
+SEGMENT_DIR = '.segments'
+
+
+class SegmentWriter:
+    """
+    Buffers converted tables per period and rolls them into time-bounded
+    segment files under `directory/.segments/{prefix}_{period}/`.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 prefix: str,
+                 schema: pa.Schema,
+                 segmentSeconds: float = 60,
+                 profile=None):
+        self.root = join(directory, SEGMENT_DIR)
+        self.prefix = prefix
+        self.schema = schema
+        self.segmentSeconds = segmentSeconds
+        self.profile = profile
+
+        self.pending = {}
+        self.openedAt = time.monotonic()
+
+    def periodDir(self, period: str) -> str:
+        return join(self.root, f'{self.prefix}_{period}')
+
+    def append(self, period: str, table: pa.Table):
+        self.pending.setdefault(period, []).append(table)
+
+    def due(self) -> bool:
+        return time.monotonic() - self.openedAt >= self.segmentSeconds
+
+    def roll(self):
+        """write every buffered period out as a new segment"""
+        for period, tables in self.pending.items():
+            os.makedirs(self.periodDir(period), exist_ok=True)
+
+            # millisecond wall clock keeps segments in arrival order
+            stamp = time.time_ns() // 1_000_000
+            path = join(self.periodDir(period), f'{stamp:013d}.parquet')
+            while exists(path):
+                stamp += 1
+                path = join(self.periodDir(period), f'{stamp:013d}.parquet')
+            writer = ParquetBatchWriter(path + '.tmp', self.schema,
+                                        self.profile)
+            for table in tables:
+                writer.write_table(table)
+            writer.close()
+            os.replace(path + '.tmp', path)
+
+        self.pending = {}
+        self.openedAt = time.monotonic()
+
+    def segmentFiles(self, period: str):
+        return sorted(iglob(join(self.periodDir(period), '*.parquet')))
+
+    def removePeriod(self, period: str):
+        for f in iglob(join(self.periodDir(period), '*')):
+            os.remove(f)
+        os.rmdir(self.periodDir(period))
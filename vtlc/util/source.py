@@ -0,0 +1,361 @@
+import gzip
+import json
+import mmap
+import os
+import struct
+from datetime import timezone
+from os.path import exists, getmtime, getsize, join
+
+from bson.codec_options import CodecOptions
+from bson.objectid import ObjectId
+
+CODEC_OPTIONS = CodecOptions(tz_aware=True)
+
+# documents per block in the sparse timestamp index of a dump
+INDEX_BLOCK = 4096
+
+_INT32 = struct.Struct('<i')
+_INT64 = struct.Struct('<q')
+
+# sizes of fixed-width BSON element types
+_FIXED_SIZES = {
+    0x01: 8,  # double
+    0x06: 0,  # undefined
+    0x07: 12,  # ObjectId
+    0x08: 1,  # bool
+    0x09: 8,  # datetime
+    0x0A: 0,  # null
+    0x10: 4,  # int32
+    0x11: 8,  # timestamp
+    0x12: 8,  # int64
+    0x13: 16,  # decimal128
+    0x7F: 0,  # max key
+    0xFF: 0,  # min key
+}
+
+
+class MongoSource:
+
+    def __init__(self, uri: str, database: str = 'vespa'):
+        # imported lazily so offline runs do not need a driver connection
+        import pymongo
+
+        self.client = pymongo.MongoClient(uri)
+        self.db = self.client[database]
+
+    def collection(self, name: str):
+        return self.db.get_collection(name, codec_options=CODEC_OPTIONS)
+
+    def close(self):
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DumpSource:
+    """
+    Reads `mongodump` output, i.e. a directory of `<collection>.bson` or
+    `<collection>.bson.gz` files.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # one reader per collection, so its mapping and index are shared
+        self.collections = {}
+
+    def collection(self, name: str):
+        if name in self.collections:
+            return self.collections[name]
+        for filename in (f'{name}.bson', f'{name}.bson.gz'):
+            path = join(self.directory, filename)
+            if exists(path):
+                self.collections[name] = DumpCollection(path)
+                return self.collections[name]
+        raise FileNotFoundError(f'no dump for {name} in {self.directory}')
+
+    def close(self):
+        for collection in self.collections.values():
+            collection.close()
+        self.collections = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def openSource(uri: str):
+    """`mongodb://` / `mongodb+srv://` URIs or a mongodump directory"""
+    if uri.startswith('mongodb://') or uri.startswith('mongodb+srv://'):
+        return MongoSource(uri)
+    if uri.startswith('dump://'):
+        uri = uri[len('dump://'):]
+    return DumpSource(uri)
+
+
+def scanFields(data, offset: int):
+    """
+    Walk the top-level elements of the document at `offset` and return
+    its (timestamp in ms or None, _id).
+    """
+    end = offset + _INT32.unpack_from(data, offset)[0] - 1
+    pos = offset + 4
+    timestamp = None
+    _id = None
+    found = 0
+
+    while pos < end and found < 2:
+        kind = data[pos]
+        keyEnd = data.find(b'\x00', pos + 1)
+        key = data[pos + 1:keyEnd]
+        pos = keyEnd + 1
+
+        if key == b'timestamp' and kind == 0x09:
+            timestamp = _INT64.unpack_from(data, pos)[0]
+            found += 1
+        elif key == b'_id':
+            if kind == 0x07:
+                _id = ObjectId(bytes(data[pos:pos + 12]))
+            elif kind == 0x10:
+                _id = _INT32.unpack_from(data, pos)[0]
+            elif kind == 0x12:
+                _id = _INT64.unpack_from(data, pos)[0]
+            elif kind == 0x02:
+                length = _INT32.unpack_from(data, pos)[0]
+                _id = bytes(data[pos + 4:pos + 3 + length]).decode()
+            found += 1
+
+        if kind in _FIXED_SIZES:
+            pos += _FIXED_SIZES[kind]
+        elif kind in (0x02, 0x0D, 0x0E):  # string, code, symbol
+            pos += 4 + _INT32.unpack_from(data, pos)[0]
+        elif kind in (0x03, 0x04, 0x0F):  # document, array, code w/ scope
+            pos += _INT32.unpack_from(data, pos)[0]
+        elif kind == 0x05:  # binary
+            pos += 5 + _INT32.unpack_from(data, pos)[0]
+        elif kind == 0x0B:  # regex: two cstrings
+            pos = data.find(b'\x00', data.find(b'\x00', pos) + 1) + 1
+        elif kind == 0x0C:  # DBPointer
+            pos += 4 + _INT32.unpack_from(data, pos)[0] + 12
+        else:
+            raise ValueError(f'unknown BSON type 0x{kind:02x}')
+
+    return timestamp, _id
+
+
+def _ms(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def compileQuery(query):
+    """
+    Turn the subset of MongoDB queries the exporter issues into
+    (predicate, lower, upper) where lower/upper bound the matching
+    timestamps in ms for index pruning (None when unbounded).
+    """
+    if not query:
+        return (lambda ts, _id: True), None, None
+
+    if '$or' in query:
+        branches = [compileQuery(sub) for sub in query['$or']]
+        lowers = [lower for _, lower, _ in branches]
+        uppers = [upper for _, _, upper in branches]
+        return ((lambda ts, _id: any(p(ts, _id) for p, _, _ in branches)),
+                None if None in lowers else min(lowers),
+                None if None in uppers else max(uppers))
+
+    unsupported = set(query) - {'timestamp', '_id'}
+    if unsupported:
+        raise NotImplementedError(f'unsupported query fields: {unsupported}')
+
+    cond = query.get('timestamp', {})
+    if cond is None:
+        return (lambda ts, _id: ts is None), None, None
+
+    if not isinstance(cond, dict):
+        # equality, optionally paired with an _id lower bound
+        at = _ms(cond)
+        idAfter = query.get('_id', {}).get('$gt')
+        return ((lambda ts, _id: ts == at and
+                 (idAfter is None or _id > idAfter)), at, at)
+
+    gte, gt, lt = _ms(cond.get('$gte')), _ms(cond.get('$gt')), _ms(
+        cond.get('$lt'))
+
+    def predicate(ts, _id):
+        return ts is not None and (gte is None or ts >= gte) and (
+            gt is None or ts > gt) and (lt is None or ts < lt)
+
+    lower = gte if gte is not None else (gt + 1 if gt is not None else None)
+    upper = lt - 1 if lt is not None else None
+    return predicate, lower, upper
+
+
+class DumpCollection:
+    """
+    Collection-like reader over a single mongodump `.bson[.gz]` file.
+    Plain files are memory-mapped and pruned through a sparse per-block
+    timestamp index; gzip files are scanned sequentially, so their counts
+    are cached per query.
+    """
+
+    codec_options = CODEC_OPTIONS
+
+    def __init__(self, path: str):
+        self.path = path
+        self.gzipped = path.endswith('.gz')
+        self._index = None
+        self._data = None
+        self._counts = {}
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # document iteration
+
+    def _iterRegion(self, data, start, end):
+        pos = start
+        while pos < end:
+            size = _INT32.unpack_from(data, pos)[0]
+            yield pos, size
+            pos += size
+
+    def _iterGzip(self):
+        with gzip.open(self.path, 'rb') as f:
+            while True:
+                head = f.read(4)
+                if len(head) < 4:
+                    return
+                size = _INT32.unpack(head)[0]
+                yield head + f.read(size - 4)
+
+    def _mapped(self):
+        if self._data is not None:
+            return self._data
+        with open(self.path, 'rb') as f:
+            if getsize(self.path) == 0:
+                self._data = b''
+            else:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data
+
+    # sparse index: [offset, end, count, minTs, maxTs, undated] per block
+
+    def _indexPath(self):
+        return self.path + '.vtlcidx'
+
+    def _stamp(self):
+        return [getsize(self.path), getmtime(self.path)]
+
+    def index(self):
+        if self._index is not None:
+            return self._index
+
+        stamp = self._stamp()
+        if exists(self._indexPath()):
+            with open(self._indexPath(), 'r') as f:
+                saved = json.load(f)
+            if saved['stamp'] == stamp:
+                self._index = saved['blocks']
+                return self._index
+
+        data = self._mapped()
+        blocks = []
+        block = None
+        for pos, size in self._iterRegion(data, 0, len(data)):
+            if block is None or block[2] >= INDEX_BLOCK:
+                block = [pos, pos, 0, None, None, 0]
+                blocks.append(block)
+            ts, _ = scanFields(data, pos)
+            block[1] = pos + size
+            block[2] += 1
+            if ts is None:
+                block[5] += 1
+            else:
+                block[3] = ts if block[3] is None else min(block[3], ts)
+                block[4] = ts if block[4] is None else max(block[4], ts)
+
+        try:
+            with open(self._indexPath() + '.tmp', 'w') as f:
+                json.dump({'stamp': stamp, 'blocks': blocks}, f)
+            os.replace(self._indexPath() + '.tmp', self._indexPath())
+        except OSError:
+            # read-only dump directories still work, just unindexed
+            pass
+
+        self._index = blocks
+        return blocks
+
+    def _candidates(self, lower, upper, wantsUndated):
+        for offset, end, count, minTs, maxTs, undated in self.index():
+            if wantsUndated and undated:
+                yield offset, end
+            elif minTs is None:
+                continue
+            elif (lower is None or maxTs >= lower) and (upper is None
+                                                        or minTs <= upper):
+                yield offset, end
+
+    def _matching(self, query):
+        """yield raw bytes of every matching document"""
+        predicate, lower, upper = compileQuery(query)
+
+        if self.gzipped:
+            for raw in self._iterGzip():
+                if predicate(*scanFields(raw, 0)):
+                    yield raw
+            return
+
+        data = self._mapped()
+        wantsUndated = predicate(None, None)
+        for start, end in self._candidates(lower, upper, wantsUndated):
+            for pos, size in self._iterRegion(data, start, end):
+                if predicate(*scanFields(data, pos)):
+                    yield data[pos:pos + size]
+
+    # pymongo Collection subset used by vtlc.aggregate
+
+    def find_raw_batches(self, query=None, projection=None, batch_size=1000):
+        """
+        Raw BSON batches like Collection.find_raw_batches.
+        Documents are returned whole; converters ignore extra fields.
+        """
+        batch = []
+        for raw in self._matching(query):
+            batch.append(raw)
+            if len(batch) >= batch_size:
+                yield b''.join(batch)
+                batch = []
+        if batch:
+            yield b''.join(batch)
+
+    def count_documents(self, query):
+        if not self.gzipped:
+            return sum(1 for _ in self._matching(query))
+
+        key = repr((self._stamp(), query))
+        if key not in self._counts:
+            self._counts[key] = sum(1 for _ in self._matching(query))
+        return self._counts[key]
+
+    def estimated_document_count(self):
+        if self.gzipped:
+            return self.count_documents({})
+        return sum(block[2] for block in self.index())
@@ -0,0 +1,345 @@
+import os
+from os.path import basename, exists, join, splitext
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from vtlc.util.checkpoint import readJSON, writeJSON
+from vtlc.util.currency import convertColumnToJPY
+from vtlc.util.hll import SketchSet
+from vtlc.util.manifest import recordedChecksum
+
+STATS_DIR = '.stats'
+
+# bump whenever the per-month stats change meaning, to invalidate caches
+STATS_VERSION = 3
+
+# re-deduplicate accumulated (channelId, author) pairs past this many rows
+COMPACT_ROWS = 5_000_000
+
+
+def fileFingerprint(path: str, directory: str) -> dict:
+    """size and row count, plus the checksum if recorded, else the mtime"""
+    fingerprint = {
+        'size': os.path.getsize(path),
+        'rows': pq.read_metadata(path).num_rows,
+        'version': STATS_VERSION,
+    }
+    checksum = recordedChecksum(path, directory)
+    if checksum is not None:
+        fingerprint['checksum'] = checksum
+    else:
+        fingerprint['mtime'] = os.stat(path).st_mtime_ns
+    return fingerprint
+
+
+def _cachePaths(directory: str, src: str):
+    base = join(directory, STATS_DIR, splitext(basename(src))[0])
+    return base + '.parquet', base + '.json'
+
+
+def loadCachedStats(directory: str, src: str):
+    """per-month stats of `src` cached under `directory`, if still valid"""
+    table, meta = _cachePaths(directory, src)
+    saved = readJSON(meta)
+    if saved is None or not exists(table):
+        return None
+    if saved['fingerprint'] != fileFingerprint(src, directory):
+        return None
+    return pd.read_parquet(table)
+
+
+def saveCachedStats(directory: str, src: str, stat: pd.DataFrame):
+    table, meta = _cachePaths(directory, src)
+    os.makedirs(os.path.dirname(table), exist_ok=True)
+
+    stat.to_parquet(table + '.tmp', index=False)
+    os.replace(table + '.tmp', table)
+    # the fingerprint goes last and marks the entry as complete
+    writeJSON(meta, {'fingerprint': fileFingerprint(src, directory)})
+
+
+def isMemberChat(membership) -> pa.Array:
+    """
+    membership is neither non-member nor unknown; as with the pandas
+    comparison, a missing membership counts as a member
+    """
+    return pc.fill_null(
+        pc.and_(pc.not_equal(membership, 'non-member'),
+                pc.not_equal(membership, 'unknown')), True)
+
+
+def _authorTable(batch, columns) -> pa.Table:
+    """
+    `columns` of the rows of `batch` that have a channelId, plus an
+    `author` column to count distinct authors on: the int32 authorKey
+    when the batch carries one
+    """
+    if isinstance(batch, pa.RecordBatch):
+        batch = pa.Table.from_batches([batch])
+    author = batch.column('authorKey' if 'authorKey' in
+                          batch.schema.names else 'authorChannelId')
+    table = batch.select(columns).append_column('author', author)
+    return table.filter(pc.is_valid(table.column('channelId')))
+
+
+def _groupCounts(table: pa.Table, keys) -> pa.Table:
+    """rows per distinct `keys`, as keys + n"""
+    counts = table.group_by(keys).aggregate([(keys[0], 'count')])
+    return pa.Table.from_arrays(
+        [counts.column(key) for key in keys] +
+        [counts.column(f'{keys[0]}_count')],
+        names=keys + ['n'])
+
+
+def _distinct(table: pa.Table) -> pa.Table:
+    """
+    rows distinct by (channelId, author), with the authorChannelId of each
+    for the sketches
+    """
+    keys = ['channelId', 'author', 'authorChannelId']
+    return _groupCounts(table, keys).select(keys)
+
+
+class DistinctPairs:
+    """distinct (channelId, author) pairs gathered across batches"""
+
+    def __init__(self):
+        self.parts = []
+        self.rows = 0
+
+    def update(self, distinct: pa.Table):
+        part = distinct.select(['channelId', 'author'])
+        self.parts.append(part)
+        self.rows += part.num_rows
+        if self.rows > COMPACT_ROWS and len(self.parts) > 1:
+            self.parts = [
+                _groupCounts(pa.concat_tables(self.parts),
+                             ['channelId', 'author']).drop(['n'])
+            ]
+            self.rows = self.parts[0].num_rows
+
+    def nunique(self) -> pd.Series:
+        """like groupby('channelId')['author'].nunique(), unordered"""
+        if not self.parts:
+            return pd.Series(dtype='int64')
+        counts = pa.concat_tables(self.parts).group_by('channelId').aggregate(
+            [('author', 'count_distinct')])
+        return pd.Series(counts.column('author_count_distinct').to_numpy(),
+                         index=counts.column('channelId').to_pylist())
+
+
+def _emptyStats(dtypes: dict) -> pd.DataFrame:
+    """
+    stats of a month without rows; typed, so that concatenating it keeps
+    the numeric columns of the other months numeric
+    """
+    return pd.DataFrame(
+        {name: pd.Series(dtype=dtype)
+         for name, dtype in dtypes.items()})
+
+
+def _sumGroups(parts) -> pd.DataFrame:
+    """per-channel sums of the partial aggregates in `parts`"""
+    table = pa.concat_tables(parts)
+    columns = [name for name in table.column_names if name != 'channelId']
+    sums = table.group_by('channelId').aggregate([(name, 'sum')
+                                                  for name in columns])
+    return pd.DataFrame(
+        {name: sums.column(f'{name}_sum').to_numpy()
+         for name in columns},
+        index=sums.column('channelId').to_pylist())
+
+
+def _valueCounts(table: pa.Table, column: str) -> pa.Table:
+    table = table.filter(pc.is_valid(table.column(column)))
+    return _groupCounts(table, ['channelId', column]).rename_columns(
+        ['channelId', 'value', 'n'])
+
+
+def _mode(counts) -> pd.Series:
+    """most frequent value per channel, ties going to the smallest value"""
+    counts = pa.concat_tables(counts).group_by(['channelId', 'value'
+                                                ]).aggregate([('n', 'sum')])
+    counts = counts.sort_by([('channelId', 'ascending'),
+                             ('n_sum', 'descending'), ('value', 'ascending')])
+    channelIds = counts.column('channelId').combine_chunks()
+    first = np.ones(len(channelIds), dtype=bool)
+    first[1:] = pc.not_equal(channelIds[1:], channelIds[:-1]).to_numpy(
+        zero_copy_only=False)
+    top = counts.filter(pa.array(first))
+    return pd.Series(top.column('value').to_pylist(),
+                     index=top.column('channelId').to_pylist())
+
+
+class ChatStats:
+    """
+    Per-channel chat counts on Arrow group-by kernels: feed record batches
+    of authorChannelId, channelId and membership (and optionally
+    authorKey), then collect the per-channel frame.
+    """
+
+    columns = ['authorChannelId', 'channelId', 'membership']
+
+    def __init__(self):
+        self.chats = []
+        self.memberChats = []
+        self.chatters = DistinctPairs()
+        self.members = DistinctPairs()
+        self.sketches = {
+            'uniqueChatters': SketchSet(),
+            'uniqueMembers': SketchSet(),
+        }
+
+    def update(self, batch):
+        table = _authorTable(batch, self.columns)
+        if table.num_rows == 0:
+            return
+        self.chats.append(_groupCounts(table, ['channelId']))
+        distinct = _distinct(table)
+        self.chatters.update(distinct)
+        self.sketches['uniqueChatters'].update(
+            distinct.column('channelId'), distinct.column('authorChannelId'))
+
+        mchats = table.filter(isMemberChat(table.column('membership')))
+        if mchats.num_rows == 0:
+            return
+        self.memberChats.append(_groupCounts(mchats, ['channelId']))
+        distinct = _distinct(mchats)
+        self.members.update(distinct)
+        self.sketches['uniqueMembers'].update(
+            distinct.column('channelId'), distinct.column('authorChannelId'))
+
+    def result(self) -> pd.DataFrame:
+        if not self.chats:
+            return _emptyStats({
+                'channelId': 'object',
+                'chats': 'int64',
+                'uniqueChatters': 'int64',
+                'memberChats': 'int64',
+                'uniqueMembers': 'int64',
+            })
+
+        chats = _sumGroups(self.chats)['n'].sort_index()
+        stat = pd.DataFrame({
+            'chats':
+            chats,
+            'uniqueChatters':
+            self.chatters.nunique().reindex(chats.index, fill_value=0),
+        })
+        stat.index.name = 'channelId'
+        stat.reset_index(inplace=True)
+
+        memberChats = _sumGroups(self.memberChats)['n'].sort_index() if (
+            self.memberChats) else pd.Series(dtype='int64')
+        mstat = pd.DataFrame({
+            'memberChats':
+            memberChats,
+            'uniqueMembers':
+            self.members.nunique().reindex(memberChats.index, fill_value=0),
+        })
+        mstat.index.name = 'channelId'
+        mstat.reset_index(inplace=True)
+
+        return pd.merge(stat, mstat, on='channelId', how='left')
+
+
+class SuperChatStats:
+    """
+    Per-channel super chat totals on Arrow group-by kernels: channels keep
+    the order in which they first appear.
+    """
+
+    columns = [
+        'amount', 'currency', 'authorChannelId', 'channelId', 'color', 'body'
+    ]
+
+    def __init__(self):
+        self.order = {}
+        self.sums = []
+        self.supers = DistinctPairs()
+        self.currencies = []
+        self.colors = []
+        self.sketches = {'uniqueSuperChatters': SketchSet()}
+
+    def update(self, batch):
+        table = _authorTable(batch, self.columns)
+        if table.num_rows == 0:
+            return
+        for channelId in pc.unique(table.column('channelId')).to_pylist():
+            self.order.setdefault(channelId, len(self.order))
+
+        amountJPY = pa.array(
+            convertColumnToJPY(table.column('amount'),
+                               table.column('currency')))
+        sums = pa.table({
+            'channelId': table.column('channelId'),
+            'amountJPY': amountJPY,
+            'bodyLength': pc.utf8_length(table.column('body')),
+        }).group_by('channelId').aggregate([
+            ('channelId', 'count'),
+            ('amountJPY', 'sum'),
+            ('amountJPY', 'count'),
+            ('bodyLength', 'sum'),
+            ('bodyLength', 'count'),
+        ])
+        self.sums.append(
+            pa.Table.from_arrays([
+                sums.column(name) for name in [
+                    'channelId', 'channelId_count', 'amountJPY_sum',
+                    'amountJPY_count', 'bodyLength_sum', 'bodyLength_count'
+                ]
+            ],
+                                 names=[
+                                     'channelId', 'superChats', 'totalSC',
+                                     'countSC', 'totalMessageLength',
+                                     'countMessageLength'
+                                 ]))
+
+        distinct = _distinct(table)
+        self.supers.update(distinct)
+        self.sketches['uniqueSuperChatters'].update(
+            distinct.column('channelId'), distinct.column('authorChannelId'))
+
+        self.currencies.append(_valueCounts(table, 'currency'))
+        self.colors.append(_valueCounts(table, 'color'))
+
+    def result(self) -> pd.DataFrame:
+        if not self.sums:
+            return _emptyStats({
+                'channelId': 'object',
+                'superChats': 'int64',
+                'uniqueSuperChatters': 'int64',
+                'totalSC': 'float64',
+                'averageSC': 'float64',
+                'mostFrequentCurrency': 'object',
+                'mostFrequentColor': 'object',
+                'totalMessageLength': 'int64',
+                'averageMessageLength': 'float64',
+            })
+
+        sums = _sumGroups(self.sums).reindex(list(self.order))
+        stat = pd.DataFrame({
+            'superChats':
+            sums['superChats'],
+            'uniqueSuperChatters':
+            self.supers.nunique().reindex(sums.index, fill_value=0),
+            'totalSC':
+            sums['totalSC'],
+            'averageSC':
+            sums['totalSC'] / sums['countSC'],
+            'mostFrequentCurrency':
+            _mode(self.currencies).reindex(sums.index),
+            'mostFrequentColor':
+            _mode(self.colors).reindex(sums.index),
+            'totalMessageLength':
+            sums['totalMessageLength'],
+            'averageMessageLength':
+            sums['totalMessageLength'] / sums['countMessageLength'],
+        })
+        stat.index.name = 'channelId'
+        stat.reset_index(inplace=True)
+        return stat
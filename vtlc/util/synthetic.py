@@ -0,0 +1,400 @@
+import argparse
+import os
+import struct
+from datetime import datetime, timezone
+from os.path import join
+
+import bson
+import numpy as np
+from bson.objectid import ObjectId
+
+from vtlc.util.source import openSource
+from vtlc.util.superchat import superchatSignificance
+
+# documents generated, encoded and written at a time
+CHUNK_DOCS = 50_000
+
+ID_ALPHABET = np.frombuffer(
+    b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_',
+    dtype='S1')
+
+# Zipf exponents: a few channels and regulars produce most of the chat
+CHANNEL_SKEW = 1.1
+AUTHOR_SKEW = 0.9
+VIDEO_SKEW = 1.5
+
+# membership tiers of chatters that have one; the rest carry no field
+MEMBERSHIP_TIERS = [
+    'new', '1 month', '2 months', '6 months', '1 year', '2 years'
+]
+MEMBERSHIP_WEIGHTS = [0.2, 0.25, 0.2, 0.15, 0.12, 0.08]
+MEMBER_SHARE = 0.15
+
+WORDS = [
+    'lol', 'kawaii', '草', 'www', 'おつかれ', 'hello', 'GG', 'かわいい',
+    'nice', 'ありがとう', 'LETS GO', '888', 'ナイス', 'hi from Brazil', 'えらい'
+]
+
+# custom emoji as honeybee stores them, between U+FFF9 and U+FFFB
+EMOJI = [
+    '\ufff9_yay\ufffb', '\ufff9_heart\ufffb',
+    '\ufff9:face-blue-smiling:\ufffb', '\ufff9_kusa\ufffb', '😂', '👏'
+]
+
+# currency, share of super chats and rough JPY per unit
+CURRENCIES = [
+    ('JPY', 0.45, 1),
+    ('USD', 0.2, 110),
+    ('TWD', 0.06, 4),
+    ('KRW', 0.05, 0.09),
+    ('EUR', 0.04, 130),
+    ('PHP', 0.03, 2.2),
+    ('HKD', 0.03, 14),
+    ('CAD', 0.025, 88),
+    ('AUD', 0.02, 82),
+    ('GBP', 0.02, 150),
+    ('SGD', 0.015, 82),
+    ('BRL', 0.015, 22),
+    ('MXN', 0.01, 5.5),
+    ('INR', 0.01, 1.45),
+]
+
+# JPY amounts people pick, with the colour YouTube gives them
+SUPERCHAT_TIERS = [
+    (100, 'blue', 0.12),
+    (200, 'lightblue', 0.1),
+    (500, 'green', 0.18),
+    (1000, 'yellow', 0.22),
+    (2000, 'orange', 0.12),
+    (5000, 'magenta', 0.1),
+    (10000, 'red', 0.12),
+    (50000, 'red', 0.04),
+]
+
+# collection names of the four kinds, as in the vespa database
+COLLECTIONS = ['chats', 'superchats', 'banactions', 'deleteactions']
+
+
+def _normalized(weights) -> np.ndarray:
+    weights = np.asarray(weights, dtype=np.float64)
+    return weights / weights.sum()
+
+
+def zipfWeights(n: int, skew: float) -> np.ndarray:
+    """probability of each of `n` ranks under a Zipf law"""
+    return _normalized(1 / np.arange(1, n + 1)**skew)
+
+
+def randomIds(rng, n: int, length: int, prefix: str = '') -> list:
+    """`n` random YouTube-like ids of `length` characters"""
+    codes = ID_ALPHABET[rng.integers(0, len(ID_ALPHABET), (n, length))]
+    return [prefix + s.decode() for s in codes.view(f'S{length}').ravel()]
+
+
+class Universe:
+    """
+    Channels, their videos and the chatters of a synthetic dataset. Ranks
+    are drawn from Zipf laws, so volume is as lopsided as the real one.
+    """
+
+    def __init__(self,
+                 rng,
+                 channels: int = 200,
+                 authors: int = 100_000,
+                 videosPerChannel: int = 20):
+        self.channelIds = randomIds(rng, channels, 22, 'UC')
+        self.videoIds = np.array(randomIds(rng, channels * videosPerChannel,
+                                           11),
+                                 dtype=object).reshape(channels, -1)
+        self.authorIds = np.array(randomIds(rng, authors, 22, 'UC'),
+                                  dtype=object)
+        self.authorNames = np.array(
+            [f'{name} {i}' for i, name in enumerate(
+                rng.choice(['Kiara', 'Tako', 'Nanashi', 'Ina', 'Hoshi'],
+                           authors))],
+            dtype=object)
+        self.channelWeights = zipfWeights(channels, CHANNEL_SKEW)
+        self.authorWeights = zipfWeights(authors, AUTHOR_SKEW)
+        self.videoWeights = zipfWeights(videosPerChannel, VIDEO_SKEW)
+        self.membership = np.where(
+            rng.random(authors) < MEMBER_SHARE,
+            rng.choice(len(MEMBERSHIP_TIERS),
+                       authors,
+                       p=_normalized(MEMBERSHIP_WEIGHTS)), -1)
+
+    def draw(self, rng, n: int):
+        """(channel, video, author) indices of `n` messages"""
+        channels = rng.choice(len(self.channelIds), n, p=self.channelWeights)
+        videos = rng.choice(self.videoIds.shape[1], n, p=self.videoWeights)
+        authors = rng.choice(len(self.authorIds), n, p=self.authorWeights)
+        return channels, videos, authors
+
+
+def _timestamps(rng, n: int, start: float, end: float) -> list:
+    ms = np.sort(rng.integers(int(start * 1000), int(end * 1000), n))
+    return [datetime.fromtimestamp(t / 1000, timezone.utc) for t in ms]
+
+
+def _objectIds(timestamps, counter: int) -> list:
+    # deterministic, unique and ordered like the server's own
+    return [
+        ObjectId(struct.pack('>IQ', int(ts.timestamp()), counter + i))
+        for i, ts in enumerate(timestamps)
+    ]
+
+
+def _messages(rng, n: int) -> list:
+    words = rng.choice(WORDS, (n, 3))
+    emoji = rng.choice(EMOJI, n)
+    lengths = rng.integers(1, 4, n)
+    shape = rng.random(n)
+    messages = []
+    for i in range(n):
+        text = ' '.join(words[i, :lengths[i]])
+        if shape[i] < 0.25:
+            text += ' ' + emoji[i]
+        elif shape[i] < 0.3:
+            text = emoji[i] * int(lengths[i])
+        messages.append(text)
+    return messages
+
+
+def chatDocs(rng, universe: Universe, n: int, start: float, end: float,
+             counter: int = 0) -> list:
+    """`n` chats documents between `start` and `end` (epoch seconds)"""
+    timestamps = _timestamps(rng, n, start, end)
+    channels, videos, authors = universe.draw(rng, n)
+    messages = _messages(rng, n)
+    ids = randomIds(rng, n, 40, 'Ch')
+    flags = rng.random((n, 4))
+
+    docs = []
+    for i, _id in enumerate(_objectIds(timestamps, counter)):
+        author = authors[i]
+        doc = {
+            '_id': _id,
+            'timestamp': timestamps[i],
+            'id': ids[i],
+            'authorName': universe.authorNames[author],
+            'authorChannelId': universe.authorIds[author],
+            'message': messages[i],
+            'isModerator': bool(flags[i, 0] < 0.01),
+            'isVerified': bool(flags[i, 1] < 0.001),
+            'isOwner': bool(flags[i, 2] < 0.0005),
+            'originVideoId': universe.videoIds[channels[i], videos[i]],
+            'originChannelId': universe.channelIds[channels[i]],
+        }
+        tier = universe.membership[author]
+        if tier >= 0:
+            doc['membership'] = MEMBERSHIP_TIERS[tier]
+        # the odd document lost its message or author name upstream
+        if flags[i, 3] < 0.001:
+            del doc['message']
+        elif flags[i, 3] < 0.002:
+            del doc['authorName']
+        docs.append(doc)
+    return docs
+
+
+def superChatDocs(rng, universe: Universe, n: int, start: float, end: float,
+                  counter: int = 0) -> list:
+    """`n` superchats documents in a realistic currency and tier mix"""
+    timestamps = _timestamps(rng, n, start, end)
+    channels, videos, authors = universe.draw(rng, n)
+    messages = _messages(rng, n)
+    ids = randomIds(rng, n, 40, 'Ch')
+    currencies = rng.choice(len(CURRENCIES),
+                            n,
+                            p=_normalized([c[1] for c in CURRENCIES]))
+    tiers = rng.choice(len(SUPERCHAT_TIERS),
+                       n,
+                       p=_normalized([t[2] for t in SUPERCHAT_TIERS]))
+    silent = rng.random(n) < 0.2
+
+    docs = []
+    for i, _id in enumerate(_objectIds(timestamps, counter)):
+        currency, _, jpy = CURRENCIES[currencies[i]]
+        amount, color, _ = SUPERCHAT_TIERS[tiers[i]]
+        docs.append({
+            '_id': _id,
+            'timestamp': timestamps[i],
+            'id': ids[i],
+            'authorName': universe.authorNames[authors[i]],
+            'authorChannelId': universe.authorIds[authors[i]],
+            'message': '' if silent[i] else messages[i],
+            'purchaseAmount': float(round(amount / jpy, 0 if jpy < 1 else 2)),
+            'currency': currency,
+            'color': color,
+            'significance': superchatSignificance[color],
+            'originVideoId': universe.videoIds[channels[i], videos[i]],
+            'originChannelId': universe.channelIds[channels[i]],
+        })
+    return docs
+
+
+def banDocs(rng, chats: list, n: int, counter: int = 0) -> list:
+    """bans of `n` authors of `chats`, some of them from before timestamps"""
+    picked = sorted(rng.choice(len(chats), min(n, len(chats)),
+                               replace=False))
+    undated = rng.random(len(picked)) < 0.05
+    docs = []
+    for i, j in enumerate(picked):
+        chat = chats[j]
+        doc = {
+            '_id': _objectIds([chat['timestamp']], counter + i)[0],
+            'channelId': chat['authorChannelId'],
+            'originVideoId': chat['originVideoId'],
+            'originChannelId': chat['originChannelId'],
+        }
+        if not undated[i]:
+            doc['timestamp'] = chat['timestamp']
+        docs.append(doc)
+    return docs
+
+
+def deletionDocs(rng, chats: list, n: int, counter: int = 0) -> list:
+    """deletions of `n` of `chats`, a tenth of them retracted by the author"""
+    picked = sorted(rng.choice(len(chats), min(n, len(chats)),
+                               replace=False))
+    retracted = rng.random(len(picked)) < 0.1
+    docs = []
+    for i, j in enumerate(picked):
+        chat = chats[j]
+        docs.append({
+            '_id': _objectIds([chat['timestamp']], counter + i)[0],
+            'timestamp': chat['timestamp'],
+            'targetId': chat['id'],
+            'retracted': bool(retracted[i]),
+            'originVideoId': chat['originVideoId'],
+            'originChannelId': chat['originChannelId'],
+        })
+    return docs
+
+
+def _share(total: int, part: int, parts: int) -> int:
+    """the `part`-th of `parts` near-equal shares of `total`"""
+    return total * (part + 1) // parts - total * part // parts
+
+
+def generateDocs(chats: int,
+                 superchats: int = None,
+                 bans: int = None,
+                 deletions: int = None,
+                 start: datetime = datetime(2022, 1, 1, tzinfo=timezone.utc),
+                 end: datetime = datetime(2022, 3, 1, tzinfo=timezone.utc),
+                 seed: int = 0,
+                 **universe):
+    """
+    Yield {collection: documents} chunks in timestamp order. Super chats,
+    bans and deletions default to 1%, 0.05% and 0.2% of the chats.
+    """
+    rng = np.random.default_rng(seed)
+    world = Universe(rng, **universe)
+    counts = {
+        'chats': chats,
+        'superchats': chats // 100 if superchats is None else superchats,
+        'banactions': chats // 2000 if bans is None else bans,
+        'deleteactions': chats // 500 if deletions is None else deletions,
+    }
+    parts = max(1, -(-chats // CHUNK_DOCS))
+    span = (end.timestamp() - start.timestamp()) / parts
+    counters = dict.fromkeys(COLLECTIONS, 0)
+
+    for part in range(parts):
+        lo = start.timestamp() + part * span
+        n = {
+            kind: _share(total, part, parts)
+            for kind, total in counts.items()
+        }
+        chunk = {
+            'chats':
+            chatDocs(rng, world, n['chats'], lo, lo + span,
+                     counters['chats']),
+            'superchats':
+            superChatDocs(rng, world, n['superchats'], lo, lo + span,
+                          counters['superchats']),
+        }
+        chunk['banactions'] = banDocs(rng, chunk['chats'], n['banactions'],
+                                      counters['banactions'])
+        chunk['deleteactions'] = deletionDocs(rng, chunk['chats'],
+                                              n['deleteactions'],
+                                              counters['deleteactions'])
+        for kind, docs in chunk.items():
+            counters[kind] += len(docs)
+        yield chunk
+
+
+def writeDump(directory: str, chunks) -> dict:
+    """
+    Write generated chunks as a mongodump directory (`<collection>.bson`)
+    that `openSource` reads like the live database. Returns the counts.
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = {
+        kind: open(join(directory, f'{kind}.bson') + '.tmp', 'wb')
+        for kind in COLLECTIONS
+    }
+    counts = dict.fromkeys(COLLECTIONS, 0)
+    try:
+        for chunk in chunks:
+            for kind, docs in chunk.items():
+                files[kind].write(b''.join(bson.encode(doc) for doc in docs))
+                counts[kind] += len(docs)
+    finally:
+        for f in files.values():
+            f.close()
+    for kind in COLLECTIONS:
+        path = join(directory, f'{kind}.bson')
+        os.replace(path + '.tmp', path)
+        # a stale timestamp index would describe the old dump
+        if os.path.exists(path + '.vtlcidx'):
+            os.remove(path + '.vtlcidx')
+    return counts
+
+
+def loadMongo(uri: str, chunks) -> dict:
+    """insert generated chunks into the database at `uri`"""
+    source = openSource(uri)
+    counts = dict.fromkeys(COLLECTIONS, 0)
+    for chunk in chunks:
+        for kind, docs in chunk.items():
+            if docs:
+                source.collection(kind).insert_many(docs, ordered=False)
+            counts[kind] += len(docs)
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='generate synthetic live chat documents')
+    parser.add_argument('target',
+                        help='mongodump directory to write, or a '
+                        'mongodb:// URI to insert into')
+    parser.add_argument('-n', '--chats', type=int, default=1_000_000)
+    parser.add_argument('--superchats', type=int, default=None)
+    parser.add_argument('--bans', type=int, default=None)
+    parser.add_argument('--deletions', type=int, default=None)
+    parser.add_argument('--channels', type=int, default=200)
+    parser.add_argument('--authors', type=int, default=100_000)
+    parser.add_argument('--start', type=str, default='2022-01-01')
+    parser.add_argument('--end', type=str, default='2022-03-01')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = generateDocs(
+        args.chats,
+        superchats=args.superchats,
+        bans=args.bans,
+        deletions=args.deletions,
+        start=datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc),
+        end=datetime.fromisoformat(args.end).replace(tzinfo=timezone.utc),
+        seed=args.seed,
+        channels=args.channels,
+        authors=args.authors)
+    if args.target.startswith('mongodb://') or args.target.startswith(
+            'mongodb+srv://'):
+        counts = loadMongo(args.target, chunks)
+    else:
+        counts = writeDump(args.target, chunks)
+    for kind, count in counts.items():
+        print(f'>>> {kind}: {count} documents')